@@ -0,0 +1,171 @@
+# Per-user consent state.
+#
+# PrivacyPolicy objects are shared by every user served from a container, so
+# which sections a user has accepted is kept separately, in a ConsentState
+# for one version of one policy.  Accepted sections are stored as a bitset,
+# and are persisted in the user's attributes under "consent", keyed by
+# policy id:
+#
+# > "consent": {"policy": {"version": "2016-12-01", "accepted": "5",
+# >                         "hashes": ["adbc162b50ab734e", ...]}}
+#
+# where "accepted" is the bitset in hexadecimal (bit n set if section n has
+# been accepted) and "hashes" the content hash of each section of that
+# version (see policy_diff).  When the policy changes, the hashes tell which
+# sections are unchanged: their acceptance is carried forward to the new
+# version, and the changed and new sections are marked for review, in a
+# "review" bitset stored the same way as "accepted".
+#
+# ## Example Usage:
+#
+# > consent = ConsentState.from_attributes(persistent_attributes, "policy", policy)
+# > consent.accept_section(2)
+# > consent.save_to_attributes(persistent_attributes)
+
+from policy_diff import PolicyDiff
+
+
+class ConsentState:
+    """Represent which top-level sections of one version of a policy a user
+       has accepted."""
+
+    __slots__ = ("__policy_id", "__policy_version", "__section_count", "__accepted", "__review",
+                 "__section_hashes")
+
+    def __init__(self, policy_id, policy_version, section_count, accepted=0, review=0, section_hashes=None):
+        """Construct a consent state for the given policy id, version and
+           number of sections, with the given bitsets of accepted sections
+           and sections needing review, and the content hash of each
+           section."""
+        self.__policy_id = policy_id
+        self.__policy_version = policy_version
+        self.__section_count = section_count
+        self.__accepted = accepted & self.__all_sections_mask()
+        self.__review = review & self.__all_sections_mask()
+        self.__section_hashes = section_hashes
+
+    @classmethod
+    def from_attributes(cls, attributes, policy_id, policy):
+        """Return the consent state for the given policy stored in a user's
+           persistent attributes.  Consent stored for an older version of the
+           policy is carried forward to the sections that did not change.  A
+           state with no accepted sections is returned if no consent is
+           stored for the policy."""
+        section_count = len(policy.sections)
+        section_hashes = policy.fingerprint.section_hashes
+        record = attributes.get("consent", {}).get(policy_id)
+        if record is not None and record.get("version") == policy.date:
+            return cls(policy_id, policy.date, section_count, int(record.get("accepted", "0"), 16),
+                       int(record.get("review", "0"), 16), section_hashes)
+
+        if record is not None and record.get("hashes"):
+            diff = PolicyDiff(record["hashes"], section_hashes)
+            accepted = diff.carry_forward(int(record.get("accepted", "0"), 16))
+            review = sum(1 << num for num in diff.needs_review)
+            return cls(policy_id, policy.date, section_count, accepted, review, section_hashes)
+
+        # Attributes saved before consent was kept per policy hold a list of
+        # booleans for the default policy.
+        legacy_sections = attributes.get("acceptedSections")
+        if record is None and isinstance(legacy_sections, list) and len(legacy_sections) == len(policy.sections):
+            accepted = sum(1 << i for i, section_accepted in enumerate(legacy_sections) if section_accepted)
+            return cls(policy_id, policy.date, section_count, accepted, section_hashes=section_hashes)
+
+        return cls(policy_id, policy.date, section_count, section_hashes=section_hashes)
+
+    def save_to_attributes(self, attributes):
+        """Store this consent state in a user's persistent attributes."""
+        record = {
+            "version": self.__policy_version,
+            "accepted": format(self.__accepted, "x")
+        }
+        if self.__review:
+            record["review"] = format(self.__review, "x")
+        if self.__section_hashes is not None:
+            record["hashes"] = list(self.__section_hashes)
+        attributes.setdefault("consent", {})[self.__policy_id] = record
+        attributes.pop("acceptedSections", None)
+
+    @property
+    def policy_id(self):
+        """Return the id of the policy this state belongs to."""
+        return self.__policy_id
+
+    @property
+    def policy_version(self):
+        """Return the version (date) of the policy this state belongs to."""
+        return self.__policy_version
+
+    @property
+    def section_count(self):
+        """Return the number of top-level sections in the policy."""
+        return self.__section_count
+
+    @property
+    def accepted_sections(self):
+        """Return a list of booleans indicating whether the top-level sections
+           within the policy have been accepted."""
+        return [self.is_section_accepted(i) for i in range(self.__section_count)]
+
+    @property
+    def sections_needing_review(self):
+        """Return the numbers of the sections that changed or were added since
+           the user last gave their consent, and have not been accepted or
+           declined since."""
+        return [i for i in range(self.__section_count) if self.__review >> i & 1]
+
+    def is_section_accepted(self, num):
+        """Return true if the specified section number has been accepted."""
+        return bool(self.__accepted & self.__section_bit(num))
+
+    def accept_section(self, num):
+        """Set the specified section number to accepted."""
+        self.__accepted |= self.__section_bit(num)
+        self.__review &= ~self.__section_bit(num)
+
+    def decline_section(self, num):
+        """Set the specified section number to declined."""
+        self.__accepted &= ~self.__section_bit(num)
+        self.__review &= ~self.__section_bit(num)
+
+    def accept_all_sections(self):
+        """Set all sections in the policy to accepted."""
+        self.__accepted = self.__all_sections_mask()
+        self.__review = 0
+
+    def decline_all_sections(self):
+        """Set all sections in the policy to declined."""
+        self.__accepted = 0
+        self.__review = 0
+
+    def is_policy_accepted(self):
+        """Return true if all sections in the policy have been accepted."""
+        return self.__accepted == self.__all_sections_mask()
+
+    def count_accepted_sections(self):
+        """Return the number of sections that have been accepted."""
+        return bin(self.__accepted).count("1")
+
+    def __section_bit(self, num):
+        """Return the bit for the specified section number.  Raises
+           IndexError if the policy has no such section."""
+        if not 0 <= num < self.__section_count:
+            raise IndexError(f"Section {num} is out of range.")
+        return 1 << num
+
+    def __all_sections_mask(self):
+        """Return the bitset with every section accepted."""
+        return (1 << self.__section_count) - 1
+
+
+def migrate_attributes(attributes, policy_id, policy):
+    """Bring the consent for the given policy stored in a user's persistent
+       attributes up to date with the policy's current version, for batch
+       migrations of stored attributes.  Return true if the attributes were
+       changed."""
+    record = attributes.get("consent", {}).get(policy_id)
+    if record is None and "acceptedSections" not in attributes:
+        return False
+
+    ConsentState.from_attributes(attributes, policy_id, policy).save_to_attributes(attributes)
+    return attributes["consent"][policy_id] != record
@@ -0,0 +1,177 @@
+# Constant-time request routing.
+#
+# The SDK finds the handler for a request by calling can_handle on every
+# registered handler in turn, until one accepts it.  IntentRouter indexes the
+# handlers by the request types and intent names they declare, so only the
+# handlers that could accept a request are asked, in the order they were
+# registered.  A handler declares them with class attributes:
+#
+#   intents        intent names it handles (IntentRequests only)
+#   request_types  request types it handles, whatever the intent
+#
+# A handler declaring neither is asked about every request, in its place in
+# the registration order, so fallbacks such as IntentReflectorHandler behave
+# as before.  The declarations only narrow down which handlers are asked;
+# can_handle still decides.  Set ROUTER_VERIFY to also run the SDK's linear
+# search on every request and log any request routed differently.
+#
+# Timing hooks are called after each handler runs, with the handler, the
+# handler input and the time taken in seconds.
+#
+# The router also creates the skill once, rather than once per request as
+# the SDK's lambda_handler does.
+#
+# ## Example Usage:
+#
+# > class ContinueHandler(AbstractRequestHandler):
+# >     intents = ("Continue",)
+#
+# > router = IntentRouter()
+# > router.add_request_handler(LaunchRequestHandler())
+# > router.add_request_handler(ContinueHandler())
+# > router.add_timing_hook(lambda handler, handler_input, seconds: print(type(handler).__name__, seconds))
+# > lambda_handler = router.lambda_handler(sb)
+
+import json
+import logging
+import os
+import time
+
+from ask_sdk_core.dispatch_components import AbstractRequestHandler
+from ask_sdk_core.skill import CustomSkill
+from ask_sdk_model import RequestEnvelope
+from ask_sdk_runtime.dispatch_components.request_components import AbstractRequestMapper, GenericRequestHandlerChain
+
+logger = logging.getLogger(__name__)
+
+INTENT_REQUEST = "IntentRequest"
+
+
+def request_key(handler_input):
+    """Return the (request type, intent name) of a request, with an intent
+       name of None for requests other than IntentRequests."""
+    request = handler_input.request_envelope.request
+    if request.object_type == INTENT_REQUEST:
+        return INTENT_REQUEST, request.intent.name
+    return request.object_type, None
+
+
+class TimedRequestHandler(AbstractRequestHandler):
+    """Request handler that runs another handler and reports how long it
+       took to the router's timing hooks."""
+
+    def __init__(self, handler, hooks):
+        """Construct a wrapper around the given handler."""
+        self.__handler = handler
+        self.__hooks = hooks
+
+    def can_handle(self, handler_input):
+        """Return true if the wrapped handler can handle the specified
+           handler input."""
+        return self.__handler.can_handle(handler_input)
+
+    def handle(self, handler_input):
+        """Run the wrapped handler and call the timing hooks."""
+        started = time.perf_counter()
+        try:
+            return self.__handler.handle(handler_input)
+        finally:
+            elapsed = time.perf_counter() - started
+            for hook in self.__hooks:
+                hook(self.__handler, handler_input, elapsed)
+
+
+class IntentRouter(AbstractRequestMapper):
+    """Request mapper that finds the handler for a request by its request
+       type and intent name."""
+
+    def __init__(self, verify=None):
+        """Construct a router with no handlers.  If verify is true, or
+           ROUTER_VERIFY is set when it is None, every request is also
+           routed by a linear search and differences are logged."""
+        self.__chains = []
+        self.__timed_chains = []
+        self.__routes = {}
+        self.__type_routes = {}
+        self.__unrouted = []
+        self.__candidates = {}
+        self.__hooks = []
+        self.__verify = bool(os.environ.get("ROUTER_VERIFY")) if verify is None else verify
+
+    @property
+    def handlers(self):
+        """Return the registered handlers, in registration order."""
+        return [chain.request_handler for chain in self.__chains]
+
+    def add_request_handler(self, handler):
+        """Register a handler.  Handlers are asked in the order they are
+           registered."""
+        position = len(self.__chains)
+        self.__chains.append(GenericRequestHandlerChain(request_handler=handler))
+        self.__timed_chains.append(GenericRequestHandlerChain(
+            request_handler=TimedRequestHandler(handler, self.__hooks)))
+
+        intents = getattr(handler, "intents", ())
+        request_types = getattr(handler, "request_types", ())
+        for intent in intents:
+            self.__routes.setdefault((INTENT_REQUEST, intent), []).append(position)
+        for request_type in request_types:
+            self.__type_routes.setdefault(request_type, []).append(position)
+        if not intents and not request_types:
+            self.__unrouted.append(position)
+        self.__candidates.clear()
+
+    def add_timing_hook(self, hook):
+        """Register a function to call with (handler, handler input, seconds)
+           after each handler runs."""
+        self.__hooks.append(hook)
+
+    def candidates(self, key):
+        """Return the positions of the handlers that could handle requests
+           with the given (request type, intent name), in registration
+           order."""
+        positions = self.__candidates.get(key)
+        if positions is None:
+            positions = sorted(set(self.__routes.get(key, []) + self.__type_routes.get(key[0], [])
+                                   + self.__unrouted))
+            self.__candidates[key] = positions
+        return positions
+
+    def get_request_handler_chain(self, handler_input):
+        """Return the chain of the first registered handler that can handle
+           the request, or None if none can."""
+        chains = self.__timed_chains if self.__hooks else self.__chains
+        found = None
+        for position in self.candidates(request_key(handler_input)):
+            if self.__chains[position].request_handler.can_handle(handler_input):
+                found = position
+                break
+
+        if self.__verify:
+            self.__check(handler_input, found)
+        return chains[found] if found is not None else None
+
+    def __check(self, handler_input, found):
+        """Log an error if a linear search would route the request to a
+           different handler."""
+        expected = next((position for position, chain in enumerate(self.__chains)
+                         if chain.request_handler.can_handle(handler_input)), None)
+        if expected != found:
+            names = [type(self.__chains[position].request_handler).__name__ if position is not None else None
+                     for position in (expected, found)]
+            logger.error(f"Request {request_key(handler_input)} routed to {names[1]} instead of {names[0]}")
+
+    def lambda_handler(self, skill_builder):
+        """Return a Lambda handler function for the skill configured by the
+           given skill builder, routing requests with this router.  Request
+           handlers must be registered with the router, not the builder."""
+        skill_configuration = skill_builder.skill_configuration
+        skill_configuration.request_mappers = [self]
+        skill = CustomSkill(skill_configuration=skill_configuration)
+
+        def handler(event, context):
+            request_envelope = skill.serializer.deserialize(payload=json.dumps(event), obj_type=RequestEnvelope)
+            response_envelope = skill.invoke(request_envelope=request_envelope, context=context)
+            return skill.serializer.serialize(response_envelope)
+
+        return handler
@@ -8,14 +8,28 @@
 #
 # The components of the privacy policy are handled in the privacy_policy module, go there for more info.
 
+import bisect
 import logging
-import ask_sdk_core.utils as ask_utils
+import re
 import sys
 import os
 sys.path.append(os.path.dirname(__file__))
 
-from ask_sdk_s3.adapter import S3Adapter
-s3_adapter = S3Adapter(bucket_name=os.environ["S3_PERSISTENCE_BUCKET"])
+# Imported first so that, with STARTUP_PROFILE set, every import below is
+# timed (see the startup module).
+import startup
+import ask_sdk_core.utils as ask_utils
+import metrics
+
+def create_s3_adapter():
+    """Return the S3 persistence adapter.  Importing ask_sdk_s3 (and with it
+       boto3) and creating its S3 client are the costliest parts of a cold
+       start, so they wait for the first request that reads or writes
+       persistent attributes."""
+    from ask_sdk_s3.adapter import S3Adapter
+    return S3Adapter(bucket_name=os.environ["S3_PERSISTENCE_BUCKET"])
+
+s3_adapter = metrics.MetricsPersistenceAdapter(startup.LazyPersistenceAdapter("S3 adapter", create_s3_adapter))
 
 from ask_sdk_core.skill_builder import CustomSkillBuilder
 from ask_sdk_core.dispatch_components import AbstractRequestHandler, AbstractExceptionHandler
@@ -23,36 +37,120 @@ from ask_sdk_core.handler_input import HandlerInput
 from ask_sdk_model.ui import PlayBehavior, Reprompt, SsmlOutputSpeech, PlainTextOutputSpeech
 
 from ask_sdk_model import Response, IntentRequest, Intent, Slot, SlotConfirmationStatus
-from privacy_policy import PrivacyPolicy
+from policy_registry import PolicyRegistry, LocalPolicySource, S3PolicySource
+from consent_state import ConsentState
+from persistence import PersistentAttributes, SavePersistentAttributesInterceptor
+from intent_router import IntentRouter
+from speech_chunker import SpeechChunker, ssml_length
+from speech_render import SpeechRenderCache, RenderedSpeech, SECTION_PROMPT, CHUNK_PROMPT
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-policy = PrivacyPolicy("policy.xml")
-max_section_num = len(policy.sections)
+# Policies are served from the files bundled with the skill first, then from
+# the persistence bucket.  The policy read to a user is the one they chose
+# with the ChoosePolicy intent, kept in their persistent attributes as
+# "policyId" and in the session attributes once read, falling back to the
+# POLICY_ID environment variable (the bundled policy.xml by default).
+# The speech for each policy's sections and table of contents is rendered
+# once, as the policy is loaded.  Sections longer than SPEECH_MAX_CHARS
+# characters (or SPEECH_MAX_SECONDS seconds of speech, if set) are read in
+# several chunks.
+# The default policy is loaded by the first request that reads it, or at
+# startup with EAGER_INIT set.
+DEFAULT_POLICY_ID = os.environ.get("POLICY_ID", "policy")
+POLICY_CACHE_SIZE = int(os.environ.get("POLICY_CACHE_SIZE", 16))
+with startup.timed("policy registry"):
+    speech_chunker = SpeechChunker(
+        max_chars=int(os.environ.get("SPEECH_MAX_CHARS", 6000)),
+        max_seconds=float(os.environ["SPEECH_MAX_SECONDS"]) if os.environ.get("SPEECH_MAX_SECONDS") else None)
+    speech_cache = SpeechRenderCache(POLICY_CACHE_SIZE, speech_chunker)
+    policy_registry = PolicyRegistry(
+        [LocalPolicySource(os.path.dirname(os.path.abspath(__file__))),
+         S3PolicySource(os.environ["S3_PERSISTENCE_BUCKET"])],
+        max_policies=POLICY_CACHE_SIZE,
+        revalidate_after=int(os.environ.get("POLICY_REVALIDATE_SECONDS", 300)),
+        on_load=speech_cache.render)
+default_policy = startup.Lazy("default policy", lambda: policy_registry.get(DEFAULT_POLICY_ID))
 repeat = False
 cont = False
 quit = False
 
-persistent_variables = {
-    "lastSectionRead": -1,
-    "acceptedSections": policy.accepted_sections
-}
+# Everything specific to a user lives in their persistent attributes; only
+# the (read-only) policies are shared between the users served by a
+# container.
+
+def get_policy_id(handler_input):
+    """Return the id of the policy being browsed in the current session,
+       reading the user's choice on first use in the session."""
+    session_attributes = handler_input.attributes_manager.session_attributes
+    if "policyId" not in session_attributes:
+        session_attributes["policyId"] = load_attributes(handler_input).get("policyId") or DEFAULT_POLICY_ID
+    return session_attributes["policyId"]
+
+def get_policy(handler_input):
+    """Return the policy being browsed in the current session.  If the
+       chosen policy is no longer available, the default policy is browsed
+       for the rest of the session."""
+    policy_id = get_policy_id(handler_input)
+    if policy_id == DEFAULT_POLICY_ID and not default_policy.created:
+        return default_policy.get()
+    # The registry, not default_policy, keeps the loaded policies up to
+    # date, so later requests ask it directly.
+    try:
+        return policy_registry.get(policy_id)
+    except KeyError:
+        if policy_id == DEFAULT_POLICY_ID:
+            raise
+        logger.warning("Policy %s is not available, reading %s instead", policy_id, DEFAULT_POLICY_ID)
+        handler_input.attributes_manager.session_attributes["policyId"] = DEFAULT_POLICY_ID
+        return get_policy(handler_input)
+
+def choose_policy(handler_input, policy_id):
+    """Make the policy with the given id the one the current user browses,
+       starting from its beginning if it is not the one they were reading."""
+    persistent_variables = load_attributes(handler_input)
+    if policy_id != get_policy_id(handler_input):
+        persistent_variables["lastSectionRead"] = -1
+        persistent_variables["readCursor"] = None
+        persistent_variables["passage"] = None
+    persistent_variables["policyId"] = policy_id
+    handler_input.attributes_manager.session_attributes["policyId"] = policy_id
+
+def get_policy_id_for_name(policy_name):
+    """Return the policy id a spoken policy name refers to: its words in
+       lower case, joined by hyphens."""
+    return "-".join(re.findall(r"[a-z0-9]+", policy_name.lower()))
+
+def get_rendering(handler_input):
+    """Return the precomputed speech of the policy being browsed in the
+       current session."""
+    policy = get_policy(handler_input)
+    return speech_cache.get(get_policy_id(handler_input), policy)
 
 def load_attributes(handler_input):
-    """Load persistent variables from S3 storage."""
-    attributes_manager = handler_input.attributes_manager
-    persistent_variables = handler_input.attributes_manager.persistent_attributes
-
-def save_attributes(handler_input):
-    """Save persistent variables to S3 storage."""
-    attributes_manager = handler_input.attributes_manager
-    attributes_manager.persistent_attributes = persistent_variables
-    attributes_manager.save_persistent_attributes()
-
-def create_section_response(handler_input, section_number):
-    """Return a response object that reads the specified section number."""
-    if section_number >= max_section_num:
+    """Return the current user's persistent variables.  They are loaded from
+       S3 storage once per session, and any changes are saved at the end of
+       the turn by SavePersistentAttributesInterceptor."""
+    return PersistentAttributes.for_request(handler_input, {"lastSectionRead": -1, "readCursor": None, "passage": None,
+                                                            "policyId": None}).data
+
+def load_consent(handler_input, policy):
+    """Return the current user's consent state for the given policy, read
+       from their persistent attributes on every call, so it always
+       reflects what was stored."""
+    return ConsentState.from_attributes(load_attributes(handler_input), get_policy_id(handler_input), policy)
+
+def save_consent(handler_input, consent):
+    """Store the current user's consent state in their persistent
+       variables."""
+    consent.save_to_attributes(load_attributes(handler_input))
+
+def create_section_response(handler_input, section_number, chunk_number=0):
+    """Return a response object that reads the specified chunk of the
+       specified section number."""
+    policy = get_policy(handler_input)
+    if section_number >= len(policy.sections):
         return (
             handler_input.response_builder
                 .speak("The end of the policy was reached.")
@@ -60,32 +158,101 @@ def create_section_response(handler_input, section_number):
                 .response
         )
     
-    section = policy.sections[section_number]
+    section = get_rendering(handler_input).section(section_number)
     
+    persistent_variables = load_attributes(handler_input)
     persistent_variables["lastSectionRead"] = section_number
+    persistent_variables["readCursor"] = list(section.cursor(chunk_number))
+    persistent_variables["passage"] = None
     
-    speak_output = 'Starting from section {num}'.format(num = section_number + 1)
-    speak_output += ". " + section.all_atoms_as_string()
-    speak_output += "To accept or decline this section of the policy, say accept or decline. Otherwise, say continue."
+    return (
+        handler_input.response_builder
+            .speak(section[chunk_number].ssml)
+            .ask("Would you like to continue reading the next section?  To do so, say continue.")
+            .response
+    )
+
+def get_read_position(handler_input):
+    """Return the (section number, chunk number) last read, with the chunk
+       found from the stored cursor so it stays valid if the chunk budget
+       changes."""
+    persistent_variables = load_attributes(handler_input)
+    section_number = persistent_variables["lastSectionRead"]
+    cursor = persistent_variables.get("readCursor")
+    policy = get_policy(handler_input)
+    if cursor is None or not 0 <= section_number < len(policy.sections):
+        return section_number, 0
+    section = get_rendering(handler_input).section(section_number)
+    return section_number, section.chunk_number_at(cursor)
+
+def get_section_number(policy, atom_index):
+    """Return the number of the top-level section containing the atom with
+       the given index, or -1 if it is the policy's own title."""
+    sections = policy.sections
+    starts = [section.atom_range.start for section in sections]
+    return bisect.bisect_right(starts, atom_index) - 1
+
+def split_passage(policy, start, stop):
+    """Return the chunks that read the atoms with indices start to stop
+       (inclusive), leaving room for the prompt after each chunk."""
+    atoms = ((i, f"{str(policy.all_atoms[i]).rstrip('.')}. ") for i in range(start, stop + 1))
+    chunks = speech_chunker.split(atoms, max(ssml_length(SECTION_PROMPT), ssml_length(CHUNK_PROMPT)))
+    return chunks or speech_chunker.split([(start, "")])
+
+def create_passage_response(handler_input, policy, start, stop=None, chunk_number=0):
+    """Return a response object that reads the specified chunk of the passage
+       from the atom with index start to the atom with index stop, by default
+       the end of the section or subsection containing start."""
+    if stop is None:
+        stop = policy.get_read_last_index(start)
+    chunks = split_passage(policy, start, stop)
+    last = chunk_number == len(chunks) - 1
+    
+    # The cursor is left at the end of the part read, so continue picks up
+    # after it, and accept applies to the top-level section it belongs to.
+    section_number = get_section_number(policy, start)
+    persistent_variables = load_attributes(handler_input)
+    if section_number >= 0:
+        persistent_variables["lastSectionRead"] = section_number
+        persistent_variables["readCursor"] = [stop + 1, 0] if last else list(chunks[chunk_number + 1].cursor)
+        persistent_variables["passage"] = [start, stop]
+    
+    speech = RenderedSpeech(chunks[chunk_number].text + (SECTION_PROMPT if last else CHUNK_PROMPT))
     
     return (
         handler_input.response_builder
-            .speak(speak_output)
+            .speak(speech.ssml)
             .ask("Would you like to continue reading the next section?  To do so, say continue.")
             .response
     )
 
-def have_read_section():
+def get_passage_position(handler_input, policy):
+    """Return the (start, stop, next chunk number, chunk count) of the
+       passage being read, or None if a whole section is being read.  The
+       next chunk number equals the chunk count once the passage has been
+       read to its end."""
+    persistent_variables = load_attributes(handler_input)
+    passage = persistent_variables.get("passage")
+    cursor = persistent_variables.get("readCursor")
+    if passage is None or cursor is None:
+        return None
+    start, stop = passage
+    if not 0 <= start <= stop < len(policy.all_atoms):
+        return None
+    cursors = [chunk.cursor for chunk in split_passage(policy, start, stop)]
+    return start, stop, bisect.bisect_left(cursors, tuple(cursor)), len(cursors)
+
+def have_read_section(handler_input):
     """Return true if a section was previously read."""
-    return persistent_variables["lastSectionRead"] >= 0
+    return load_attributes(handler_input)["lastSectionRead"] >= 0
 
-def list_accepted_sections():
+def list_accepted_sections(consent):
     """Return a string stating which sections of the policy have been read."""
     count = 0
     speak_output = ""
     
-    for i in range(len(policy.accepted_sections)):
-        if policy.is_section_accepted(i):
+    for i in range(consent.section_count):
+        if consent.is_section_accepted(i):
             if count == 0:
                 speak_output += ": "
             else:
@@ -93,7 +260,7 @@ def list_accepted_sections():
             count += 1
             speak_output += str(i + 1)
     
-    if count == len(policy.accepted_sections):
+    if count == consent.section_count:
         return "You have accepted all sections of this policy."
     
     elif count == 1:
@@ -105,8 +272,17 @@ def list_accepted_sections():
     else:
         return "You have not accepted any sections in this policy."
 
+def list_review_sections(review):
+    """Return a string stating which sections of the policy need to be
+       reviewed."""
+    numbers = [str(i + 1) for i in review]
+    if len(numbers) == 1:
+        return "Section " + numbers[0] + " is new or has changed."
+    return "Sections " + ", ".join(numbers[:-1]) + " and " + numbers[-1] + " are new or have changed."
+
 class LaunchRequestHandler(AbstractRequestHandler):
     """Handler run when the skill first launches."""
+    request_types = ("LaunchRequest",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -133,11 +309,17 @@ class LaunchRequestHandler(AbstractRequestHandler):
         + "8. 'read accepted sections', " \
         + "or 'quit.'"
         
-        load_attributes(handler_input)
+        persistent_variables = load_attributes(handler_input)
         
         if persistent_variables["lastSectionRead"] >= 0:
             speak_output = "Welcome back to the privacy policy reader. To continue from where you left off say continue, " \
             + "or to hear other options say 1, help, or menu."
+            
+            review = load_consent(handler_input, get_policy(handler_input)).sections_needing_review
+            if review:
+                speak_output = "Welcome back to the privacy policy reader. The policy has changed since you last read it. " \
+                + list_review_sections(review) + " To read one, say section followed by its number, " \
+                + "or to hear other options say 1, help, or menu."
         
         return (
             handler_input.response_builder
@@ -149,18 +331,13 @@ class LaunchRequestHandler(AbstractRequestHandler):
 
 # OUR CODE #################################################################################################
 
-def get_toc_string():
-    """Return a string stating the top-level titles of the privacy policy."""
-    titles = "Here are the Privacy Policy section titles"
-    i = 1
-    for title in policy.section_titles:
-        titles += f". {i}. " + str(title).rstrip(".")
-        i += 1
-    
-    return titles
+def get_toc_string(handler_input):
+    """Return the SSML stating the top-level titles of the privacy policy."""
+    return get_rendering(handler_input).toc.ssml
 
 class TableOfContentsHandler(AbstractRequestHandler):
     """Handler run when the user requests the table of contents."""
+    intents = ("TableOfContents",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -172,7 +349,7 @@ class TableOfContentsHandler(AbstractRequestHandler):
 
         return (
             handler_input.response_builder
-                .speak(get_toc_string())
+                .speak(get_toc_string(handler_input))
                 .ask("What would you like to do?")
                 .response
         )
@@ -180,6 +357,7 @@ class TableOfContentsHandler(AbstractRequestHandler):
 
 class ReadAcceptedHandler(AbstractRequestHandler):
     """Handler run when the user requests a list of accepted sections."""
+    intents = ("readAccepted",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -189,8 +367,8 @@ class ReadAcceptedHandler(AbstractRequestHandler):
     def handle(self, handler_input):
         """Return a response object that plays a list of accepted sections."""
         
-        load_attributes(handler_input)
-        speak_output = list_accepted_sections()
+        consent = load_consent(handler_input, get_policy(handler_input))
+        speak_output = list_accepted_sections(consent)
         
         return (
             handler_input.response_builder
@@ -202,6 +380,7 @@ class ReadAcceptedHandler(AbstractRequestHandler):
 
 class ListOptionsHandler(AbstractRequestHandler):
     """Handler run when the user requests help or menu options."""
+    intents = ("ListOptions", "AMAZON.HelpIntent")
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -220,6 +399,7 @@ class ListOptionsHandler(AbstractRequestHandler):
         + "6. 'repeat that', " \
         + "7. 'accept or decline section' optionally followed by the section number, " \
         + "8. 'read accepted sections', " \
+        + "9. 'choose the policy for' followed by a company name, " \
         + "or 'quit.'"
         
         return (
@@ -233,6 +413,8 @@ class ListOptionsHandler(AbstractRequestHandler):
 class ResetHandler(AbstractRequestHandler):
     """Debug handle to reset AWS slots
        Invoke with "Erase all data" """
+    intents = ("Reset",)
+
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
            input."""
@@ -242,13 +424,16 @@ class ResetHandler(AbstractRequestHandler):
         """Delete persistent variables and return a response object that
            reports success."""
         
-        policy.decline_all_sections()
+        persistent_variables = load_attributes(handler_input)
         persistent_variables["lastSectionRead"] = -1
-        persistent_variables["acceptedSections"] = policy.accepted_sections
+        persistent_variables["readCursor"] = None
+        persistent_variables["passage"] = None
+        consent = load_consent(handler_input, get_policy(handler_input))
+        consent.decline_all_sections()
         
         response = "Okay, I've forgotten everything.  What was my name again?"
         
-        save_attributes(handler_input)
+        save_consent(handler_input, consent)
         
         return (
             handler_input.response_builder
@@ -260,6 +445,8 @@ class ResetHandler(AbstractRequestHandler):
 
 class StartFromSectionHandler(AbstractRequestHandler):
     """Handler run when the user asks to start from a section."""
+    intents = ("StartFromSection",)
+
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
            input."""
@@ -275,13 +462,13 @@ class StartFromSectionHandler(AbstractRequestHandler):
         
         response = create_section_response(handler_input, num)
         
-        save_attributes(handler_input)
-        
         return response
 
 
 class AcceptPolicyHandler(AbstractRequestHandler):
     """Handler run when the user asks to accept a section of the policy."""
+    intents = ("AcceptPolicy",)
+
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
            input."""
@@ -291,7 +478,7 @@ class AcceptPolicyHandler(AbstractRequestHandler):
         """Update the accepted sections variable and return a response object
            that reports success or failure."""
         
-        load_attributes(handler_input)
+        persistent_variables = load_attributes(handler_input)
         
         slots = handler_input.request_envelope.request.intent.slots
         user_acceptence = slots["userAcceptence"].value
@@ -303,7 +490,7 @@ class AcceptPolicyHandler(AbstractRequestHandler):
         elif slots["acceptWhat"].value:
             num = -1
         else:
-            if not have_read_section():
+            if not have_read_section(handler_input):
                 return (
                     handler_input.response_builder
                         .speak("Sorry, you haven't read any sections yet.")
@@ -312,30 +499,29 @@ class AcceptPolicyHandler(AbstractRequestHandler):
                 )
             num = persistent_variables["lastSectionRead"]
         
-        policy.set_accepted_sections(persistent_variables["acceptedSections"])
+        consent = load_consent(handler_input, get_policy(handler_input))
         
         if user_acceptence == "accept":
             
             if num >= 0:
-                policy.accept_section(num)
+                consent.accept_section(num)
                 speak_output += "Ok. Section " + str(num + 1) + " has been accepted."
             
             else:
-                policy.accept_all_sections()
+                consent.accept_all_sections()
                 speak_output += "Ok. All sections of the policy have been accepted."
         
         elif user_acceptence == "decline":
             
             if num >= 0:
-                policy.decline_section(num)
+                consent.decline_section(num)
                 speak_output += "Ok. Section " + str(num + 1) + " has been declined."
             
             else:
-                policy.decline_all_sections()
+                consent.decline_all_sections()
                 speak_output += "Ok. All sections of the policy have been declined."
         
-        persistent_variables["acceptedSections"] = policy.accepted_sections
-        save_attributes(handler_input)
+        save_consent(handler_input, consent)
         
         return (
             handler_input.response_builder
@@ -348,6 +534,7 @@ class AcceptPolicyHandler(AbstractRequestHandler):
 class StartFromBeginningHandler(AbstractRequestHandler):
     """Handler run when the user asks to start reading from the beginning the
        policy."""
+    intents = ("StartFromBeginning",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -360,7 +547,6 @@ class StartFromBeginningHandler(AbstractRequestHandler):
         
         load_attributes(handler_input)
         response = create_section_response(handler_input, 0)
-        save_attributes(handler_input)
         
         return response
 
@@ -369,6 +555,7 @@ class StartFromBeginningHandler(AbstractRequestHandler):
 class ContinueHandler(AbstractRequestHandler):
     """Handler run when the user asks to continue reading the next section
        of the policy."""
+    intents = ("Continue",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -377,17 +564,128 @@ class ContinueHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         """Update the last section read variable and return a response object
-           that plays the next section of the policy."""
-        load_attributes(handler_input)
+           that plays the rest of the current section, or the next section of
+           the policy."""
+        policy = get_policy(handler_input)
+        num, chunk_number = get_read_position(handler_input)
+        
+        passage = get_passage_position(handler_input, policy)
+        if passage is not None and 0 <= num < len(policy.sections):
+            start, stop, chunk_number, chunk_count = passage
+            if chunk_number < chunk_count:
+                return create_passage_response(handler_input, policy, start, stop, chunk_number)
+            # Then read on to the end of the top-level section.
+            section_stop = policy.sections[num].atom_range.stop - 1
+            if stop < section_stop:
+                return create_passage_response(handler_input, policy, stop + 1, section_stop)
+            return create_section_response(handler_input, num + 1)
+        
+        if num >= 0 and num < len(policy.sections):
+            if chunk_number + 1 < len(get_rendering(handler_input).section(num)):
+                return create_section_response(handler_input, num, chunk_number + 1)
+        
+        response = create_section_response(handler_input, num + 1)
         
-        persistent_variables["lastSectionRead"] += 1
-        num = persistent_variables["lastSectionRead"]
+        return response
+
+
+class ReadAboutHandler(AbstractRequestHandler):
+    """Handler run when the user asks to hear the part of the policy about a
+       topic."""
+    intents = ("ReadAbout",)
+    
+    def can_handle(self, handler_input):
+        """Return true if this handler can handle the specified handler
+           input."""
+        return ask_utils.is_intent_name("ReadAbout")(handler_input)
+
+    def handle(self, handler_input):
+        """Return a response object that plays the atoms from the one best
+           matching the requested topic to the end of its section."""
+        topic = ask_utils.get_slot_value(handler_input, "topic")
+        policy = get_policy(handler_input)
+        matches = policy.search_index.search(topic, limit=1) if topic else []
+        
+        if not matches:
+            speech = RenderedSpeech(f"Sorry, I couldn't find anything about {topic or 'that'} in this policy.")
+            return (
+                handler_input.response_builder
+                    .speak(speech.ssml)
+                    .ask("What would you like to do?")
+                    .response
+            )
         
-        response = create_section_response(handler_input, num)
+        return create_passage_response(handler_input, policy, matches[0][0])
+
+
+class GoToSectionHandler(AbstractRequestHandler):
+    """Handler run when the user asks for a section by its name."""
+    intents = ("GoToSection",)
+    
+    def can_handle(self, handler_input):
+        """Return true if this handler can handle the specified handler
+           input."""
+        return ask_utils.is_intent_name("GoToSection")(handler_input)
+
+    def handle(self, handler_input):
+        """Return a response object that plays the section whose title best
+           matches the requested name."""
+        section_name = ask_utils.get_slot_value(handler_input, "sectionName")
+        policy = get_policy(handler_input)
+        matches = policy.title_index.lookup(section_name, limit=1) if section_name else []
+        
+        if not matches:
+            speech = RenderedSpeech(f"Sorry, I couldn't find a section called {section_name or 'that'}.")
+            return (
+                handler_input.response_builder
+                    .speak(speech.ssml)
+                    .ask("What would you like to do?")
+                    .response
+            )
         
-        save_attributes(handler_input)
+        title = matches[0][0]
+        section = title.parent_section
+        if section.parent_section is policy.root_section:
+            return create_section_response(handler_input, get_section_number(policy, title.atom_index))
         
-        return response
+        return create_passage_response(handler_input, policy, title.atom_index)
+
+
+class ChoosePolicyHandler(AbstractRequestHandler):
+    """Handler run when the user asks for another company's policy."""
+    intents = ("ChoosePolicy",)
+    
+    def can_handle(self, handler_input):
+        """Return true if this handler can handle the specified handler
+           input."""
+        return ask_utils.is_intent_name("ChoosePolicy")(handler_input)
+
+    def handle(self, handler_input):
+        """Switch to the policy with the requested name and return a response
+           object that reports success or failure."""
+        policy_name = ask_utils.get_slot_value(handler_input, "policyName")
+        policy_id = get_policy_id_for_name(policy_name) if policy_name else ""
+        try:
+            policy = policy_registry.get(policy_id)
+        except KeyError:
+            speech = RenderedSpeech(f"Sorry, I couldn't find a policy for {policy_name or 'that'}.")
+            return (
+                handler_input.response_builder
+                    .speak(speech.ssml)
+                    .ask("What would you like to do?")
+                    .response
+            )
+        
+        choose_policy(handler_input, policy_id)
+        speech = RenderedSpeech(f"Ok. I'll read the policy for {policy_name}. It has {len(policy.sections)} sections. "
+                                + "To hear them, say table of contents, or to start reading, say read from beginning.")
+        
+        return (
+            handler_input.response_builder
+                .speak(speech.ssml)
+                .ask("What would you like to do?")
+                .response
+        )
 
 
 # INTENTS TO BE CALLED WHILE READING:
@@ -396,6 +694,7 @@ class ContinueHandler(AbstractRequestHandler):
 class RepeatWhileReadingHandler(AbstractRequestHandler):
     """Handler run when the user asks to repeat the current section of the
        policy."""
+    intents = ("RepeatWhileReading",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -403,11 +702,10 @@ class RepeatWhileReadingHandler(AbstractRequestHandler):
         return ask_utils.is_intent_name("RepeatWhileReading")(handler_input)
 
     def handle(self, handler_input):
-        """Return a response object that plays the current section of the
-           policy or reports failure if no section has been read."""
-        load_attributes(handler_input)
-        
-        if not have_read_section():
+        """Return a response object that plays the current part of the
+           current section of the policy or reports failure if no section has
+           been read."""
+        if not have_read_section(handler_input):
             return (
                 handler_input.response_builder
                     .speak("Sorry, I'm not sure which section you want me to repeat.")
@@ -415,9 +713,15 @@ class RepeatWhileReadingHandler(AbstractRequestHandler):
                     .response
             )
         
-        num = persistent_variables["lastSectionRead"]
+        policy = get_policy(handler_input)
+        passage = get_passage_position(handler_input, policy)
+        if passage is not None:
+            start, stop, chunk_number, _ = passage
+            return create_passage_response(handler_input, policy, start, stop, max(chunk_number - 1, 0))
+        
+        num, chunk_number = get_read_position(handler_input)
         
-        return create_section_response(handler_input, num)
+        return create_section_response(handler_input, num, chunk_number)
 
 
 # PREGEN CODE #################################################################################################
@@ -425,6 +729,8 @@ class RepeatWhileReadingHandler(AbstractRequestHandler):
 
 class CancelOrStopIntentHandler(AbstractRequestHandler):
     """Handler run when the user asks to cancel the skill."""
+    intents = ("AMAZON.CancelIntent", "AMAZON.StopIntent")
+
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
            input."""
@@ -445,6 +751,7 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
 
 class FallbackIntentHandler(AbstractRequestHandler):
     """Handler run when the user issues a command we don't handle."""
+    intents = ("AMAZON.FallbackIntent",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -464,6 +771,7 @@ class FallbackIntentHandler(AbstractRequestHandler):
 
 class SessionEndedRequestHandler(AbstractRequestHandler):
     """Handler run when the session ends."""
+    request_types = ("SessionEndedRequest",)
     
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
@@ -481,6 +789,8 @@ class IntentReflectorHandler(AbstractRequestHandler):
        debugging.  It will simply repeat the intent the user said. You can
        create custom handlers for your intents by defining them above, then
        also adding them to the request handler chain below."""
+    request_types = ("IntentRequest",)
+
     def can_handle(self, handler_input):
         """Return true if this handler can handle the specified handler
            input."""
@@ -531,28 +841,48 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
 # defined are included below. The order matters - they're processed top to bottom.
 
 sb = CustomSkillBuilder(persistence_adapter=s3_adapter)
+# Request handlers are registered with the router, which only asks the
+# handlers whose intents or request_types match each request (see the
+# intent_router module).
+router = IntentRouter()
 
-sb.add_request_handler(LaunchRequestHandler())
+router.add_request_handler(LaunchRequestHandler())
 # OUR INTENTS
-sb.add_request_handler(ListOptionsHandler())
-sb.add_request_handler(TableOfContentsHandler())
-sb.add_request_handler(ReadAcceptedHandler())
-
-sb.add_request_handler(StartFromSectionHandler())
-sb.add_request_handler(StartFromBeginningHandler())
-sb.add_request_handler(ContinueHandler())
-sb.add_request_handler(ResetHandler())
+router.add_request_handler(ListOptionsHandler())
+router.add_request_handler(TableOfContentsHandler())
+router.add_request_handler(ReadAcceptedHandler())
+
+router.add_request_handler(StartFromSectionHandler())
+router.add_request_handler(StartFromBeginningHandler())
+router.add_request_handler(ContinueHandler())
+router.add_request_handler(ReadAboutHandler())
+router.add_request_handler(GoToSectionHandler())
+router.add_request_handler(ChoosePolicyHandler())
+router.add_request_handler(ResetHandler())
 
 # READING INTENTS
-sb.add_request_handler(AcceptPolicyHandler())
-sb.add_request_handler(RepeatWhileReadingHandler())
+router.add_request_handler(AcceptPolicyHandler())
+router.add_request_handler(RepeatWhileReadingHandler())
 
 # OUR INTENTS ^
-sb.add_request_handler(CancelOrStopIntentHandler())
-sb.add_request_handler(FallbackIntentHandler())
-sb.add_request_handler(SessionEndedRequestHandler())
-sb.add_request_handler(IntentReflectorHandler()) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
-
-sb.add_exception_handler(CatchAllExceptionHandler())
-
-lambda_handler = sb.lambda_handler()
+router.add_request_handler(CancelOrStopIntentHandler())
+router.add_request_handler(FallbackIntentHandler())
+router.add_request_handler(SessionEndedRequestHandler())
+router.add_request_handler(IntentReflectorHandler()) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
+
+sb.add_exception_handler(metrics.MetricsExceptionHandler(CatchAllExceptionHandler()))
+
+# Set PERSISTENCE_WRITE_BEHIND to write persistent variables once at the end
+# of a session instead of at the end of every turn that changes them.
+sb.add_global_response_interceptor(SavePersistentAttributesInterceptor(
+    write_behind=bool(os.environ.get("PERSISTENCE_WRITE_BEHIND"))))
+
+# Log the time, storage calls and speech length of every turn (see the
+# metrics module).  The response interceptor goes last so the attribute save
+# above is included.
+sb.add_global_request_interceptor(metrics.MetricsRequestInterceptor())
+sb.add_global_response_interceptor(metrics.MetricsResponseInterceptor())
+router.add_timing_hook(metrics.record_handler)
+
+lambda_handler = router.lambda_handler(sb)
+startup.finish()
@@ -0,0 +1,260 @@
+# Per-turn metrics, logged as structured JSON.
+#
+# MetricsRequestInterceptor starts a record for each turn, and
+# MetricsResponseInterceptor finishes it and logs it as one JSON line on the
+# "metrics" logger.  In between, the record collects:
+#
+#   wall_ms        time from the request interceptor to the response
+#                  interceptor
+#   handler        the handler that ran, and handler_ms, the time it took
+#                  (from the intent router's timing hook, record_handler)
+#   storage_ms     time spent in storage calls
+#   s3_calls       number of storage calls by S3 operation
+#   bytes_read     bytes read from and written to storage
+#   bytes_written
+#   speech_chars   characters of speech in the response, without SSML tags
+#
+# Storage calls are recorded by MetricsPersistenceAdapter, which wraps a
+# persistence adapter, by functions decorated with storage_operation, and by
+# storage_call blocks.  The record for the current turn is kept in a context
+# variable, so storage functions need no handler input.  Wrap the exception
+# handler in MetricsExceptionHandler so failed turns are logged too.
+#
+# Set METRICS to 0 to turn metrics off.  Summarize the logged lines with
+# src/tools/metrics_summary.py.
+#
+# ## Example Usage:
+#
+# > sb.add_global_request_interceptor(MetricsRequestInterceptor())
+# > sb.add_global_response_interceptor(MetricsResponseInterceptor())
+# > sb.add_exception_handler(MetricsExceptionHandler(CatchAllExceptionHandler()))
+# > router.add_timing_hook(record_handler)
+#
+# > @storage_operation("GetObject", lambda args, result: (len(result), 0))
+# > def read_file(file_name):
+#
+# > with storage_call("GetObject") as call:
+# >     body = client.get_object(Bucket=bucket, Key=key)["Body"].read()
+# >     call.bytes_read = len(body)
+
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import re
+import threading
+import time
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+from ask_sdk_core.dispatch_components import (AbstractExceptionHandler, AbstractRequestInterceptor,
+                                              AbstractResponseInterceptor)
+
+ENABLED = os.environ.get("METRICS", "1") != "0"
+SSML_TAG = re.compile(r"<[^>]*>")
+
+logger = logging.getLogger("metrics")
+logger.setLevel(logging.INFO)
+
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+def payload_size(payload):
+    """Return the size in bytes of a string, bytes or JSON-serializable
+       payload."""
+    if payload is None:
+        return 0
+    if isinstance(payload, bytes):
+        return len(payload)
+    if not isinstance(payload, str):
+        payload = json.dumps(payload)
+    return len(payload.encode("utf-8"))
+
+
+def speech_length(response):
+    """Return the number of characters spoken by a response, without SSML
+       tags."""
+    speech = getattr(response, "output_speech", None)
+    if speech is None:
+        return 0
+    text = getattr(speech, "ssml", None) or getattr(speech, "text", None) or ""
+    return len(SSML_TAG.sub("", text))
+
+
+class TurnMetrics:
+    """Collect the metrics of one turn."""
+
+    def __init__(self, handler_input):
+        """Start the metrics of the turn with the given handler input."""
+        request = handler_input.request_envelope.request
+        self.started = time.perf_counter()
+        self.request_id = request.request_id
+        self.request_type = request.object_type
+        self.intent = request.intent.name if request.object_type == "IntentRequest" else None
+        self.handler = None
+        self.handler_seconds = 0.0
+        self.storage_seconds = 0.0
+        self.s3_calls = {}
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.lock = threading.Lock()
+
+    def add_storage_call(self, operation, seconds, bytes_read=0, bytes_written=0):
+        """Record a storage call.  Calls made concurrently are each counted
+           in full, so storage time can exceed wall time."""
+        with self.lock:
+            self.storage_seconds += seconds
+            self.s3_calls[operation] = self.s3_calls.get(operation, 0) + 1
+            self.bytes_read += bytes_read
+            self.bytes_written += bytes_written
+
+    def as_dict(self, response=None, error=None):
+        """Return the metrics as a dictionary, ending the turn now."""
+        return {
+            "metric": "turn",
+            "function": os.environ.get("AWS_LAMBDA_FUNCTION_NAME"),
+            "request_id": self.request_id,
+            "request_type": self.request_type,
+            "intent": self.intent,
+            "handler": self.handler,
+            "wall_ms": round((time.perf_counter() - self.started) * 1e3, 3),
+            "handler_ms": round(self.handler_seconds * 1e3, 3),
+            "storage_ms": round(self.storage_seconds * 1e3, 3),
+            "s3_calls": self.s3_calls,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "speech_chars": speech_length(response),
+            "error": type(error).__name__ if error is not None else None,
+        }
+
+
+def start_turn(handler_input):
+    """Start recording the metrics of a turn."""
+    if ENABLED:
+        current_turn.set(TurnMetrics(handler_input))
+
+
+def end_turn(response=None, error=None):
+    """Log the metrics of the current turn, if one was started."""
+    turn = current_turn.get()
+    if turn is None:
+        return
+    current_turn.set(None)
+    logger.info(json.dumps(turn.as_dict(response, error)))
+
+
+def record_handler(handler, handler_input, seconds):
+    """Record the handler that ran in the current turn and its time.  Has
+       the signature of an intent router timing hook."""
+    turn = current_turn.get()
+    if turn is not None:
+        turn.handler = type(handler).__name__
+        turn.handler_seconds += seconds
+
+
+class StorageCall:
+    """Time one storage call and record it in the current turn.  Set
+       bytes_read and bytes_written before the call ends."""
+
+    __slots__ = ("operation", "bytes_read", "bytes_written", "started")
+
+    def __init__(self, operation):
+        """Construct a record of a call of the named S3 operation."""
+        self.operation = operation
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.started = time.perf_counter()
+
+
+@contextlib.contextmanager
+def storage_call(operation):
+    """Time the enclosed storage call as the named S3 operation."""
+    call = StorageCall(operation)
+    try:
+        yield call
+    finally:
+        turn = current_turn.get()
+        if turn is not None:
+            turn.add_storage_call(operation, time.perf_counter() - call.started, call.bytes_read, call.bytes_written)
+
+
+def storage_operation(operation, measure=None):
+    """Return a decorator recording each call of a storage function as the
+       named S3 operation.  measure(args, result) returns the (bytes read,
+       bytes written) of a call."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with storage_call(operation) as call:
+                result = function(*args, **kwargs)
+                if measure is not None:
+                    call.bytes_read, call.bytes_written = measure(args, result)
+                return result
+        return wrapper
+    return decorator
+
+
+class MetricsPersistenceAdapter(AbstractPersistenceAdapter):
+    """Persistence adapter recording the calls of another adapter as storage
+       calls."""
+
+    def __init__(self, adapter):
+        """Construct a wrapper around the given adapter."""
+        self.__adapter = adapter
+
+    def get_attributes(self, request_envelope):
+        """Return the persistent attributes of the request's user."""
+        with storage_call("GetObject") as call:
+            attributes = self.__adapter.get_attributes(request_envelope)
+            call.bytes_read = payload_size(attributes) if attributes else 0
+            return attributes
+
+    def save_attributes(self, request_envelope, attributes):
+        """Store the persistent attributes of the request's user."""
+        with storage_call("PutObject") as call:
+            call.bytes_written = payload_size(attributes)
+            return self.__adapter.save_attributes(request_envelope, attributes)
+
+    def delete_attributes(self, request_envelope):
+        """Delete the persistent attributes of the request's user."""
+        with storage_call("DeleteObject"):
+            return self.__adapter.delete_attributes(request_envelope)
+
+
+class MetricsRequestInterceptor(AbstractRequestInterceptor):
+    """Start the metrics of each turn.  Register before other request
+       interceptors."""
+
+    def process(self, handler_input):
+        """Start recording the metrics of the turn."""
+        start_turn(handler_input)
+
+
+class MetricsResponseInterceptor(AbstractResponseInterceptor):
+    """Log the metrics of each turn.  Register after other response
+       interceptors, so their storage calls are included."""
+
+    def process(self, handler_input, response):
+        """Log the metrics of the turn."""
+        end_turn(response)
+
+
+class MetricsExceptionHandler(AbstractExceptionHandler):
+    """Exception handler that runs another exception handler and logs the
+       metrics of the failed turn, as response interceptors do not run
+       when a handler raises."""
+
+    def __init__(self, handler):
+        """Construct a wrapper around the given exception handler."""
+        self.__handler = handler
+
+    def can_handle(self, handler_input, exception):
+        """Return true if the wrapped handler can handle the exception."""
+        return self.__handler.can_handle(handler_input, exception)
+
+    def handle(self, handler_input, exception):
+        """Run the wrapped handler and log the metrics of the turn."""
+        response = self.__handler.handle(handler_input, exception)
+        end_turn(response, exception)
+        return response
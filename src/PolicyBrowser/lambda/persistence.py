@@ -0,0 +1,142 @@
+# Session-cached, dirty-tracked persistent attributes.
+#
+# A user's persistent attributes are read from S3 once per session and then
+# carried in the session attributes, so later turns of the session do not
+# read S3 at all.  Handlers modify the attributes freely; at the end of each
+# turn SavePersistentAttributesInterceptor compares them with what was
+# loaded and only writes them back to S3 if a field actually changed, with at
+# most one write per turn.
+#
+# With write_behind enabled, changes are instead carried in the session and
+# written once, when the session is about to end (a response without a
+# reprompt, or a SessionEndedRequest).
+#
+# ## Example Usage:
+#
+# > attributes = PersistentAttributes.for_request(handler_input, {"lastSectionRead": -1}).data
+# > attributes["lastSectionRead"] = 3
+#
+# > sb.add_global_response_interceptor(SavePersistentAttributesInterceptor())
+
+import copy
+
+from ask_sdk_core.dispatch_components import AbstractResponseInterceptor
+
+SESSION_KEY = "persistentAttributes"
+DIRTY_KEY = "persistentAttributesDirty"
+REQUEST_KEY = "persistentAttributes"
+
+
+class PersistentAttributes:
+    """Represent the current user's persistent attributes for one turn."""
+
+    def __init__(self, handler_input):
+        """Load the persistent attributes for the given handler input, from
+           the session attributes if this session already loaded them and
+           from the persistence adapter otherwise."""
+        self.__attributes_manager = handler_input.attributes_manager
+        session_attributes = self.__attributes_manager.session_attributes
+
+        if SESSION_KEY in session_attributes:
+            self.__data = session_attributes[SESSION_KEY]
+            self.__dirty_fields = set(session_attributes.get(DIRTY_KEY, ()))
+        else:
+            self.__data = dict(self.__attributes_manager.persistent_attributes)
+            self.__dirty_fields = set()
+            session_attributes[SESSION_KEY] = self.__data
+
+        self.__loaded = copy.deepcopy(self.__data)
+
+    @classmethod
+    def for_request(cls, handler_input, defaults=None):
+        """Return the persistent attributes of the current request, loading
+           them on first use.  Fields missing from the attributes are set to
+           the given defaults, which does not count as a change."""
+        request_attributes = handler_input.attributes_manager.request_attributes
+        attributes = request_attributes.get(REQUEST_KEY)
+        if attributes is None:
+            attributes = request_attributes[REQUEST_KEY] = cls(handler_input)
+        if defaults:
+            attributes.__apply_defaults(defaults)
+        return attributes
+
+    def __apply_defaults(self, defaults):
+        """Set missing fields to the given defaults in both the attributes and
+           the copy they are compared against."""
+        for field, value in defaults.items():
+            if field not in self.__data:
+                self.__data[field] = copy.deepcopy(value)
+                if field not in self.__dirty_fields:
+                    self.__loaded[field] = copy.deepcopy(value)
+
+    @classmethod
+    def loaded_for_request(cls, handler_input):
+        """Return the persistent attributes of the current request, or None
+           if no handler has used them."""
+        return handler_input.attributes_manager.request_attributes.get(REQUEST_KEY)
+
+    @property
+    def data(self):
+        """Return the attributes as a dictionary that may be modified."""
+        return self.__data
+
+    @property
+    def dirty_fields(self):
+        """Return the names of the fields changed since they were last
+           saved."""
+        changed = {field for field in self.__data.keys() | self.__loaded.keys()
+                   if self.__data.get(field) != self.__loaded.get(field)}
+        return self.__dirty_fields | changed
+
+    def save(self, defer=False):
+        """Write the attributes to the persistence adapter if any field has
+           changed, or carry the changes in the session if defer is true.
+           Return true if a write was made."""
+        dirty_fields = self.dirty_fields
+        session_attributes = self.__attributes_manager.session_attributes
+
+        if defer or not dirty_fields:
+            self.__dirty_fields = dirty_fields
+            self.__loaded = copy.deepcopy(self.__data)
+            if dirty_fields:
+                session_attributes[DIRTY_KEY] = sorted(dirty_fields)
+            return False
+
+        self.__attributes_manager.persistent_attributes = self.__data
+        self.__attributes_manager.save_persistent_attributes()
+        self.__dirty_fields = set()
+        self.__loaded = copy.deepcopy(self.__data)
+        session_attributes.pop(DIRTY_KEY, None)
+        return True
+
+
+def is_session_ending(handler_input, response):
+    """Return true if the session ends with the given response."""
+    if handler_input.request_envelope.request.object_type == "SessionEndedRequest":
+        return True
+    if response is None:
+        return True
+    return bool(response.should_end_session) or response.reprompt is None
+
+
+class SavePersistentAttributesInterceptor(AbstractResponseInterceptor):
+    """Save the current user's persistent attributes at the end of a turn if
+       they were used and changed."""
+
+    def __init__(self, write_behind=False):
+        """Construct an interceptor that saves changes every turn, or only
+           when the session ends if write_behind is true."""
+        self.__write_behind = write_behind
+
+    def process(self, handler_input, response):
+        """Save the persistent attributes of the handled request."""
+        attributes = PersistentAttributes.loaded_for_request(handler_input)
+        if attributes is None:
+            # Changes deferred by earlier turns still have to be written when
+            # the session ends, even if this turn did not use the attributes.
+            if DIRTY_KEY not in handler_input.attributes_manager.session_attributes:
+                return
+            attributes = PersistentAttributes.for_request(handler_input)
+
+        defer = self.__write_behind and not is_session_ending(handler_input, response)
+        attributes.save(defer)
@@ -0,0 +1,198 @@
+# Content hashes and diffs between versions of a policy.
+#
+# Every policy gets a PolicyFingerprint when it is loaded: a short hash of
+# each atom's text, and for each top-level section a hash of its title and a
+# hash of everything in it.  Comparing the section hashes of two versions of
+# a policy tells which sections are unchanged (possibly moved), which were
+# changed and which are new, so a user's consent to the unchanged sections
+# can be carried forward and only the rest needs to be reviewed again.
+#
+# Hashes ignore differences in whitespace.
+#
+# ## Example Usage:
+#
+# > diff = PolicyDiff.between(old_policy.fingerprint, new_policy.fingerprint)
+# > diff.section_map      # {old section number: new section number}
+# > diff.needs_review     # new section numbers that were changed or added
+#
+# Report the differences between two policy files
+# > python policy_diff.py old_policy.xml policy.xml
+
+import argparse
+import hashlib
+
+HASH_SIZE = 8
+
+
+def atom_hash(text):
+    """Return the hash of an atom with the given text."""
+    return hashlib.blake2b(" ".join(text.split()).encode("utf-8"), digest_size=HASH_SIZE).digest()
+
+
+class PolicyFingerprint:
+    """Represent the content hashes of one version of a policy."""
+
+    def __init__(self, atom_hashes, section_hashes, title_hashes):
+        """Construct a fingerprint from the concatenated hashes of every atom
+           and the hex hashes of the contents and titles of each top-level
+           section (None for an untitled section)."""
+        self.__atom_hashes = atom_hashes
+        self.__section_hashes = section_hashes
+        self.__title_hashes = title_hashes
+
+    @classmethod
+    def from_policy(cls, policy):
+        """Compute the fingerprint of the given PrivacyPolicy."""
+        atom_hashes = b"".join(atom_hash(atom.text) for atom in policy.all_atoms)
+        section_hashes = []
+        title_hashes = []
+
+        for section in policy.sections:
+            atom_range = section.atom_range
+            contents = atom_hashes[atom_range.start * HASH_SIZE:atom_range.stop * HASH_SIZE]
+            section_hashes.append(hashlib.blake2b(contents, digest_size=HASH_SIZE).hexdigest())
+            if section.title is None:
+                title_hashes.append(None)
+            else:
+                title_start = atom_range.start * HASH_SIZE
+                title_hashes.append(atom_hashes[title_start:title_start + HASH_SIZE].hex())
+
+        return cls(atom_hashes, section_hashes, title_hashes)
+
+    def atom_hash(self, atom_index):
+        """Return the hex hash of the atom with the given index."""
+        start = atom_index * HASH_SIZE
+        if not 0 <= start < len(self.__atom_hashes):
+            raise IndexError(f"Atom {atom_index} is out of range.")
+        return self.__atom_hashes[start:start + HASH_SIZE].hex()
+
+    @property
+    def section_hashes(self):
+        """Return the hex hash of the contents of each top-level section."""
+        return self.__section_hashes
+
+    @property
+    def title_hashes(self):
+        """Return the hex hash of the title of each top-level section, or
+           None for sections without a title."""
+        return self.__title_hashes
+
+
+class PolicyDiff:
+    """Represent how the top-level sections of one version of a policy map
+       to those of another."""
+
+    def __init__(self, old_section_hashes, new_section_hashes, old_title_hashes=None, new_title_hashes=None):
+        """Compare two versions of a policy by their section hashes.  If the
+           title hashes of both versions are given, sections whose contents
+           changed are paired with their old versions by title."""
+        unmatched = {}
+        for new_number, section_hash in enumerate(new_section_hashes):
+            unmatched.setdefault(section_hash, []).append(new_number)
+
+        # Identical sections are paired in document order, so a section that
+        # appears twice keeps both of its acceptances.
+        self.__section_map = {}
+        for old_number, section_hash in enumerate(old_section_hashes):
+            candidates = unmatched.get(section_hash)
+            if candidates:
+                self.__section_map[old_number] = candidates.pop(0)
+
+        mapped = set(self.__section_map.values())
+        self.__needs_review = [new_number for new_number in range(len(new_section_hashes))
+                               if new_number not in mapped]
+
+        self.__changed = {}
+        if old_title_hashes is not None and new_title_hashes is not None:
+            titles = {}
+            for new_number in self.__needs_review:
+                if new_title_hashes[new_number] is not None:
+                    titles.setdefault(new_title_hashes[new_number], []).append(new_number)
+            for old_number, title_hash in enumerate(old_title_hashes):
+                candidates = titles.get(title_hash)
+                if old_number not in self.__section_map and candidates:
+                    self.__changed[old_number] = candidates.pop(0)
+
+        changed = set(self.__changed.values())
+        self.__added = [new_number for new_number in self.__needs_review if new_number not in changed]
+        self.__removed = [old_number for old_number in range(len(old_section_hashes))
+                          if old_number not in self.__section_map and old_number not in self.__changed]
+
+    @classmethod
+    def between(cls, old_fingerprint, new_fingerprint):
+        """Return the diff between two PolicyFingerprints."""
+        return cls(old_fingerprint.section_hashes, new_fingerprint.section_hashes,
+                   old_fingerprint.title_hashes, new_fingerprint.title_hashes)
+
+    @property
+    def section_map(self):
+        """Return a map of old section numbers to the new section numbers of
+           the sections that did not change."""
+        return self.__section_map
+
+    @property
+    def changed(self):
+        """Return a map of old section numbers to the new section numbers of
+           the sections that kept their title but changed their contents."""
+        return self.__changed
+
+    @property
+    def added(self):
+        """Return the new section numbers of sections with no old version."""
+        return self.__added
+
+    @property
+    def removed(self):
+        """Return the old section numbers of sections with no new version."""
+        return self.__removed
+
+    @property
+    def needs_review(self):
+        """Return the new section numbers of the sections that were changed
+           or added."""
+        return self.__needs_review
+
+    def is_unchanged(self):
+        """Return true if every section is unchanged and in the same place."""
+        return (not self.__needs_review and not self.__removed
+                and all(old_number == new_number for old_number, new_number in self.__section_map.items()))
+
+    def carry_forward(self, accepted):
+        """Return the bitset of new sections accepted, given the bitset of
+           old sections accepted.  Only unchanged sections stay accepted."""
+        carried = 0
+        for old_number, new_number in self.__section_map.items():
+            if accepted >> old_number & 1:
+                carried |= 1 << new_number
+        return carried
+
+
+def main():
+    from privacy_policy import PrivacyPolicy
+
+    parser = argparse.ArgumentParser(description="Report the differences between two versions of a policy.")
+    parser.add_argument("old_file", help="old policy XML or snapshot file")
+    parser.add_argument("new_file", help="new policy XML or snapshot file")
+    args = parser.parse_args()
+
+    old_policy = PrivacyPolicy(args.old_file)
+    new_policy = PrivacyPolicy(args.new_file)
+    diff = PolicyDiff.between(old_policy.fingerprint, new_policy.fingerprint)
+
+    def title(policy, number):
+        section = policy.sections[number]
+        return section.title.text if section.title is not None else "(untitled)"
+
+    print(f"{old_policy.date} -> {new_policy.date}")
+    for old_number, new_number in sorted(diff.section_map.items()):
+        print(f"  unchanged {old_number + 1} -> {new_number + 1}: {title(new_policy, new_number)}")
+    for old_number, new_number in sorted(diff.changed.items()):
+        print(f"  changed   {old_number + 1} -> {new_number + 1}: {title(new_policy, new_number)}")
+    for new_number in diff.added:
+        print(f"  added     {new_number + 1}: {title(new_policy, new_number)}")
+    for old_number in diff.removed:
+        print(f"  removed   {old_number + 1}: {title(old_policy, old_number)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+# Registry of the policies a PolicyBrowser skill can serve.
+#
+# Policies are looked up by id (the file name of the policy without its
+# extension), loaded the first time they are requested and kept in a bounded
+# least recently used cache, so a warm container can serve many companies'
+# policies without reparsing them.  A cached policy is only revalidated
+# against its source once revalidate_after seconds have passed, and S3
+# revalidation uses a conditional request so an unchanged policy is never
+# downloaded twice.  Ids no source has are remembered for as long, so
+# requests for an unknown or removed policy do not query every source each
+# time.
+#
+# ## Example Usage:
+#
+# Serve policies bundled with the skill, then policies uploaded to the
+# persistence bucket under Media/policies/
+# > registry = PolicyRegistry([LocalPolicySource(os.path.dirname(__file__)),
+# >                            S3PolicySource(os.environ["S3_PERSISTENCE_BUCKET"])])
+# > policy = registry.get("policy")
+
+import collections
+import io
+import logging
+import os
+import re
+import time
+
+import policy_snapshot
+from privacy_policy import PrivacyPolicy
+
+logger = logging.getLogger(__name__)
+
+POLICY_ID_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+# Returned by a policy source when the cached copy of a policy is current.
+NOT_MODIFIED = object()
+
+
+class LocalPolicySource:
+    """Load policies from XML or snapshot files in a local directory."""
+
+    def __init__(self, directory):
+        """Construct a source for the policy files in the given directory."""
+        self.__directory = directory
+
+    def fetch(self, policy_id, validator, compact):
+        """Return a (policy, validator) tuple for the given policy id, None if
+           the directory has no such policy or NOT_MODIFIED if the validator
+           of the cached copy is still current."""
+        for suffix in (".xml", policy_snapshot.SNAPSHOT_SUFFIX):
+            path = os.path.join(self.__directory, policy_id + suffix)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+
+            current_validator = (path, stat.st_mtime_ns, stat.st_size)
+            if current_validator == validator:
+                return NOT_MODIFIED
+            return PrivacyPolicy(path, compact=compact), current_validator
+
+        return None
+
+
+class S3PolicySource:
+    """Load policy snapshot or XML objects from an S3 bucket."""
+
+    def __init__(self, bucket_name, prefix="Media/policies/", client=None):
+        """Construct a source for the policy objects under the given prefix.
+           A boto3 S3 client is created on first use if none is given."""
+        self.__bucket_name = bucket_name
+        self.__prefix = prefix
+        self.__client = client
+
+    @property
+    def client(self):
+        """Return the S3 client used by this source."""
+        if self.__client is None:
+            import boto3
+            self.__client = boto3.client("s3")
+        return self.__client
+
+    def fetch(self, policy_id, validator, compact):
+        """Return a (policy, validator) tuple for the given policy id, None if
+           the bucket has no such policy or NOT_MODIFIED if the ETag of the
+           cached copy is still current."""
+        from botocore.exceptions import ClientError
+
+        if validator is not None:
+            key, etag = validator
+            try:
+                response = self.client.get_object(Bucket=self.__bucket_name, Key=key, IfNoneMatch=etag)
+                return self.__load(key, response, compact)
+            except ClientError as e:
+                code = e.response["Error"]["Code"]
+                if code in ("304", "NotModified"):
+                    return NOT_MODIFIED
+                if code not in ("404", "NoSuchKey"):
+                    raise
+
+        for suffix in (policy_snapshot.SNAPSHOT_SUFFIX, ".xml"):
+            key = self.__prefix + policy_id + suffix
+            try:
+                response = self.client.get_object(Bucket=self.__bucket_name, Key=key)
+            except ClientError as e:
+                if e.response["Error"]["Code"] in ("404", "NoSuchKey"):
+                    continue
+                raise
+            return self.__load(key, response, compact)
+
+        return None
+
+    def __load(self, key, response, compact):
+        """Return a (policy, validator) tuple for a get_object response."""
+        policy = PrivacyPolicy(io.BytesIO(response["Body"].read()), compact=compact)
+        return policy, (key, response["ETag"])
+
+
+class _RegistryEntry:
+    """Represent a cached policy and where it was loaded from."""
+
+    __slots__ = ("policy", "source", "validator", "checked_at")
+
+    def __init__(self, policy, source, validator, checked_at):
+        """Construct an entry for a policy loaded from the given source."""
+        self.policy = policy
+        self.source = source
+        self.validator = validator
+        self.checked_at = checked_at
+
+
+class PolicyRegistry:
+    """Resolve policy ids to PrivacyPolicy objects, keeping the most recently
+       used policies in memory."""
+
+    def __init__(self, sources, max_policies=16, revalidate_after=300, compact=True, clock=time.monotonic,
+                 on_load=None):
+        """Construct a registry that loads policies from the first of the
+           given sources that has them, caches up to max_policies of them and
+           revalidates a cached policy once it is revalidate_after seconds
+           old.  Policies are loaded with compact atom storage unless compact
+           is False.  If given, on_load(policy_id, policy) is called whenever
+           a policy is loaded or reloaded."""
+        self.__sources = sources
+        self.__max_policies = max_policies
+        self.__revalidate_after = revalidate_after
+        self.__compact = compact
+        self.__clock = clock
+        self.__on_load = on_load
+        self.__entries = collections.OrderedDict()
+        # Ids come from users, so the ids remembered as missing are bounded too
+        self.__misses = collections.OrderedDict()
+        self.__max_misses = max(max_policies, 256)
+
+    def get(self, policy_id):
+        """Return the policy with the given id.  Raises KeyError if the id is
+           invalid or no source had a policy with that id when last checked,
+           within revalidate_after seconds."""
+        if not POLICY_ID_PATTERN.match(policy_id):
+            raise KeyError(policy_id)
+
+        now = self.__clock()
+        missed_at = self.__misses.get(policy_id)
+        if missed_at is not None:
+            if now - missed_at < self.__revalidate_after:
+                raise KeyError(policy_id)
+            del self.__misses[policy_id]
+
+        entry = self.__entries.get(policy_id)
+
+        if entry is not None:
+            self.__entries.move_to_end(policy_id)
+            if now - entry.checked_at < self.__revalidate_after:
+                return entry.policy
+
+            result = entry.source.fetch(policy_id, entry.validator, self.__compact)
+            if result is NOT_MODIFIED:
+                entry.checked_at = now
+                return entry.policy
+            if result is not None:
+                entry.policy, entry.validator = result
+                entry.checked_at = now
+                logger.info("Reloaded policy %s", policy_id)
+                self.__loaded(policy_id, entry.policy)
+                return entry.policy
+
+            # The policy was removed from its source; look for it elsewhere.
+            del self.__entries[policy_id]
+
+        for source in self.__sources:
+            result = source.fetch(policy_id, None, self.__compact)
+            if result is not None:
+                policy, validator = result
+                self.__entries[policy_id] = _RegistryEntry(policy, source, validator, now)
+                if len(self.__entries) > self.__max_policies:
+                    self.__entries.popitem(last=False)
+                logger.info("Loaded policy %s", policy_id)
+                self.__loaded(policy_id, policy)
+                return policy
+
+        self.__misses[policy_id] = now
+        if len(self.__misses) > self.__max_misses:
+            self.__misses.popitem(last=False)
+        raise KeyError(policy_id)
+
+    def __loaded(self, policy_id, policy):
+        """Call the load hook, if any, for a newly loaded policy."""
+        if self.__on_load is not None:
+            self.__on_load(policy_id, policy)
+
+    def __contains__(self, policy_id):
+        """Return true if the policy with the given id is cached."""
+        return policy_id in self.__entries
+
+    def __len__(self):
+        """Return the number of cached policies."""
+        return len(self.__entries)
@@ -0,0 +1,110 @@
+# Full-text search over the atoms of a policy.
+#
+# A PolicySearchIndex is an inverted index from each term to the atoms that
+# contain it, ranked with BM25 so that a spoken topic ("the part about
+# cookies") can be resolved to the best matching title or paragraph without
+# scanning the policy.  Policies build their index the first time it is
+# used, or load it from their snapshot (see policy_snapshot).
+#
+# Terms are lower case words with stop words removed and plurals folded
+# ("cookies" and "cookie" are the same term).
+#
+# ## Example Usage:
+#
+# > index = policy.search_index
+# > for atom_index, score in index.search("cookies", limit=3):
+# >     print(score, policy.all_atoms[atom_index])
+
+import array
+import math
+import re
+
+# BM25 term frequency saturation and document length normalization.
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+    a about an and are as at be by can do does for from has have how i if in
+    is it its me my not of on or our part say says that the their this to us
+    we what when where which who will with you your
+""".split())
+
+
+def normalize_term(word):
+    """Return the term for the given lower case word, with plurals folded."""
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        word = word[:-1]
+    if word.endswith("ie"):
+        word = word[:-2] + "y"
+    return word
+
+
+def tokenize(text):
+    """Return the list of terms in the given text."""
+    return [normalize_term(word) for word in WORD_PATTERN.findall(text.lower()) if word not in STOP_WORDS]
+
+
+class PolicySearchIndex:
+    """Represent an inverted index over the atoms of a policy."""
+
+    def __init__(self, atom_lengths, postings):
+        """Construct an index from the number of terms in each atom and a map
+           of each term to its (atom indices, term frequencies) arrays, with
+           atom indices in ascending order."""
+        self.__atom_lengths = atom_lengths
+        self.__postings = postings
+        self.__average_length = (sum(atom_lengths) / len(atom_lengths)) if atom_lengths else 0
+
+    @classmethod
+    def from_texts(cls, texts):
+        """Build an index over the given atom texts, in atom index order."""
+        atom_lengths = array.array("I")
+        postings = {}
+
+        for atom_index, text in enumerate(texts):
+            terms = tokenize(text)
+            atom_lengths.append(len(terms))
+            frequencies = {}
+            for term in terms:
+                frequencies[term] = frequencies.get(term, 0) + 1
+            for term, frequency in frequencies.items():
+                posting = postings.get(term)
+                if posting is None:
+                    posting = postings[term] = (array.array("I"), array.array("I"))
+                posting[0].append(atom_index)
+                posting[1].append(frequency)
+
+        return cls(atom_lengths, postings)
+
+    @property
+    def atom_lengths(self):
+        """Return the number of terms in each atom."""
+        return self.__atom_lengths
+
+    @property
+    def postings(self):
+        """Return the map of each term to its (atom indices, term
+           frequencies) arrays."""
+        return self.__postings
+
+    def search(self, query, limit=5):
+        """Return up to limit (atom index, score) tuples for the atoms that
+           best match the given query, best match first."""
+        atom_count = len(self.__atom_lengths)
+        scores = {}
+
+        for term in set(tokenize(query)):
+            posting = self.__postings.get(term)
+            if posting is None:
+                continue
+            atom_indices, frequencies = posting
+            idf = math.log(1 + (atom_count - len(atom_indices) + 0.5) / (len(atom_indices) + 0.5))
+            for atom_index, frequency in zip(atom_indices, frequencies):
+                length_ratio = self.__atom_lengths[atom_index] / self.__average_length
+                weight = frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * (1 - BM25_B + BM25_B * length_ratio))
+                scores[atom_index] = scores.get(atom_index, 0) + idf * weight
+
+        # Ties go to the earlier atom, so a title beats the paragraphs under it.
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
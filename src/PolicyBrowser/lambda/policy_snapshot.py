@@ -0,0 +1,363 @@
+# Compiled policy snapshots.
+#
+# Parsing the policy XML with xmltodict and rebuilding every section and atom
+# from the resulting dictionaries is the most expensive part of a cold start.
+# A snapshot is the same policy flattened into tables (atoms, section ranges,
+# title map, table of contents string and search index) and stored in a
+# versioned, checksummed binary file that can be loaded with a single read.
+#
+# ## Example Usage:
+#
+# Compile a snapshot next to the policy XML (writes policy.snapshot)
+# > python policy_snapshot.py policy.xml
+#
+# PrivacyPolicy picks the snapshot up automatically.  The XML file is parsed
+# instead when the snapshot is missing, corrupt, written in an unsupported
+# format version or compiled from different XML.  The XML is only hashed to
+# check this when its size or modification time differ from those recorded
+# at compile time.
+# > policy = PrivacyPolicy("policy.xml")
+#
+# ## File Layout:
+#
+# All integers are little endian.
+#
+# header:  magic "PPSN", format version (u16), SHA-256 of the source XML,
+#          source XML size (u64) and modification time in nanoseconds (i64),
+#          payload length (u32), CRC-32 of the payload (u32)
+# payload: atom, section and title counts (u32 each)
+#          date, url and table of contents strings (u32 length + UTF-8)
+#          atom table:    kind (u8), section index, text offset, text length
+#          section table: parent index (i32, -1 for the root), first atom,
+#                         end atom, paragraph count, has title (u8)
+#          title map:     atom index of each title_map entry
+#          search index:  number of terms in each atom (u32), then for each
+#                         term its UTF-8 string (u32 length + UTF-8),
+#                         posting count (u32), atom indices (u32 each) and
+#                         term frequencies (u32 each)
+#          text buffer:   UTF-8 text of every atom, back to back
+
+import argparse
+import array
+import hashlib
+import logging
+import os
+import struct
+import sys
+import zlib
+
+from policy_search import PolicySearchIndex
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"PPSN"
+SNAPSHOT_VERSION = 3
+SNAPSHOT_SUFFIX = ".snapshot"
+
+ATOM_TITLE = 0
+ATOM_PARAGRAPH = 1
+
+_HEADER = struct.Struct("<4sH32sQqII")
+_COUNTS = struct.Struct("<IIII")
+_LENGTH = struct.Struct("<I")
+_ATOM = struct.Struct("<BIII")
+_SECTION = struct.Struct("<iIIIB")
+_TITLE = struct.Struct("<I")
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot is corrupt or in an unsupported format."""
+
+
+class PolicySnapshot:
+    """Represent the flattened contents of a policy."""
+
+    def __init__(self, date, url, toc_string, atoms, sections, title_indices, source_digest=None,
+                 search_index=None, source_stat=None):
+        """Construct a snapshot from its tables.  atoms is a list of
+           (kind, section index, text) tuples in atom index order, sections a
+           list of (parent index, first atom, end atom, paragraph count,
+           has title) tuples in document order and title_indices the atom
+           index of each title_map entry.  source_stat is the (size,
+           modification time in nanoseconds) of the XML the snapshot was
+           compiled from.  The search index is built from the atoms if none
+           is given."""
+        self.date = date
+        self.url = url
+        self.toc_string = toc_string
+        self.atoms = atoms
+        self.sections = sections
+        self.title_indices = title_indices
+        self.source_digest = source_digest
+        self.source_stat = source_stat
+        if search_index is None:
+            search_index = PolicySearchIndex.from_texts(text for _, _, text in atoms)
+        self.search_index = search_index
+
+    @classmethod
+    def from_policy(cls, policy, source_digest=None, source_stat=None):
+        """Flatten the given PrivacyPolicy into a snapshot."""
+        atoms = []
+        sections = []
+
+        def flatten(section, parent_index):
+            section_index = len(sections)
+            first_atom = len(atoms)
+            sections.append(None)
+
+            if section.title is not None:
+                atoms.append((ATOM_TITLE, section_index, section.title.text))
+            for paragraph in section.paragraphs:
+                atoms.append((ATOM_PARAGRAPH, section_index, paragraph.text))
+            for subsection in section.subsections:
+                flatten(subsection, section_index)
+
+            sections[section_index] = (parent_index, first_atom, len(atoms),
+                                       len(section.paragraphs), section.title is not None)
+
+        flatten(policy.root_section, -1)
+        title_indices = [title.atom_index for title in policy.title_map.values()]
+
+        return cls(policy.date, policy.url, policy.toc_string, atoms, sections,
+                   title_indices, source_digest, policy.search_index, source_stat)
+
+    def replay(self, builder):
+        """Rebuild the sections and atoms of this snapshot with the given
+           PrivacyPolicyBuilder."""
+        atoms = self.atoms
+        open_sections = []
+
+        for section_index, (parent_index, first_atom, end_atom, paragraph_count, has_title) in enumerate(self.sections):
+            while open_sections and open_sections[-1] != parent_index:
+                open_sections.pop()
+                builder.end_section()
+
+            builder.begin_section(atoms[first_atom][2] if has_title else None)
+            first_paragraph = first_atom + 1 if has_title else first_atom
+            for atom_index in range(first_paragraph, first_paragraph + paragraph_count):
+                builder.add_paragraph(atoms[atom_index][2])
+            open_sections.append(section_index)
+
+        for _ in open_sections:
+            builder.end_section()
+
+    def to_bytes(self):
+        """Return this snapshot in its binary file format."""
+        text_buffer = bytearray()
+        atom_table = bytearray()
+        for kind, section_index, text in self.atoms:
+            encoded = text.encode("utf-8")
+            atom_table += _ATOM.pack(kind, section_index, len(text_buffer), len(encoded))
+            text_buffer += encoded
+
+        postings = self.search_index.postings
+        payload = bytearray(_COUNTS.pack(len(self.atoms), len(self.sections), len(self.title_indices), len(postings)))
+        for string in (self.date, self.url, self.toc_string):
+            encoded = string.encode("utf-8")
+            payload += _LENGTH.pack(len(encoded)) + encoded
+        payload += atom_table
+        for section in self.sections:
+            payload += _SECTION.pack(*section)
+        for atom_index in self.title_indices:
+            payload += _TITLE.pack(atom_index)
+        payload += _u32_array_bytes(self.search_index.atom_lengths)
+        for term, (atom_indices, frequencies) in postings.items():
+            encoded = term.encode("utf-8")
+            payload += _LENGTH.pack(len(encoded)) + encoded + _LENGTH.pack(len(atom_indices))
+            payload += _u32_array_bytes(atom_indices) + _u32_array_bytes(frequencies)
+        payload += text_buffer
+
+        size, mtime_ns = self.source_stat or (0, 0)
+        header = _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, self.source_digest or bytes(32),
+                              size, mtime_ns, len(payload), zlib.crc32(payload))
+        return header + payload
+
+    @classmethod
+    def from_bytes(cls, data):
+        """Parse a snapshot from its binary file format.  Raises SnapshotError
+           if the data is corrupt or written in another format version."""
+        if len(data) < _HEADER.size:
+            raise SnapshotError("Snapshot header is truncated.")
+
+        magic, version, source_digest, size, mtime_ns, length, checksum = _HEADER.unpack_from(data)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotError("Not a policy snapshot.")
+        if version != SNAPSHOT_VERSION:
+            raise SnapshotError(f"Unsupported snapshot format version {version}.")
+        source_stat = (size, mtime_ns) if size or mtime_ns else None
+
+        payload = memoryview(data)[_HEADER.size:]
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise SnapshotError("Snapshot checksum does not match its contents.")
+
+        try:
+            atom_count, section_count, title_count, term_count = _COUNTS.unpack_from(payload)
+            offset = _COUNTS.size
+
+            strings = []
+            for _ in range(3):
+                (string_length,) = _LENGTH.unpack_from(payload, offset)
+                offset += _LENGTH.size
+                strings.append(str(payload[offset:offset + string_length], "utf-8"))
+                offset += string_length
+            date, url, toc_string = strings
+
+            atom_table = payload[offset:offset + atom_count * _ATOM.size]
+            offset += atom_count * _ATOM.size
+            section_table = payload[offset:offset + section_count * _SECTION.size]
+            offset += section_count * _SECTION.size
+            title_table = payload[offset:offset + title_count * _TITLE.size]
+            offset += title_count * _TITLE.size
+
+            atom_lengths = _u32_array(payload[offset:offset + atom_count * _LENGTH.size])
+            offset += atom_count * _LENGTH.size
+            postings = {}
+            for _ in range(term_count):
+                (term_length,) = _LENGTH.unpack_from(payload, offset)
+                offset += _LENGTH.size
+                term = str(payload[offset:offset + term_length], "utf-8")
+                offset += term_length
+                (posting_count,) = _LENGTH.unpack_from(payload, offset)
+                offset += _LENGTH.size
+                atom_indices = _u32_array(payload[offset:offset + posting_count * _LENGTH.size])
+                offset += posting_count * _LENGTH.size
+                frequencies = _u32_array(payload[offset:offset + posting_count * _LENGTH.size])
+                offset += posting_count * _LENGTH.size
+                postings[term] = (atom_indices, frequencies)
+
+            text_buffer = payload[offset:]
+
+            atoms = [(kind, section_index, str(text_buffer[start:start + text_length], "utf-8"))
+                     for kind, section_index, start, text_length in _ATOM.iter_unpack(atom_table)]
+            sections = [(parent_index, first_atom, end_atom, paragraph_count, bool(has_title))
+                        for parent_index, first_atom, end_atom, paragraph_count, has_title
+                        in _SECTION.iter_unpack(section_table)]
+            title_indices = [atom_index for (atom_index,) in _TITLE.iter_unpack(title_table)]
+        except (struct.error, UnicodeDecodeError, ValueError) as e:
+            raise SnapshotError(f"Snapshot payload is malformed: {e}")
+
+        return cls(date, url, toc_string, atoms, sections, title_indices, source_digest,
+                   PolicySearchIndex(atom_lengths, postings), source_stat)
+
+
+def _u32_array_bytes(values):
+    """Return the given array of unsigned 32 bit integers as little endian
+       bytes."""
+    values = array.array("I", values)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values.tobytes()
+
+
+def _u32_array(data):
+    """Return an array of the unsigned 32 bit integers in the given little
+       endian bytes.  Raises ValueError if the data is truncated."""
+    values = array.array("I")
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+def snapshot_path_for(xml_file):
+    """Return the snapshot file path that belongs to the given XML file."""
+    return os.path.splitext(xml_file)[0] + SNAPSHOT_SUFFIX
+
+
+def source_digest(xml_file):
+    """Return the SHA-256 digest of the given XML file's contents."""
+    with open(xml_file, "rb") as file:
+        return hashlib.sha256(file.read()).digest()
+
+
+def source_stat(xml_file):
+    """Return the (size, modification time in nanoseconds) of the given XML
+       file."""
+    stat = os.stat(xml_file)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def is_stale(snapshot, xml_file):
+    """Return True if the given snapshot was not compiled from the current
+       contents of the given XML file.  The XML is only hashed when its size
+       or modification time differ from those the snapshot records, as they
+       do after a copy that does not preserve modification times."""
+    if snapshot.source_stat is not None and snapshot.source_stat == source_stat(xml_file):
+        return False
+    return snapshot.source_digest != source_digest(xml_file)
+
+
+def read_snapshot(snapshot_file):
+    """Read the snapshot stored in the given file."""
+    with open(snapshot_file, "rb") as file:
+        return PolicySnapshot.from_bytes(file.read())
+
+
+def find_snapshot(file):
+    """Return the snapshot to load for the given XML or snapshot file path,
+       or None if the XML file should be parsed instead.  file may also be a
+       seekable binary file object, which is left at its start if it holds
+       XML rather than a snapshot."""
+    if not isinstance(file, str):
+        magic = file.read(len(SNAPSHOT_MAGIC))
+        if magic != SNAPSHOT_MAGIC:
+            file.seek(0)
+            return None
+        return PolicySnapshot.from_bytes(magic + file.read())
+
+    if file.endswith(SNAPSHOT_SUFFIX):
+        return read_snapshot(file)
+
+    snapshot_file = snapshot_path_for(file)
+    if not os.path.exists(snapshot_file):
+        return None
+
+    try:
+        snapshot = read_snapshot(snapshot_file)
+    except (OSError, SnapshotError) as e:
+        logger.warning("Ignoring snapshot %s: %s", snapshot_file, e)
+        return None
+
+    if os.path.exists(file) and is_stale(snapshot, file):
+        logger.info("Ignoring stale snapshot %s", snapshot_file)
+        return None
+
+    return snapshot
+
+
+def compile_snapshot(xml_file, snapshot_file=None):
+    """Compile the given policy XML file into a snapshot and return the path
+       of the written snapshot file."""
+    from privacy_policy import PrivacyPolicy
+
+    if snapshot_file is None:
+        snapshot_file = snapshot_path_for(xml_file)
+
+    policy = PrivacyPolicy(xml_file, use_snapshot=False)
+    snapshot = PolicySnapshot.from_policy(policy, source_digest(xml_file), source_stat(xml_file))
+
+    # Write to a temporary file first so a running loader never sees a
+    # partially written snapshot.
+    temp_file = snapshot_file + ".tmp"
+    with open(temp_file, "wb") as file:
+        file.write(snapshot.to_bytes())
+    os.replace(temp_file, snapshot_file)
+
+    return snapshot_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compile policy XML files into snapshots.")
+    parser.add_argument("xml_files", nargs="+", help="policy XML files to compile")
+    parser.add_argument("-o", "--output", help="snapshot path (only valid with a single XML file)")
+    args = parser.parse_args()
+
+    if args.output and len(args.xml_files) > 1:
+        parser.error("--output can only be used with a single XML file")
+
+    for xml_file in args.xml_files:
+        print(compile_snapshot(xml_file, args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,11 @@
-import xmltodict
-import itertools
+import array
+import collections.abc
+from xml.etree import ElementTree
+
+import policy_snapshot
+from policy_diff import PolicyFingerprint
+from policy_search import PolicySearchIndex
+from title_index import TitleIndex
 
 # Classes used for representing & accessing privacy policy data.
 #
@@ -32,10 +38,34 @@ import itertools
 # > while start_reading_index <= stop_reading_index:
 # >    print(policy.all_atoms[start_reading_index])
 # >    start_reading_index += 1
+#
+# Load a compiled snapshot of the policy instead of parsing its XML (see the
+# policy_snapshot module).  This happens automatically when policy.snapshot
+# exists next to policy.xml and was compiled from the current XML.
+# > policy = PrivacyPolicy("policy.snapshot")
+#
+# Build the policy with the legacy xmltodict loader rather than streaming it
+# > policy = PrivacyPolicy("policy.xml", use_snapshot=False, streaming=False)
+#
+# Find the atoms that best match a topic (see the policy_search module)
+# > for atom_index, score in policy.search_index.search("cookies"):
+# >    print(policy.all_atoms[atom_index])
+#
+# Find the titles that best match a spoken section name (see the title_index
+# module)
+# > for title, score in policy.title_index.lookup("personal information"):
+# >    print(title)
+#
+# Store the policy's atoms compactly, for keeping many policies in memory.
+# Atoms are then created on demand and are equal, but not identical, each
+# time they are accessed.
+# > policy = PrivacyPolicy("policy.xml", compact=True)
 
 
 class PrivacyPolicyAtom:
     """Represent a title or paragraph within a policy."""
+
+    __slots__ = ("__parent_section", "__text", "__atom_index")
     
     def __init__(self, parent_section, text, atom_index):
         """Construct an atom with the specified parent section, text contents
@@ -51,11 +81,9 @@ class PrivacyPolicyAtom:
 
     def has_as_parent(self, parent_section):
         """Return true if this atom is part of the given parent section."""
-        if parent_section is self.__parent_section:
+        if parent_section is None:
             return True
-        if self.__parent_section is None:
-            return False
-        return self.__parent_section.has_as_parent(parent_section)
+        return self.__atom_index in parent_section.atom_range
 
     @property
     def text(self):
@@ -75,6 +103,8 @@ class PrivacyPolicyAtom:
 class PrivacyPolicyTitle(PrivacyPolicyAtom):
     """Represent a title within a policy."""
 
+    __slots__ = ()
+
     def __init__(self, parent_section, text, atom_index):
         """Construct a title with the specified parent section, text contents
            and index within the policy."""
@@ -84,67 +114,297 @@ class PrivacyPolicyTitle(PrivacyPolicyAtom):
 class PrivacyPolicyParagraph(PrivacyPolicyAtom):
     """Represent a paragraph within a policy."""
 
+    __slots__ = ()
+
     def __init__(self, parent_section, text, atom_index):
         """Construct a paragraph with the specified parent section, text
            contents and index within the policy."""
         super().__init__(parent_section, text, atom_index)
 
 
-class PrivacyPolicySection:
-    """Represent a root section, section or subsection within a policy."""
-    
-    def __init__(self, parent_section, section_dict, starting_index):
-        """Construct a policy section and its child sections/atoms with the
-           specified parent and starting index.  Uses section_dict dictionary
-           dumped by xmltodict from policy XML file."""
-        title = section_dict.get("title")
-        if title:
-            self.__title = PrivacyPolicyTitle(self, title, starting_index)
-            starting_index += 1
+class PolicyAtomList(list):
+    """Store the atoms of a policy as a list of atom objects."""
+
+    def __init__(self):
+        """Construct an empty atom list."""
+        super().__init__()
+        self.titles = []
+
+    def add_section(self, section):
+        """Register a section whose atoms will be added to this list."""
+
+    def add_atom(self, kind, parent_section, text):
+        """Append a title or paragraph with the specified parent section and
+           text contents."""
+        if kind == policy_snapshot.ATOM_TITLE:
+            atom = PrivacyPolicyTitle(parent_section, text, len(self))
+            self.titles.append(atom)
         else:
-            self.__title = None
+            atom = PrivacyPolicyParagraph(parent_section, text, len(self))
+        self.append(atom)
 
-        self.__parent_section = parent_section
-        self.__paragraphs = []
-        self.__subsections = []
 
-        paragraphs = section_dict.get("paragraph")
+class CompactPolicyAtom:
+    """Represent a title or paragraph stored in a CompactAtomStore.  Has the
+       same properties as PrivacyPolicyAtom, but reads them from the store
+       when they are accessed."""
+
+    __slots__ = ("__store", "__atom_index")
+
+    def __init__(self, store, atom_index):
+        """Construct an atom referring to the given index within the store."""
+        self.__store = store
+        self.__atom_index = atom_index
+
+    @property
+    def parent_section(self):
+        """Return the parent section of this atom."""
+        return self.__store.parent_section_at(self.__atom_index)
+
+    def has_as_parent(self, parent_section):
+        """Return true if this atom is part of the given parent section."""
+        if parent_section is None:
+            return True
+        return self.__atom_index in parent_section.atom_range
+
+    @property
+    def text(self):
+        """Return the text contents of this atom."""
+        return self.__store.text_at(self.__atom_index)
+
+    @property
+    def atom_index(self):
+        """Return the index of this atom within the policy."""
+        return self.__atom_index
+
+    def __eq__(self, other):
+        """Return true if other refers to the same atom of the same store."""
+        if not isinstance(other, CompactPolicyAtom):
+            return NotImplemented
+        return self.__store is other.__store and self.__atom_index == other.__atom_index
+
+    def __hash__(self):
+        """Return a hash of the store and index this atom refers to."""
+        return hash((id(self.__store), self.__atom_index))
+
+    def __repr__(self):
+        """Return the text contents of this atom."""
+        return self.text
+
+
+class CompactPolicyTitle(CompactPolicyAtom):
+    """Represent a title stored in a CompactAtomStore."""
+
+    __slots__ = ()
+
+
+class CompactPolicyParagraph(CompactPolicyAtom):
+    """Represent a paragraph stored in a CompactAtomStore."""
+
+    __slots__ = ()
+
+
+class CompactAtomStore(collections.abc.Sequence):
+    """Store the atoms of a policy as parallel arrays over one UTF-8 text
+       buffer.  Atom objects are only created when an atom is accessed, so a
+       resident policy costs a few bytes per atom plus its text."""
+
+    def __init__(self):
+        """Construct an empty atom store."""
+        self.__text = bytearray()
+        self.__offsets = array.array("I")
+        self.__lengths = array.array("I")
+        self.__kinds = array.array("B")
+        self.__parents = array.array("I")
+        self.__title_indices = array.array("I")
+        self.__sections = []
+        self.titles = _AtomIndexList(self, self.__title_indices)
+
+    def add_section(self, section):
+        """Register a section whose atoms will be added to this store.
+           Sections must be added in document order."""
+        self.__sections.append(section)
+
+    def add_atom(self, kind, parent_section, text):
+        """Append a title or paragraph with the specified parent section and
+           text contents."""
+        encoded = text.encode("utf-8")
+        if kind == policy_snapshot.ATOM_TITLE:
+            self.__title_indices.append(len(self.__kinds))
+        self.__offsets.append(len(self.__text))
+        self.__lengths.append(len(encoded))
+        self.__kinds.append(kind)
+        self.__parents.append(parent_section.section_index)
+        self.__text += encoded
+
+    def text_at(self, atom_index):
+        """Return the text contents of the atom with the specified index."""
+        offset = self.__offsets[atom_index]
+        return self.__text[offset:offset + self.__lengths[atom_index]].decode("utf-8")
+
+    def parent_section_at(self, atom_index):
+        """Return the parent section of the atom with the specified index."""
+        return self.__sections[self.__parents[atom_index]]
+
+    def __len__(self):
+        """Return the number of atoms in this store."""
+        return len(self.__kinds)
+
+    def __getitem__(self, index):
+        """Return the atom (or list of atoms for a slice) at the given
+           index."""
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self.__kinds)
+        if self.__kinds[index] == policy_snapshot.ATOM_TITLE:
+            return CompactPolicyTitle(self, index)
+        return CompactPolicyParagraph(self, index)
+
+
+class _AtomIndexList(collections.abc.Sequence):
+    """Represent the atoms at the given indices of a policy's atom list or
+       CompactAtomStore as a sequence of atoms."""
+
+    __slots__ = ("__atoms", "__atom_indices")
+
+    def __init__(self, atoms, atom_indices):
+        """Construct a view of the atoms at the given atom indices."""
+        self.__atoms = atoms
+        self.__atom_indices = atom_indices
+
+    def __len__(self):
+        """Return the number of atoms in this view."""
+        return len(self.__atom_indices)
+
+    def __getitem__(self, index):
+        """Return the atom at the given position."""
+        if isinstance(index, slice):
+            return [self.__atoms[i] for i in self.__atom_indices[index]]
+        return self.__atoms[self.__atom_indices[index]]
+
+    def __repr__(self):
+        """Return the atoms in this view formatted as a list."""
+        return repr(list(self))
+
+
+class _TitleMap(collections.abc.Mapping):
+    """Map title strings to the title atoms of a policy, keeping only the
+       atom index of each title."""
+
+    __slots__ = ("__atoms", "__atom_indices")
+
+    def __init__(self, atoms, atom_indices):
+        """Construct a map over the given atom list or store from a dict of
+           title strings to atom indices."""
+        self.__atoms = atoms
+        self.__atom_indices = atom_indices
+
+    def __len__(self):
+        """Return the number of titles in this map."""
+        return len(self.__atom_indices)
+
+    def __iter__(self):
+        """Return an iterator over the title strings in this map."""
+        return iter(self.__atom_indices)
+
+    def __contains__(self, title):
+        """Return true if this map has the given title string."""
+        return title in self.__atom_indices
 
-        if isinstance(paragraphs, list):
-            for paragraph in paragraphs:
-                self.__paragraphs.append(PrivacyPolicyParagraph(self, paragraph, starting_index))
-                starting_index += 1
-        elif paragraphs is not None:
-            self.__paragraphs.append(PrivacyPolicyParagraph(self, paragraphs, starting_index))
-            starting_index += 1
+    def __getitem__(self, title):
+        """Return the title atom with the given title string."""
+        return self.__atoms[self.__atom_indices[title]]
 
-        subsections = section_dict.get("subsection") or section_dict.get("section")
 
-        if isinstance(subsections, list):
-            for subsection in subsections:
-                sub_obj = PrivacyPolicySection(self, subsection, starting_index)
-                self.__subsections.append(sub_obj)
-                starting_index += len(sub_obj.all_atoms)
+class PolicyElementRange(collections.abc.Sequence):
+    """Represent a read-only view of a contiguous range of a policy's atoms
+       or titles, without copying them."""
 
-        elif subsections is not None:
-            sub_obj = PrivacyPolicySection(self, subsections, starting_index)
-            self.__subsections.append(sub_obj)
-            starting_index += len(sub_obj.all_atoms)
+    __slots__ = ("__elements", "__range")
 
-        self.__all_atoms = []
-        self.__all_titles = []
-        self.__dump_all_atoms(self.__all_atoms, self.__all_titles)
+    def __init__(self, elements, start, stop):
+        """Construct a view of elements[start:stop]."""
+        self.__elements = elements
+        self.__range = range(start, stop)
 
-        self.__subsection_titles = []
-        for subsection in self.__subsections:
-            subsection_title = subsection.title
-            if subsection_title:
-                self.__subsection_titles.append(subsection_title)
+    def __len__(self):
+        """Return the number of elements in this view."""
+        return len(self.__range)
+
+    def __getitem__(self, index):
+        """Return the element (or view of elements for a slice) at the given
+           position within this view."""
+        if isinstance(index, slice):
+            indices = self.__range[index]
+            if indices.step == 1:
+                return PolicyElementRange(self.__elements, indices.start, indices.stop)
+            return [self.__elements[i] for i in indices]
+        return self.__elements[self.__range[index]]
+
+    def __iter__(self):
+        """Return an iterator over the elements in this view."""
+        return map(self.__elements.__getitem__, self.__range)
+
+    def __repr__(self):
+        """Return the elements in this view formatted as a list."""
+        return repr(list(self))
+
+
+class PrivacyPolicySection:
+    """Represent a root section, section or subsection within a policy.
+       A section's atoms and titles are stored once, in the arrays shared by
+       the whole policy, and the section only records the [start, end) ranges
+       of those arrays that it covers."""
+    
+    def __init__(self, parent_section, title, atoms, section_index):
+        """Construct an empty policy section with the specified parent, title
+           text (or None) and index in document order.  The section's atoms
+           are appended to the shared atom list or store by a
+           PrivacyPolicyBuilder."""
+        self.__parent_section = parent_section
+        self.__atoms = atoms
+        self.__titles = atoms.titles
+        self.__atom_start = len(atoms)
+        self.__atom_end = len(atoms)
+        self.__title_start = len(self.__titles)
+        self.__title_end = len(self.__titles)
+        self.__section_index = section_index
+        self.__section_end = section_index + 1
+        self.__paragraph_count = 0
+        self.__subsections = []
+        self.__subsection_titles = array.array("I")
+        self.__has_title = bool(title)
+
+        atoms.add_section(self)
+        if title:
+            atoms.add_atom(policy_snapshot.ATOM_TITLE, self, title)
+
+    def _add_paragraph(self, text):
+        """Append a paragraph with the specified text to this section."""
+        self.__atoms.add_atom(policy_snapshot.ATOM_PARAGRAPH, self, text)
+        self.__paragraph_count += 1
+
+    def _add_subsection(self, subsection):
+        """Append the specified child section to this section."""
+        self.__subsections.append(subsection)
+        if subsection.__has_title:
+            self.__subsection_titles.append(subsection.__atom_start)
+
+    def _finish(self, section_end):
+        """Record the end of this section's ranges once all of its paragraphs
+           and subsections have been added.  section_end is the document order
+           index just past this section's last descendant."""
+        self.__atom_end = len(self.__atoms)
+        self.__title_end = len(self.__titles)
+        self.__section_end = section_end
 
     @property
     def title(self):
         """Return the title atom for this section."""
-        return self.__title
+        if self.__has_title:
+            return self.__atoms[self.__atom_start]
+        return None
 
     @property
     def parent_section(self):
@@ -155,7 +415,8 @@ class PrivacyPolicySection:
     @property
     def paragraphs(self):
         """Return the paragraphs contained directly within this section."""
-        return self.__paragraphs
+        paragraph_start = self.__atom_start + (1 if self.__has_title else 0)
+        return PolicyElementRange(self.__atoms, paragraph_start, paragraph_start + self.__paragraph_count)
 
     @property
     def subsections(self):
@@ -166,104 +427,249 @@ class PrivacyPolicySection:
     def all_atoms(self):
         """Return all titles/paragraphs contained within this section and its
            child sections."""
-        return self.__all_atoms
+        return PolicyElementRange(self.__atoms, self.__atom_start, self.__atom_end)
     
     def all_atoms_as_string(self):
         """Return all titles/paragraphs contained within this section and its
            child sections as a string."""
-        string = ""
-        for atom in self.all_atoms:
-            atom = str(atom).rstrip(".")
-            string += f"{atom}. "
-        return string
+        return "".join(f"{str(atom).rstrip('.')}. " for atom in self.all_atoms)
 
     @property
     def all_titles(self):
         """Return all titles contained within this section and its child
            sections."""
-        return self.__all_titles
+        return PolicyElementRange(self.__titles, self.__title_start, self.__title_end)
 
     @property
     def subsection_titles(self):
         """Return the titles of this section's direct child sections."""
-        return self.__subsection_titles
+        return _AtomIndexList(self.__atoms, self.__subsection_titles)
+
+    @property
+    def section_index(self):
+        """Return the index of this section within the policy, counting
+           sections and subsections in document order."""
+        return self.__section_index
+
+    @property
+    def atom_range(self):
+        """Return the range of atom indices contained within this section and
+           its child sections."""
+        return range(self.__atom_start, self.__atom_end)
 
     def has_as_parent(self, parent_section):
         """Return true if this section is part of the given parent section."""
-        if parent_section is self.__parent_section:
+        if parent_section is None:
             return True
-        if not self.__parent_section:
-            return False
-        return self.__parent_section.has_as_parent(parent_section)
+        return parent_section.__section_index < self.__section_index < parent_section.__section_end
+
+
+class PrivacyPolicyBuilder:
+    """Construct the sections and atoms of a policy one element at a time.
+       Sections are opened and closed in document order, and a section's
+       paragraphs must be added before any of its subsections."""
+
+    def __init__(self, compact=False):
+        """Construct a builder for an empty policy.  If compact is true, the
+           policy's atoms are kept in a CompactAtomStore."""
+        self.__open_sections = []
+        self.__root_section = None
+        self.__atoms = CompactAtomStore() if compact else PolicyAtomList()
+        self.__section_count = 0
+
+    def begin_section(self, title=None):
+        """Open a new section with the given title text inside the currently
+           open section (or as the root section) and return it."""
+        if self.__open_sections:
+            parent_section = self.__open_sections[-1]
+        elif self.__root_section is None:
+            parent_section = None
+        else:
+            raise ValueError("A policy can only have one root section.")
 
-    def __dump_all_atoms(self, all_atoms, all_titles):
-        """Dumps all titles and atoms contained within this section and its
-           child sections into the specified lists."""
-        if self.__title:
-            all_titles.append(self.__title)
-            all_atoms.append(self.__title)
-        all_atoms.extend(self.__paragraphs)
-        for subsection in self.__subsections:
-            subsection.__dump_all_atoms(all_atoms, all_titles)
+        section = PrivacyPolicySection(parent_section, title, self.__atoms, self.__section_count)
+        self.__section_count += 1
 
+        if parent_section is not None:
+            parent_section._add_subsection(section)
+        else:
+            self.__root_section = section
 
-class PrivacyPolicy:
-    """Represent a policy."""
+        self.__open_sections.append(section)
+        return section
 
-    def __init__(self, file):
-        """Construct a policy object from the given XML file path."""
-        file = open(file, "r")
-        policy_dict = xmltodict.parse(file.read())["policy"]
-        file.close()
+    def add_paragraph(self, text):
+        """Append a paragraph with the given text to the currently open
+           section."""
+        section = self.__open_sections[-1]
+        if section.subsections:
+            raise ValueError("Paragraphs must come before subsections.")
+        section._add_paragraph(text)
 
-        self.__root_section = PrivacyPolicySection(None, policy_dict, 0)
-        self.__date = policy_dict["date"]
-        self.__url = policy_dict["url"]
+    def end_section(self):
+        """Close the currently open section."""
+        self.__open_sections.pop()._finish(self.__section_count)
 
-        self.__title_map = dict(zip(map(lambda title: title.text, self.__root_section.all_titles), self.__root_section.all_titles))
-        self.__accepted_sections = list(itertools.repeat(False, len(self.sections)))
-    
     @property
-    def accepted_sections(self):
-        """Return a list of booleans indicating whether the top-level sections
-           within this policy have been accepted."""
-        return self.__accepted_sections
-    
-    def is_section_accepted(self, num):
-        """Return true if the specified section number has been accepted."""
-        return self.__accepted_sections[num]
-    
-    def accept_section(self, num):
-        """Set the specified section number to accepted."""
-        self.__accepted_sections[num] = True
-    
-    def decline_section(self, num):
-        """Set the specified section number to declined."""
-        self.__accepted_sections[num] = False
-    
-    def accept_all_sections(self):
-        """Set all sections in the policy to accepted."""
-        for i in range(len(self.__accepted_sections)):
-            self.__accepted_sections[i] = True
-    
-    def decline_all_sections(self):
-        """Set all sections in the policy to declined."""
-        for i in range(len(self.__accepted_sections)):
-            self.__accepted_sections[i] = False
-    
-    def is_policy_accepted(self):
-        """Return true if all sections in the policy have been accepted."""
-        all_accepted = True
-        for section_accepted in self.__accepted_sections:
-            if not section_accepted:
-                all_accepted = False
-                break
-        return all_accepted
-    
-    def set_accepted_sections(self, accepted_sections):
-        """Set the accepted sections to the given list of booleans."""
-        for i in range(len(self.__accepted_sections)):
-            self.__accepted_sections[i] = True if accepted_sections[i] else False
+    def root_section(self):
+        """Return the root section of the built policy."""
+        if self.__open_sections or self.__root_section is None:
+            raise ValueError("The policy has unclosed sections or no root section.")
+        return self.__root_section
+
+
+def build_section_dict(builder, section_dict):
+    """Add a section and its child sections/atoms to the given builder.  Uses
+       section_dict dictionary dumped by xmltodict from policy XML file."""
+    builder.begin_section(section_dict.get("title"))
+
+    paragraphs = section_dict.get("paragraph")
+
+    if isinstance(paragraphs, list):
+        for paragraph in paragraphs:
+            builder.add_paragraph(paragraph)
+    elif paragraphs is not None:
+        builder.add_paragraph(paragraphs)
+
+    subsections = section_dict.get("subsection") or section_dict.get("section")
+
+    if isinstance(subsections, list):
+        for subsection in subsections:
+            build_section_dict(builder, subsection)
+    elif subsections is not None:
+        build_section_dict(builder, subsections)
+
+    builder.end_section()
+
+
+SECTION_TAGS = ("policy", "section", "subsection")
+
+
+def build_policy_xml(builder, file):
+    """Add the sections and atoms of the given policy XML file (a path or
+       binary file object) to the builder as the file is parsed, and return
+       the policy's date and URL.  Elements are discarded as soon as they
+       have been added, so memory use does not grow with the document.
+       Within a section the title must come first and paragraphs must come
+       before subsections."""
+    elements = []
+    begun = []
+    date = None
+    url = None
+
+    for event, element in ElementTree.iterparse(file, events=("start", "end")):
+        if event == "start":
+            if element.tag in SECTION_TAGS and (not elements or elements[-1].tag in SECTION_TAGS):
+                if not elements and element.tag != "policy":
+                    raise ValueError(f"Expected a policy element, found {element.tag}.")
+                if begun and not begun[-1]:
+                    builder.begin_section()
+                    begun[-1] = True
+                begun.append(False)
+            elements.append(element)
+            continue
+
+        elements.pop()
+        if elements and elements[-1].tag not in SECTION_TAGS:
+            # Part of a title or paragraph, which is read as a whole when it
+            # ends.
+            continue
+
+        tag = element.tag
+        if tag == "title":
+            if begun[-1]:
+                raise ValueError("A section's title must come before its contents.")
+            builder.begin_section("".join(element.itertext()).strip())
+            begun[-1] = True
+        elif tag == "paragraph":
+            if not begun[-1]:
+                builder.begin_section()
+                begun[-1] = True
+            builder.add_paragraph("".join(element.itertext()).strip())
+        elif tag in SECTION_TAGS:
+            if not begun.pop():
+                builder.begin_section()
+            builder.end_section()
+        elif tag == "date" and len(elements) == 1:
+            date = "".join(element.itertext()).strip()
+        elif tag == "url" and len(elements) == 1:
+            url = "".join(element.itertext()).strip()
+
+        if elements:
+            del elements[-1][-1]
+
+    if date is None or url is None:
+        raise ValueError("A policy must have a date and a url.")
+
+    return date, url
+
+
+class PrivacyPolicy:
+    """Represent a policy.  Policies are not modified once loaded, so one
+       policy object can be shared by every user; per-user state such as
+       accepted sections is kept in consent_state.ConsentState."""
+
+    def __init__(self, file, use_snapshot=True, compact=False, streaming=True):
+        """Construct a policy object from the given XML or snapshot file path
+           or seekable binary file object containing either.
+           Given an XML path, an up to date snapshot next to it is loaded
+           instead unless use_snapshot is False.  XML is streamed into the
+           policy with build_policy_xml unless streaming is False, in which
+           case it is parsed whole with xmltodict.  If compact is true, atoms
+           are stored in a CompactAtomStore rather than as atom objects."""
+        builder = PrivacyPolicyBuilder(compact)
+        snapshot = policy_snapshot.find_snapshot(file) if use_snapshot else None
+
+        if snapshot:
+            snapshot.replay(builder)
+            self.__date = snapshot.date
+            self.__url = snapshot.url
+        elif streaming:
+            self.__date, self.__url = build_policy_xml(builder, file)
+        else:
+            # Only needed by the legacy loader, so keep it off the cold start
+            # path.
+            import xmltodict
+
+            if isinstance(file, str):
+                with open(file, "r") as xml_file:
+                    policy_dict = xmltodict.parse(xml_file.read())["policy"]
+            else:
+                policy_dict = xmltodict.parse(file)["policy"]
+
+            build_section_dict(builder, policy_dict)
+            self.__date = policy_dict["date"]
+            self.__url = policy_dict["url"]
+
+        self.__root_section = builder.root_section
+        all_atoms = self.__root_section.all_atoms
+
+        # Title atoms are looked up by index when read, so a compact policy
+        # does not keep an atom object per title.
+        if snapshot:
+            self.__title_map = _TitleMap(all_atoms, {all_atoms[i].text: i for i in snapshot.title_indices})
+            self.__toc_string = snapshot.toc_string
+            self.__search_index = snapshot.search_index
+        else:
+            self.__search_index = None
+            self.__title_map = _TitleMap(all_atoms, {title.text: title.atom_index for title in self.__root_section.all_titles})
+            self.__toc_string = self.__build_toc_string()
+
+        # Sections are asked for by name on any request, so the title index
+        # is ready before the first; the fingerprint is only needed to
+        # migrate consent, so it is built on first use.
+        self.__title_index = TitleIndex(self.__root_section.all_titles)
+        self.__fingerprint = None
+
+    def __build_toc_string(self):
+        """Return a string stating the top-level titles of this policy."""
+        titles = "Here are the Privacy Policy section titles"
+        i = 1
+        for title in self.section_titles:
+            titles += f". {i}. " + str(title).rstrip(".")
+            i += 1
+        
+        return titles
     
     @property
     def root_section(self):
@@ -320,17 +726,39 @@ class PrivacyPolicy:
         """Would be useful for looking up policy elements given their titles."""
         return self.__title_map
 
+    @property
+    def toc_string(self):
+        """Return a string stating the top-level titles of this policy, for
+           reading out as the table of contents."""
+        return self.__toc_string
+
+    @property
+    def fingerprint(self):
+        """Return the content hashes of the atoms and sections of this
+           policy (see the policy_diff module), computing them on first
+           use."""
+        if self.__fingerprint is None:
+            self.__fingerprint = PolicyFingerprint.from_policy(self)
+        return self.__fingerprint
+
+    @property
+    def title_index(self):
+        """Return the index for looking up the titles of this policy by their
+           spoken names, which is built as the policy loads."""
+        return self.__title_index
+
+    @property
+    def search_index(self):
+        """Return the full-text search index over the atoms of this policy,
+           building it on first use if it was not loaded from a snapshot."""
+        if self.__search_index is None:
+            self.__search_index = PolicySearchIndex.from_texts(atom.text for atom in self.all_atoms)
+        return self.__search_index
+
     def get_read_last_index(self, read_start_index):
         """Return the index of the last atom contained within the section or
            subsection that contains the atom with the specified index."""
         """Would be useful for jumping to a specific paragraph in the policy
            and determining where reading should stop."""
-        all_atoms = self.__root_section.all_atoms
-        section = all_atoms[read_start_index].parent_section
-
-        while True:
-            read_start_index += 1
-            if not ((read_start_index < len(all_atoms)) and all_atoms[read_start_index].has_as_parent(section)):
-                break
-
-        return read_start_index - 1
+        section = self.__root_section.all_atoms[read_start_index].parent_section
+        return section.atom_range.stop - 1
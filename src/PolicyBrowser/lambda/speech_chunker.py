@@ -0,0 +1,163 @@
+# Splits long speech into chunks that fit a response.
+#
+# Alexa limits the length of the speech in a single response, and long
+# responses are slow to synthesize, so section text is read in chunks.  A
+# chunk holds as many whole atoms (titles and paragraphs) as fit the budget;
+# an atom too long to fit on its own is split between sentences, and a
+# sentence too long to fit is split between words.
+#
+# The budget is a number of characters, optionally lowered to match an
+# estimated reading time at chars_per_second characters per second.  Text is
+# measured as it will be sent, escaped for SSML (see ssml_length), so a chunk
+# with &, < or > in it still fits once it is escaped.
+#
+# Each chunk records where it starts, as the index of its first atom and the
+# number of the part of that atom it starts with (0 unless the atom was
+# split), so a reader can persist its position between requests.
+#
+# ## Example Usage:
+#
+# > chunker = SpeechChunker(max_chars=6000, max_seconds=90)
+# > for chunk in chunker.split(enumerate(["Title. ", "A paragraph. "])):
+# >     print(chunk.atom_index, chunk.part, chunk.text)
+
+import re
+
+# Alexa rejects responses with more than 8000 characters of speech.
+MAX_SPEECH_CHARS = 8000
+DEFAULT_CHARS_PER_SECOND = 15
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Extra characters each special character takes once escaped by html.escape
+# with quote=False, as speech_render escapes speech (&amp; &lt; &gt;).
+ESCAPE_EXTRA = {"&": 4, "<": 3, ">": 3}
+
+
+def ssml_length(text):
+    """Return the length of the given text once escaped for SSML.  Escaping
+       replaces single characters, so the length of joined texts is the sum
+       of their lengths."""
+    return len(text) + sum(extra * text.count(character) for character, extra in ESCAPE_EXTRA.items())
+
+
+def ssml_prefix(text, budget):
+    """Return the longest prefix of the given text whose escaped length is
+       within the budget, and at least one character."""
+    size = 0
+    for end, character in enumerate(text):
+        size += 1 + ESCAPE_EXTRA.get(character, 0)
+        if size > budget:
+            return text[:max(end, 1)]
+    return text
+
+
+class SpeechChunk:
+    """Represent a chunk of speech and the position it starts from."""
+
+    __slots__ = ("text", "atom_index", "part")
+
+    def __init__(self, text, atom_index, part):
+        """Construct a chunk of the given text starting from the given part
+           of the given atom."""
+        self.text = text
+        self.atom_index = atom_index
+        self.part = part
+
+    @property
+    def cursor(self):
+        """Return the (atom index, part) position this chunk starts from."""
+        return (self.atom_index, self.part)
+
+
+class SpeechChunker:
+    """Split speech into chunks that fit a character or duration budget."""
+
+    def __init__(self, max_chars=6000, max_seconds=None, chars_per_second=DEFAULT_CHARS_PER_SECOND):
+        """Construct a chunker for chunks of at most max_chars characters and,
+           if max_seconds is given, an estimated max_seconds of speech."""
+        budget = min(max_chars, MAX_SPEECH_CHARS)
+        if max_seconds is not None:
+            budget = min(budget, int(max_seconds * chars_per_second))
+        if budget <= 0:
+            raise ValueError("The speech budget must be positive.")
+        self.__budget = budget
+        self.__chars_per_second = chars_per_second
+
+    @property
+    def budget(self):
+        """Return the maximum number of characters in a chunk, once escaped
+           for SSML."""
+        return self.__budget
+
+    def estimate_seconds(self, text):
+        """Return the estimated time it takes to speak the given text."""
+        return len(text) / self.__chars_per_second
+
+    def split(self, atoms, reserved=0):
+        """Return a list of chunks of the given (atom index, text) pairs,
+           leaving room for reserved characters of other speech (escaped) in
+           each chunk."""
+        budget = max(self.__budget - reserved, 1)
+        chunks = []
+        pieces = []
+        size = 0
+        start = None
+
+        for atom_index, text in atoms:
+            for part, piece in enumerate(self.__split_atom(text, budget)):
+                length = ssml_length(piece)
+                if pieces and size + length > budget:
+                    chunks.append(SpeechChunk("".join(pieces), *start))
+                    pieces = []
+                    size = 0
+                if not pieces:
+                    start = (atom_index, part)
+                pieces.append(piece)
+                size += length
+
+        if pieces:
+            chunks.append(SpeechChunk("".join(pieces), *start))
+        return chunks
+
+    def __split_atom(self, text, budget):
+        """Return the given atom's text as one piece if it fits the budget,
+           and otherwise as pieces split between sentences or words."""
+        if ssml_length(text) <= budget:
+            return [text]
+
+        pieces = []
+        for sentence in self.__split_keeping_spaces(SENTENCE_BOUNDARY, text):
+            if ssml_length(sentence) <= budget:
+                self.__append_piece(pieces, sentence, budget)
+                continue
+            for word in self.__split_keeping_spaces(re.compile(r"\s+"), sentence):
+                # A single word longer than the budget is cut where it must.
+                while ssml_length(word) > budget:
+                    cut = ssml_prefix(word, budget)
+                    self.__append_piece(pieces, cut, budget)
+                    word = word[len(cut):]
+                self.__append_piece(pieces, word, budget)
+        return pieces
+
+    @staticmethod
+    def __split_keeping_spaces(pattern, text):
+        """Return the text split at the given pattern, with each separator
+           kept at the end of the piece before it."""
+        pieces = []
+        start = 0
+        for match in pattern.finditer(text):
+            pieces.append(text[start:match.end()])
+            start = match.end()
+        if start < len(text):
+            pieces.append(text[start:])
+        return pieces
+
+    @staticmethod
+    def __append_piece(pieces, text, budget):
+        """Add text to the last piece if both fit the budget together, and as
+           a new piece otherwise."""
+        if pieces and ssml_length(pieces[-1]) + ssml_length(text) <= budget:
+            pieces[-1] += text
+        else:
+            pieces.append(text)
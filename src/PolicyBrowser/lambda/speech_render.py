@@ -0,0 +1,142 @@
+# Precomputed speech for policies.
+#
+# The table of contents and the responses read for each top-level section
+# depend only on the policy, so they are rendered once when a policy is
+# loaded and then served as they are on every TableOfContents, read,
+# continue and repeat request.  Each rendering is kept as plain text and as
+# SSML-safe text (special characters escaped) for use with speak().
+#
+# A section too long for one response is split by a SpeechChunker into
+# chunks read one after another, each identified by a cursor (see
+# speech_chunker) that can be stored between requests.
+#
+# ## Example Usage:
+#
+# > speech_cache = SpeechRenderCache()
+# > section = speech_cache.get("policy", policy).section(2)
+# > handler_input.response_builder.speak(section[0].ssml)
+
+import bisect
+import collections
+import html
+
+from speech_chunker import SpeechChunker, ssml_length
+
+SECTION_PROMPT = "To accept or decline this section of the policy, say accept or decline. Otherwise, say continue."
+CHUNK_PROMPT = "To keep reading this section, say continue."
+
+
+class RenderedSpeech:
+    """Represent a piece of speech as plain text and as SSML."""
+
+    __slots__ = ("text", "ssml")
+
+    def __init__(self, text):
+        """Construct the plain and SSML forms of the given text.  Both refer
+           to the same string when the text needs no escaping."""
+        self.text = text
+        # html.escape rather than xml.sax.saxutils.escape, which imports
+        # urllib.request and adds tens of milliseconds to a cold start.
+        ssml = html.escape(text, quote=False)
+        self.ssml = text if ssml == text else ssml
+
+
+class RenderedSection:
+    """Represent the speech for one top-level section, as the chunks it is
+       read in."""
+
+    def __init__(self, section_number, section, chunker):
+        """Render the given section, split by the given chunker."""
+        intro = f"Starting from section {section_number + 1}. "
+        start = section.atom_range.start
+        atoms = ((start + i, f"{str(atom).rstrip('.')}. ") for i, atom in enumerate(section.all_atoms))
+        chunks = chunker.split(atoms, ssml_length(intro) + max(ssml_length(SECTION_PROMPT), ssml_length(CHUNK_PROMPT)))
+        if not chunks:
+            chunks = chunker.split([(start, "")])
+
+        self.__chunks = []
+        self.__cursors = [chunk.cursor for chunk in chunks]
+        for chunk_number, chunk in enumerate(chunks):
+            first = chunk_number == 0
+            last = chunk_number == len(chunks) - 1
+            text = "".join((intro if first else "", chunk.text, SECTION_PROMPT if last else CHUNK_PROMPT))
+            self.__chunks.append(RenderedSpeech(text))
+
+    def __len__(self):
+        """Return the number of chunks in this section."""
+        return len(self.__chunks)
+
+    def __getitem__(self, chunk_number):
+        """Return the speech for the chunk with the given number."""
+        return self.__chunks[chunk_number]
+
+    def cursor(self, chunk_number):
+        """Return the (atom index, part) cursor of the chunk with the given
+           number."""
+        return self.__cursors[chunk_number]
+
+    def chunk_number_at(self, cursor):
+        """Return the number of the chunk containing the given cursor."""
+        return max(bisect.bisect_right(self.__cursors, tuple(cursor)) - 1, 0)
+
+
+class PolicyRendering:
+    """Represent the speech for one loaded policy."""
+
+    def __init__(self, policy, chunker=None):
+        """Render the table of contents and every top-level section of the
+           given policy, splitting sections with the given chunker."""
+        if chunker is None:
+            chunker = SpeechChunker()
+        self.__policy = policy
+        self.__toc = RenderedSpeech(policy.toc_string)
+        self.__sections = [RenderedSection(section_number, section, chunker)
+                           for section_number, section in enumerate(policy.sections)]
+
+    @property
+    def policy(self):
+        """Return the policy this rendering was made from."""
+        return self.__policy
+
+    @property
+    def toc(self):
+        """Return the speech for the table of contents."""
+        return self.__toc
+
+    def section(self, section_number):
+        """Return the RenderedSection for the top-level section with the
+           given number."""
+        return self.__sections[section_number]
+
+
+class SpeechRenderCache:
+    """Keep the renderings of recently used policies, keyed by policy id and
+       version."""
+
+    def __init__(self, max_policies=16, chunker=None):
+        """Construct a cache holding up to max_policies renderings, with
+           sections split by the given chunker."""
+        self.__max_policies = max_policies
+        self.__chunker = chunker
+        self.__renderings = collections.OrderedDict()
+
+    def render(self, policy_id, policy):
+        """Render the given policy, replacing any cached rendering of it, and
+           return the rendering."""
+        key = (policy_id, policy.date)
+        rendering = self.__renderings[key] = PolicyRendering(policy, self.__chunker)
+        self.__renderings.move_to_end(key)
+        if len(self.__renderings) > self.__max_policies:
+            self.__renderings.popitem(last=False)
+        return rendering
+
+    def get(self, policy_id, policy):
+        """Return the rendering of the given policy, rendering it if it is
+           not cached."""
+        key = (policy_id, policy.date)
+        rendering = self.__renderings.get(key)
+        # A policy reloaded without changing its date is a different object.
+        if rendering is None or rendering.policy is not policy:
+            return self.render(policy_id, policy)
+        self.__renderings.move_to_end(key)
+        return rendering
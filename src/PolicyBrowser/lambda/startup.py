@@ -0,0 +1,195 @@
+# Cold start profiling and lazy initialization.
+#
+# Everything lambda_function does at import time delays the first request a
+# new container serves.  The costliest parts, importing boto3 (which
+# ask_sdk_s3 does) and creating the S3 client inside S3Adapter, are deferred
+# until a handler first needs them: Lazy holds an object created on first
+# use, LazyPersistenceAdapter defers a persistence adapter, and lazy_import
+# returns a module that is only loaded when one of its attributes is used.
+#
+# Setting the STARTUP_PROFILE environment variable times each import and
+# initializer run at startup, and logs them in order of cost once
+# lambda_function has been imported; deferred initializers log their cost
+# when they run.  Setting EAGER_INIT creates every Lazy object at import time
+# instead, for deployments (such as provisioned concurrency) where the init
+# phase is not seen by users.
+#
+# ## Example Usage:
+#
+# Import this module before any other, so the imports after it are timed
+# > import startup
+# > s3_adapter = startup.LazyPersistenceAdapter("S3 adapter", lambda: S3Adapter(bucket_name=bucket))
+# > with startup.timed("policy registry"):
+# >     policy_registry = PolicyRegistry(sources)
+# > startup.finish()
+#
+# Time the startup of a skill from the command line (see
+# src/tools/profile_startup.py)
+# > python profile_startup.py PolicyBrowser
+
+import builtins
+import contextlib
+import importlib.util
+import logging
+import os
+import sys
+import threading
+import time
+
+PROFILING = bool(os.environ.get("STARTUP_PROFILE"))
+EAGER = bool(os.environ.get("EAGER_INIT"))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Each entry is a dictionary of the phase ("init" at import time, "deferred"
+# afterwards), kind ("import" or "initializer"), name and time in ms.
+timings = []
+lazy_objects = []
+original_import = builtins.__import__
+import_depth = 0
+finished = False
+
+
+def record(kind, name, seconds):
+    """Record the time taken by an import or initializer."""
+    timing = {"phase": "deferred" if finished else "init", "kind": kind, "name": name, "ms": seconds * 1e3}
+    timings.append(timing)
+    if PROFILING and finished:
+        logger.info(f"Deferred {kind} {name} took {timing['ms']:.1f}ms")
+
+
+@contextlib.contextmanager
+def timed(name, kind="initializer"):
+    """Time the enclosed block as the named initializer."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(kind, name, time.perf_counter() - started)
+
+
+def profiled_import(name, globals=None, locals=None, fromlist=(), level=0):
+    """Import a module as builtins.__import__ does, timing the outermost
+       import of each module not yet loaded."""
+    global import_depth
+    if import_depth or level or name in sys.modules:
+        import_depth += 1
+        try:
+            return original_import(name, globals, locals, fromlist, level)
+        finally:
+            import_depth -= 1
+
+    import_depth += 1
+    started = time.perf_counter()
+    try:
+        return original_import(name, globals, locals, fromlist, level)
+    finally:
+        import_depth -= 1
+        record("import", name, time.perf_counter() - started)
+
+
+def finish():
+    """Stop timing imports, create every Lazy object if EAGER_INIT is set,
+       and log the startup timings if profiling."""
+    global finished
+    builtins.__import__ = original_import
+    if EAGER:
+        warm()
+    finished = True
+    if PROFILING:
+        report()
+
+
+def warm():
+    """Create every Lazy object that has not been created yet."""
+    for lazy in lazy_objects:
+        lazy.get()
+
+
+def report():
+    """Log the startup timings, costliest first."""
+    total = sum(timing["ms"] for timing in timings if timing["phase"] == "init")
+    logger.info(f"Startup took {total:.1f}ms in timed imports and initializers")
+    for timing in sorted(timings, key=lambda timing: timing["ms"], reverse=True):
+        logger.info(f"  {timing['ms']:8.1f}ms  {timing['phase']:<8} {timing['kind']:<11} {timing['name']}")
+
+
+def lazy_import(name):
+    """Return the named module, loading it on first attribute access rather
+       than now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    # As the import system does, bind a submodule to its parent package.
+    parent, _, child = name.rpartition(".")
+    if parent:
+        setattr(sys.modules[parent], child, module)
+    return module
+
+
+# Imports are timed from here until finish() is called.
+if PROFILING:
+    builtins.__import__ = profiled_import
+
+from ask_sdk_core.attributes_manager import AbstractPersistenceAdapter
+
+
+class Lazy:
+    """Hold an object that is created by a factory on first use."""
+
+    def __init__(self, name, factory):
+        """Construct a holder for the named object, made by calling
+           factory."""
+        self.__name = name
+        self.__factory = factory
+        self.__value = None
+        self.__created = False
+        self.__lock = threading.Lock()
+        lazy_objects.append(self)
+
+    @property
+    def name(self):
+        """Return the name of the object."""
+        return self.__name
+
+    @property
+    def created(self):
+        """Return whether the object has been created."""
+        return self.__created
+
+    def get(self):
+        """Return the object, creating it if this is its first use."""
+        if not self.__created:
+            with self.__lock:
+                if not self.__created:
+                    with timed(self.__name):
+                        self.__value = self.__factory()
+                    self.__created = True
+        return self.__value
+
+
+class LazyPersistenceAdapter(AbstractPersistenceAdapter):
+    """Persistence adapter that creates the real adapter on first use."""
+
+    def __init__(self, name, factory):
+        """Construct an adapter deferring to the adapter made by calling
+           factory."""
+        self.__adapter = Lazy(name, factory)
+
+    def get_attributes(self, request_envelope):
+        """Return the persistent attributes of the request's user."""
+        return self.__adapter.get().get_attributes(request_envelope)
+
+    def save_attributes(self, request_envelope, attributes):
+        """Store the persistent attributes of the request's user."""
+        return self.__adapter.get().save_attributes(request_envelope, attributes)
+
+    def delete_attributes(self, request_envelope):
+        """Delete the persistent attributes of the request's user."""
+        return self.__adapter.get().delete_attributes(request_envelope)
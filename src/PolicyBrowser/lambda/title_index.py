@@ -0,0 +1,168 @@
+# Fuzzy lookup of policy titles by their spoken names.
+#
+# Titles requested by voice rarely match title_map exactly: words are
+# dropped ("collection of personal information"), misheard ("collection of
+# your personnel information") or reordered.  A TitleIndex matches a spoken
+# name against every title of a policy by combining three kinds of keys,
+# each with its own inverted index so only titles sharing a key are scored:
+#
+#   tokens     normalized words, as used by policy_search
+#   trigrams   character trigrams of the normalized words
+#   phonetic   Soundex codes of the words
+#
+# ## Example Usage:
+#
+# > for title, score in policy.title_index.lookup("your personnel information", limit=3):
+# >     print(score, title)
+
+import collections
+import heapq
+
+from policy_search import tokenize
+
+# Weight of each kind of key in a title's score.
+TOKEN_WEIGHT = 0.5
+PHONETIC_WEIGHT = 0.3
+TRIGRAM_WEIGHT = 0.2
+
+# Titles scoring lower than this are not considered matches.
+MIN_SCORE = 0.35
+
+_SOUNDEX_CODES = {}
+for _letters, _code in (("bfpv", "1"), ("cgjkqsxz", "2"), ("dt", "3"), ("l", "4"), ("mn", "5"), ("r", "6")):
+    for _letter in _letters:
+        _SOUNDEX_CODES[_letter] = _code
+
+
+def soundex(word):
+    """Return the Soundex code of the given lower case word, or the word
+       itself if it does not start with a letter."""
+    if not word or not word[0].isalpha():
+        return word
+
+    code = word[0]
+    previous = _SOUNDEX_CODES.get(word[0], "")
+    for letter in word[1:]:
+        digit = _SOUNDEX_CODES.get(letter, "")
+        if digit and digit != previous:
+            code += digit
+            if len(code) == 4:
+                break
+        # Letters separated by h or w share a code; vowels separate them.
+        if letter not in "hw":
+            previous = digit
+    return code.ljust(4, "0")
+
+
+def trigrams(tokens):
+    """Return the set of character trigrams of the given tokens."""
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def _overlap(query_keys, title_keys):
+    """Return the Dice coefficient of two sets of keys."""
+    if not query_keys or not title_keys:
+        return 0.0
+    return 2 * len(query_keys & title_keys) / (len(query_keys) + len(title_keys))
+
+
+class TitleIndex:
+    """Represent an index of the titles of a policy by their spoken
+       forms."""
+
+    def __init__(self, titles):
+        """Construct an index of the given title atoms."""
+        self.__titles = list(titles)
+        self.__keys = []
+        self.__exact = {}
+        self.__token_postings = collections.defaultdict(set)
+        self.__phonetic_postings = collections.defaultdict(set)
+        self.__trigram_postings = collections.defaultdict(set)
+
+        # Titles share most of their words, so key each word only once.
+        word_keys = {}
+        for title_number, title in enumerate(self.__titles):
+            tokens = set(tokenize(title.text))
+            phonetic = set()
+            grams = set()
+            for token in tokens:
+                if token not in word_keys:
+                    word_keys[token] = (soundex(token), trigrams((token,)))
+                sound, token_grams = word_keys[token]
+                phonetic.add(sound)
+                grams.update(token_grams)
+            self.__keys.append((tokens, phonetic, grams))
+            self.__exact.setdefault(" ".join(sorted(tokens)), title_number)
+
+            for token in tokens:
+                self.__token_postings[token].add(title_number)
+            for key in phonetic:
+                self.__phonetic_postings[key].add(title_number)
+            for gram in grams:
+                self.__trigram_postings[gram].add(title_number)
+
+    def __len__(self):
+        """Return the number of titles in this index."""
+        return len(self.__titles)
+
+    def lookup(self, spoken_name, limit=3, min_score=MIN_SCORE):
+        """Return up to limit (title atom, score) tuples for the titles that
+           best match the given spoken name, best match first.  Scores range
+           from 0 to 1; titles scoring below min_score are left out."""
+        tokens = set(tokenize(spoken_name))
+        if not tokens or limit < 1:
+            return []
+
+        exact = self.__exact.get(" ".join(sorted(tokens)))
+        if exact is not None:
+            return [(self.__titles[exact], 1.0)]
+
+        phonetic = {soundex(token) for token in tokens}
+        grams = trigrams(tokens)
+
+        # Count the words and sounds each title shares with the name from
+        # the postings, rather than intersecting every candidate's keys.
+        token_hits = collections.Counter()
+        for token in tokens:
+            token_hits.update(self.__token_postings.get(token, ()))
+        phonetic_hits = collections.Counter()
+        for key in phonetic:
+            phonetic_hits.update(self.__phonetic_postings.get(key, ()))
+
+        candidates = token_hits.keys() | phonetic_hits.keys()
+        if not candidates:
+            # Nothing shares a whole word or sound; fall back to spelling.
+            for gram in grams:
+                candidates.update(self.__trigram_postings.get(gram, ()))
+
+        # Score words and sounds first; trigrams are the costliest to
+        # compare, so only compare them for titles that could still make the
+        # top limit if their spelling matched completely.
+        partial_scores = []
+        for title_number in candidates:
+            title_tokens, title_phonetic, _ = self.__keys[title_number]
+            partial = (TOKEN_WEIGHT * (2 * token_hits[title_number] / (len(tokens) + len(title_tokens)))
+                       + PHONETIC_WEIGHT * (2 * phonetic_hits[title_number] / (len(phonetic) + len(title_phonetic))))
+            partial_scores.append((-partial, title_number))
+        partial_scores.sort()
+
+        best = []
+        for negated_partial, title_number in partial_scores:
+            partial = -negated_partial
+            threshold = max(min_score, best[0][0]) if len(best) == limit else min_score
+            if partial + TRIGRAM_WEIGHT < threshold:
+                break
+            score = partial + TRIGRAM_WEIGHT * _overlap(grams, self.__keys[title_number][2])
+            if score >= threshold:
+                match = (score, -title_number)
+                if len(best) < limit:
+                    heapq.heappush(best, match)
+                else:
+                    heapq.heappushpop(best, match)
+
+        best.sort(reverse=True)
+        return [(self.__titles[-negated_number], score) for score, negated_number in best]
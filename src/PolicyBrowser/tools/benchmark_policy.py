@@ -0,0 +1,229 @@
+# Benchmarks for the privacy_policy module.
+#
+# For each policy size, a synthetic policy (see generate_policy) is loaded
+# from XML, from XML into compact storage and from a snapshot, recording the
+# time taken and the peak memory allocated, and then the navigation
+# operations the skill performs on every request are timed.  Results are
+# printed as a table of how each metric scales with policy size, and can be
+# written as JSON and compared against a stored baseline.
+#
+# Times are the median of --repeat runs, in milliseconds for loading and
+# microseconds per call for operations.  Memory is in KiB, measured with
+# tracemalloc in a separate run so it does not slow the timed runs.
+#
+# ## Example Usage:
+#
+# Benchmark the default sizes and store the results as a baseline
+# > python benchmark_policy.py -o baseline.json
+#
+# Benchmark again after a change, failing if anything is over 20% worse
+# > python benchmark_policy.py --baseline baseline.json --threshold 1.2
+#
+# Include the largest policies
+# > python benchmark_policy.py --sizes 10 100 1000 10000 100000
+
+import argparse
+import datetime
+import gc
+import json
+import math
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lambda"))
+
+import policy_snapshot
+from generate_policy import generate_policy_xml
+from privacy_policy import PrivacyPolicy
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+
+# Number of calls timed together for each operation.
+OPERATION_CALLS = 200
+
+
+def median_time(function, repeat):
+    """Return the median time in seconds of repeat calls of function."""
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+def peak_memory(function):
+    """Return the peak memory in bytes allocated while calling function."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def resident_memory(function):
+    """Return the memory in bytes still allocated by the result of calling
+       function."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = function()
+        gc.collect()
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return current
+
+
+def time_operation(function, arguments, repeat):
+    """Return the median time in microseconds of one call of function, over
+       the given list of arguments."""
+    def run():
+        for argument in arguments:
+            function(argument)
+    return median_time(run, repeat) / len(arguments) * 1e6
+
+
+def benchmark_size(atoms, directory, args):
+    """Return the metrics for a synthetic policy with the given number of
+       atoms."""
+    xml_file = os.path.join(directory, f"policy_{atoms}.xml")
+    with open(xml_file, "wb") as file:
+        file.write(generate_policy_xml(atoms, args.depth, args.paragraphs, args.paragraph_words, args.seed))
+    snapshot_file = policy_snapshot.compile_snapshot(xml_file)
+
+    load_xml = lambda: PrivacyPolicy(xml_file, use_snapshot=False)
+    load_compact = lambda: PrivacyPolicy(xml_file, use_snapshot=False, compact=True)
+    load_snapshot = lambda: PrivacyPolicy(snapshot_file)
+
+    metrics = {
+        "load_xml_ms": median_time(load_xml, args.repeat) * 1e3,
+        "load_xml_compact_ms": median_time(load_compact, args.repeat) * 1e3,
+        "load_snapshot_ms": median_time(load_snapshot, args.repeat) * 1e3,
+        "peak_xml_kib": peak_memory(load_xml) / 1024,
+        "resident_xml_kib": resident_memory(load_xml) / 1024,
+        "resident_compact_kib": resident_memory(load_compact) / 1024,
+    }
+
+    policy = load_xml()
+    generator = random.Random(args.seed)
+    atom_indices = [generator.randrange(len(policy.all_atoms)) for _ in range(OPERATION_CALLS)]
+    section_numbers = [generator.randrange(len(policy.sections)) for _ in range(OPERATION_CALLS)]
+    titles = [generator.choice(list(policy.title_map)) for _ in range(OPERATION_CALLS)]
+    queries = [" ".join(title.split()[:2]) for title in titles]
+
+    metrics.update({
+        "get_read_last_index_us": time_operation(policy.get_read_last_index, atom_indices, args.repeat),
+        "atom_access_us": time_operation(policy.all_atoms.__getitem__, atom_indices, args.repeat),
+        "all_atoms_as_string_us": time_operation(lambda n: policy.sections[n].all_atoms_as_string(),
+                                                 section_numbers[:20], args.repeat),
+        "title_map_lookup_us": time_operation(policy.title_map.__getitem__, titles, args.repeat),
+        "title_index_lookup_us": time_operation(policy.title_index.lookup, queries[:50], args.repeat),
+        "search_us": time_operation(policy.search_index.search, queries[:50], args.repeat),
+    })
+
+    return {"atoms": len(policy.all_atoms), "sections": len(policy.sections), "metrics": metrics}
+
+
+def scaling_exponent(results, metric):
+    """Return the slope of metric against policy size on a log-log scale,
+       between the smallest and largest policies (1 is linear scaling)."""
+    first, last = results[0], results[-1]
+    if last["atoms"] <= first["atoms"] or first["metrics"][metric] <= 0 or last["metrics"][metric] <= 0:
+        return None
+    return (math.log(last["metrics"][metric] / first["metrics"][metric])
+            / math.log(last["atoms"] / first["atoms"]))
+
+
+def print_table(results):
+    """Print the metrics of each policy size and how they scale."""
+    metrics = list(results[0]["metrics"])
+    print(f"{'metric':<26}" + "".join(f"{result['atoms']:>12}" for result in results) + f"{'scaling':>10}")
+    for metric in metrics:
+        exponent = scaling_exponent(results, metric)
+        print(f"{metric:<26}" + "".join(f"{result['metrics'][metric]:>12.2f}" for result in results)
+              + (f"{exponent:>10.2f}" if exponent is not None else f"{'-':>10}"))
+
+
+def compare(results, baseline, threshold):
+    """Print how the results compare with a baseline and return the list of
+       (atoms, metric, ratio) regressions worse than threshold times the
+       baseline."""
+    baseline_results = {result["atoms"]: result["metrics"] for result in baseline["results"]}
+    regressions = []
+    print(f"\nCompared with baseline from {baseline.get('date', 'unknown date')}:")
+    for result in results:
+        old_metrics = baseline_results.get(result["atoms"])
+        if old_metrics is None:
+            continue
+        for metric, value in result["metrics"].items():
+            old_value = old_metrics.get(metric)
+            if not old_value:
+                continue
+            ratio = value / old_value
+            flag = ""
+            if ratio > threshold:
+                regressions.append((result["atoms"], metric, ratio))
+                flag = "  REGRESSION"
+            elif ratio < 1 / threshold:
+                flag = "  improved"
+            print(f"  {result['atoms']:>8} {metric:<26} {old_value:>12.2f} -> {value:>12.2f} ({ratio:.2f}x){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark loading and navigating privacy policies.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="policy sizes in atoms")
+    parser.add_argument("--depth", type=int, default=2, help="how deeply sections are nested")
+    parser.add_argument("--paragraphs", type=int, default=4, help="paragraphs in each section")
+    parser.add_argument("--paragraph-words", type=int, default=60, help="words in each paragraph")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--repeat", type=int, default=5, help="runs of each timing, of which the median is kept")
+    parser.add_argument("-o", "--output", help="write the results as JSON to this path")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio to the baseline above which a metric counts as a regression")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for atoms in sorted(args.sizes):
+            print(f"Benchmarking {atoms} atoms...", file=sys.stderr)
+            results.append(benchmark_size(atoms, directory, args))
+
+    print_table(results)
+
+    report = {
+        "date": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {"depth": args.depth, "paragraphs": args.paragraphs,
+                     "paragraph_words": args.paragraph_words, "seed": args.seed, "repeat": args.repeat},
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(results, json.load(file), args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+# Synthetic policy generator.
+#
+# Writes policy XML of a chosen size and shape, for benchmarking and load
+# testing the skill without real vendor policies.  The same arguments and
+# seed always produce the same policy.
+#
+# ## Example Usage:
+#
+# A policy of 10,000 atoms, with sections nested three deep
+# > python generate_policy.py --atoms 10000 --depth 3 -o big.xml
+#
+# > from generate_policy import generate_policy_xml
+# > xml = generate_policy_xml(1000, depth=2, paragraph_words=40)
+
+import argparse
+import math
+import random
+from xml.etree import ElementTree
+
+WORDS = """
+    access account activity address advertising affiliates analytics apply
+    browser choices collect communications consent contact content cookies
+    data delete device disclose email information interests law location
+    marketing partners personal policy preferences privacy process properties
+    protect provide purposes request retain rights security services share
+    site store third parties time track update use users
+""".split()
+
+
+class PolicyGenerator:
+    """Generate the sections, titles and paragraphs of a synthetic policy."""
+
+    def __init__(self, atoms, depth=2, paragraphs_per_section=4, paragraph_words=60, seed=0):
+        """Construct a generator for a policy of the given number of atoms
+           (its title included), with sections nested up to depth levels
+           deep."""
+        if atoms < 2:
+            raise ValueError("A policy needs at least 2 atoms.")
+        if depth < 1:
+            raise ValueError("A policy needs at least 1 level of sections.")
+        self.__remaining = atoms
+        self.__depth = depth
+        self.__paragraphs_per_section = paragraphs_per_section
+        self.__paragraph_words = paragraph_words
+        self.__random = random.Random(seed)
+        self.__title_count = 0
+
+        section_count = max(1, atoms // (paragraphs_per_section + 1))
+        # Each top-level section has fanout subsections on each level below
+        # it, so about fanout top-level sections use up the atoms.
+        self.__fanout = max(1, math.floor(section_count ** (1 / depth)))
+
+    def generate(self):
+        """Return the policy as an ElementTree element."""
+        policy = ElementTree.Element("policy")
+        ElementTree.SubElement(policy, "title").text = "Synthetic Privacy Policy"
+        ElementTree.SubElement(policy, "date").text = "2020-01-01"
+        ElementTree.SubElement(policy, "url").text = "https://example.com/privacy"
+        self.__remaining -= 1
+
+        # Keep adding top-level sections until every atom is used.
+        while self.__remaining > 0:
+            self.__add_section(policy, "section", 1)
+        return policy
+
+    def __add_section(self, parent, tag, level):
+        """Add a section with paragraphs and nested subsections to the given
+           parent element."""
+        section = ElementTree.SubElement(parent, tag)
+        ElementTree.SubElement(section, "title").text = self.__title()
+        self.__remaining -= 1
+
+        for _ in range(min(self.__paragraphs_per_section, self.__remaining)):
+            ElementTree.SubElement(section, "paragraph").text = self.__paragraph()
+            self.__remaining -= 1
+
+        if level < self.__depth:
+            for _ in range(self.__fanout):
+                if self.__remaining <= 0:
+                    break
+                self.__add_section(section, "subsection", level + 1)
+
+    def __title(self):
+        """Return a new, unique section title."""
+        self.__title_count += 1
+        words = self.__random.sample(WORDS, self.__random.randint(2, 5))
+        return " ".join(words).capitalize() + f" {self.__title_count}"
+
+    def __paragraph(self):
+        """Return the text of a paragraph."""
+        words = self.__random.choices(WORDS, k=max(1, self.__paragraph_words))
+        sentences = [" ".join(words[i:i + 12]).capitalize() + "." for i in range(0, len(words), 12)]
+        return " ".join(sentences)
+
+
+def generate_policy_xml(atoms, depth=2, paragraphs_per_section=4, paragraph_words=60, seed=0):
+    """Return the XML of a synthetic policy with the given number of atoms as
+       bytes."""
+    policy = PolicyGenerator(atoms, depth, paragraphs_per_section, paragraph_words, seed).generate()
+    return ElementTree.tostring(policy, encoding="UTF-8", xml_declaration=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic policy XML file.")
+    parser.add_argument("--atoms", type=int, default=1000, help="number of titles and paragraphs")
+    parser.add_argument("--depth", type=int, default=2, help="how deeply sections are nested")
+    parser.add_argument("--paragraphs", type=int, default=4, help="paragraphs in each section")
+    parser.add_argument("--paragraph-words", type=int, default=60, help="words in each paragraph")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("-o", "--output", required=True, help="XML file to write")
+    args = parser.parse_args()
+
+    with open(args.output, "wb") as file:
+        file.write(generate_policy_xml(args.atoms, args.depth, args.paragraphs, args.paragraph_words, args.seed))
+
+
+if __name__ == "__main__":
+    main()
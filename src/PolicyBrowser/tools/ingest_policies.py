@@ -0,0 +1,409 @@
+# Batch conversion of vendor privacy policies into policy XML and snapshots.
+#
+# Policies published as HTML or plain text are converted into the
+# <policy><section><title>/<paragraph> schema read by PrivacyPolicy, loaded
+# back to validate them and compiled into snapshots, ready to be bundled
+# with the skill or uploaded under Media/policies/ in the persistence bucket.
+# Files are converted in parallel across a process pool, and a file whose
+# outputs are newer than it is skipped unless --force is given, so a nightly
+# refresh only converts the policies that changed.
+#
+# HTML headings become titles: the first <h1> is the policy's title, <h2>
+# starts a section and <h3> to <h6> start a subsection.  <p> and <li>
+# elements become paragraphs.  In plain text, the first line is the policy's
+# title, paragraphs are separated by blank lines and a short line on its own
+# with no closing punctuation (or a numbered line such as "2. Cookies" or
+# "2.1 Analytics") is a heading.
+#
+# Every policy needs a date and a URL.  The date is taken from a "Last
+# updated" or "Effective date" line when there is one, and the URL from the
+# HTML's canonical link; --date and --base-url supply them otherwise.
+#
+# ## Example Usage:
+#
+# Convert every policy in vendor_policies/ into out/, with 8 processes
+# > python ingest_policies.py vendor_policies/ -o out/ -j 8 --base-url https://example.com/privacy/
+#
+# Write a JSON report of the run
+# > python ingest_policies.py vendor_policies/*.html -o out/ --report report.json
+
+import argparse
+import concurrent.futures
+import datetime
+import html.parser
+import json
+import os
+import re
+import sys
+import time
+from xml.etree import ElementTree
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lambda"))
+
+import policy_snapshot
+from policy_registry import POLICY_ID_PATTERN
+from privacy_policy import PrivacyPolicy
+
+INPUT_SUFFIXES = (".html", ".htm", ".txt")
+
+DATE_PATTERN = re.compile(r"(?:last\s+(?:updated|modified|revised)|effective(?:\s+date)?)\s*(?:on|as\s+of)?\s*:?\s*"
+                          r"([A-Za-z]+\.?\s+\d{1,2},?\s+\d{4}|\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})",
+                          re.IGNORECASE)
+DATE_FORMATS = ("%Y-%m-%d", "%B %d, %Y", "%B %d %Y", "%b %d, %Y", "%b %d %Y", "%b. %d, %Y", "%m/%d/%Y")
+NUMBERED_HEADING = re.compile(r"^(\d+(?:\.\d+)*)\.?\s+(?=\S)")
+
+# Longest line of plain text that can be a heading.
+MAX_HEADING_LENGTH = 80
+
+
+class IngestError(Exception):
+    """Raised when a policy cannot be converted or fails validation."""
+
+
+class PolicyDocument:
+    """Represent a policy as converted from its source, before it is written
+       as XML."""
+
+    def __init__(self, title=None):
+        """Construct an empty policy with the given title."""
+        self.title = title
+        self.date = None
+        self.url = None
+        # Each section is a [title, paragraphs, subsections] list, and each
+        # subsection a [title, paragraphs] list.
+        self.preamble = []
+        self.sections = []
+
+    def add_heading(self, level, text):
+        """Start a section (level 2) or subsection (level 3 or more) with the
+           given title, or set the policy's title (level 1)."""
+        if level <= 1 and self.title is None and not self.sections:
+            self.title = text
+        elif level <= 2 or not self.sections:
+            self.sections.append([text, [], []])
+        else:
+            self.sections[-1][2].append([text, []])
+
+    def add_paragraph(self, text):
+        """Add a paragraph to the section or subsection most recently
+           started."""
+        text = " ".join(text.split())
+        if not text:
+            return
+        if not self.sections:
+            self.preamble.append(text)
+        elif self.sections[-1][2]:
+            self.sections[-1][2][-1][1].append(text)
+        else:
+            self.sections[-1][1].append(text)
+
+    def to_xml(self):
+        """Return this policy as policy XML bytes."""
+        policy = ElementTree.Element("policy")
+        ElementTree.SubElement(policy, "title").text = self.title
+        ElementTree.SubElement(policy, "date").text = self.date
+        ElementTree.SubElement(policy, "url").text = self.url
+
+        sections = self.sections
+        if self.preamble:
+            sections = [["Introduction", self.preamble, []]] + sections
+
+        for title, paragraphs, subsections in sections:
+            section = ElementTree.SubElement(policy, "section")
+            ElementTree.SubElement(section, "title").text = title
+            for paragraph in paragraphs:
+                ElementTree.SubElement(section, "paragraph").text = paragraph
+            for subsection_title, subsection_paragraphs in subsections:
+                subsection = ElementTree.SubElement(section, "subsection")
+                ElementTree.SubElement(subsection, "title").text = subsection_title
+                for paragraph in subsection_paragraphs:
+                    ElementTree.SubElement(subsection, "paragraph").text = paragraph
+
+        if hasattr(ElementTree, "indent"):
+            ElementTree.indent(policy, space="\t")
+        return ElementTree.tostring(policy, encoding="UTF-8", xml_declaration=True) + b"\n"
+
+
+class PolicyHTMLParser(html.parser.HTMLParser):
+    """Convert a policy's HTML into a PolicyDocument."""
+
+    SKIPPED_TAGS = {"script", "style", "nav", "header", "footer", "noscript", "template"}
+    HEADING_TAGS = {"h1": 1, "h2": 2, "h3": 3, "h4": 3, "h5": 3, "h6": 3}
+    PARAGRAPH_TAGS = {"p", "li", "dd", "blockquote"}
+    BREAK_TAGS = {"div", "section", "article", "ul", "ol", "table", "tr", "br"}
+
+    def __init__(self):
+        """Construct a parser for one HTML document."""
+        super().__init__(convert_charrefs=True)
+        self.document = PolicyDocument()
+        self.__skipping = 0
+        self.__text = []
+        self.__heading_level = None
+        self.__in_title = False
+        self.__page_title = None
+
+    def handle_starttag(self, tag, attrs):
+        """Track the structure opened by a start tag."""
+        attrs = dict(attrs)
+        if tag in self.SKIPPED_TAGS:
+            self.__skipping += 1
+        elif tag == "title":
+            self.__in_title = True
+        elif tag == "link" and "canonical" in (attrs.get("rel") or "").split():
+            self.document.url = self.document.url or attrs.get("href")
+        elif tag == "meta" and attrs.get("property") == "og:url":
+            self.document.url = self.document.url or attrs.get("content")
+        elif tag in self.HEADING_TAGS or tag in self.PARAGRAPH_TAGS or tag in self.BREAK_TAGS:
+            self.__flush()
+            if tag in self.HEADING_TAGS:
+                self.__heading_level = self.HEADING_TAGS[tag]
+
+    def handle_endtag(self, tag):
+        """Finish the heading or paragraph closed by an end tag."""
+        if tag in self.SKIPPED_TAGS:
+            self.__skipping = max(self.__skipping - 1, 0)
+        elif tag == "title":
+            self.__in_title = False
+        elif tag in self.HEADING_TAGS or tag in self.PARAGRAPH_TAGS or tag in self.BREAK_TAGS:
+            self.__flush()
+
+    def handle_data(self, data):
+        """Collect the text of the current heading or paragraph."""
+        if self.__in_title:
+            self.__page_title = (self.__page_title or "") + data
+        elif not self.__skipping:
+            self.__text.append(data)
+
+    def close(self):
+        """Finish the document, falling back to the page title for the
+           policy's title."""
+        super().close()
+        self.__flush()
+        if self.document.title is None and self.__page_title:
+            self.document.title = " ".join(self.__page_title.split())
+
+    def __flush(self):
+        """Add the text collected so far as a heading or paragraph."""
+        text = " ".join("".join(self.__text).split())
+        self.__text = []
+        if text:
+            if self.__heading_level is not None:
+                self.document.add_heading(self.__heading_level, text)
+            else:
+                self.document.add_paragraph(text)
+        self.__heading_level = None
+
+
+def is_text_heading(line, next_line):
+    """Return the heading level of a line of plain text followed by the given
+       line, or None if it is not a heading."""
+    if len(line) > MAX_HEADING_LENGTH or DATE_PATTERN.search(line):
+        return None
+    numbered = NUMBERED_HEADING.match(line)
+    if numbered and (len(line.split()) <= 8 or not line.endswith((".", ":", ";", ","))):
+        return 2 + min(numbered.group(1).count("."), 1)
+    if line.isupper() or (not next_line and not line.endswith((".", ":", ";", ",", "?", "!"))):
+        return 2
+    return None
+
+
+def parse_text(text):
+    """Return a PolicyDocument converted from plain text."""
+    lines = [line.strip() for line in text.splitlines()]
+    document = PolicyDocument()
+    paragraph = []
+
+    for i, line in enumerate(lines):
+        if not line:
+            document.add_paragraph(" ".join(paragraph))
+            paragraph = []
+            continue
+        if document.title is None:
+            document.title = line
+            continue
+
+        next_line = lines[i + 1] if i + 1 < len(lines) else ""
+        level = None if paragraph else is_text_heading(line, next_line)
+        if level is None:
+            paragraph.append(line)
+        else:
+            document.add_heading(level, NUMBERED_HEADING.sub("", line, count=1))
+
+    document.add_paragraph(" ".join(paragraph))
+    return document
+
+
+def parse_date(text):
+    """Return the ISO date of the first "last updated" or "effective date"
+       statement in the given text, or None if there is none."""
+    match = DATE_PATTERN.search(text)
+    if match is None:
+        return None
+    value = " ".join(match.group(1).split())
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(value, date_format).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def policy_id_for(source_file):
+    """Return the policy id for the given source file, from its name."""
+    stem = os.path.splitext(os.path.basename(source_file))[0]
+    policy_id = re.sub(r"[^A-Za-z0-9_.-]+", "-", stem).strip("-.") or "policy"
+    if not POLICY_ID_PATTERN.match(policy_id):
+        policy_id = "policy-" + policy_id
+    return policy_id
+
+
+def convert(source_file, default_date=None, base_url=None):
+    """Return the PolicyDocument converted from the given HTML or plain text
+       file.  Raises IngestError if it has no date or URL."""
+    with open(source_file, "r", encoding="utf-8", errors="replace") as file:
+        text = file.read()
+
+    if source_file.lower().endswith((".html", ".htm")):
+        parser = PolicyHTMLParser()
+        parser.feed(text)
+        parser.close()
+        document = parser.document
+    else:
+        document = parse_text(text)
+
+    if document.title is None:
+        document.title = "Privacy Policy"
+    document.date = parse_date(text) or default_date
+    if document.url is None and base_url:
+        document.url = base_url + policy_id_for(source_file)
+
+    if not document.date:
+        raise IngestError("No date found; give one with --date.")
+    if not document.url:
+        raise IngestError("No URL found; give one with --base-url.")
+    return document
+
+
+def validate(xml_file):
+    """Load the given policy XML file and return the policy.  Raises
+       IngestError if it cannot be read by the skill."""
+    try:
+        policy = PrivacyPolicy(xml_file, use_snapshot=False)
+    except (ValueError, ElementTree.ParseError) as e:
+        raise IngestError(f"Invalid policy XML: {e}")
+
+    if not policy.sections:
+        raise IngestError("The policy has no sections.")
+    for number, section in enumerate(policy.sections):
+        if not len(section.all_atoms) > 1:
+            raise IngestError(f"Section {number + 1} ({section.title}) has no paragraphs.")
+    return policy
+
+
+def write_atomically(path, data):
+    """Write data to the given path so readers never see a partial file."""
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb") as file:
+        file.write(data)
+    os.replace(temp_file, path)
+
+
+def is_up_to_date(source_file, xml_file, snapshot_file):
+    """Return true if both outputs exist and are newer than the source."""
+    try:
+        source_mtime = os.stat(source_file).st_mtime_ns
+        return min(os.stat(xml_file).st_mtime_ns, os.stat(snapshot_file).st_mtime_ns) >= source_mtime
+    except FileNotFoundError:
+        return False
+
+
+def ingest(source_file, output_dir, default_date=None, base_url=None, force=False):
+    """Convert, validate and compile one policy file, and return a result
+       dictionary for the report."""
+    started = time.perf_counter()
+    policy_id = policy_id_for(source_file)
+    xml_file = os.path.join(output_dir, policy_id + ".xml")
+    snapshot_file = policy_snapshot.snapshot_path_for(xml_file)
+    result = {"source": source_file, "policy_id": policy_id, "xml": xml_file, "snapshot": snapshot_file}
+
+    try:
+        if not force and is_up_to_date(source_file, xml_file, snapshot_file):
+            result["status"] = "skipped"
+        else:
+            document = convert(source_file, default_date, base_url)
+            temp_xml = xml_file + ".new"
+            write_atomically(temp_xml, document.to_xml())
+            try:
+                policy = validate(temp_xml)
+                os.replace(temp_xml, xml_file)
+            finally:
+                if os.path.exists(temp_xml):
+                    os.remove(temp_xml)
+            policy_snapshot.compile_snapshot(xml_file, snapshot_file)
+            result.update(status="ok", sections=len(policy.sections), atoms=len(policy.all_atoms))
+    except (IngestError, OSError) as e:
+        result.update(status="failed", error=str(e))
+
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def find_sources(paths):
+    """Return the policy source files named by the given files and
+       directories."""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, _, file_names in os.walk(path):
+                sources.extend(os.path.join(directory, file_name) for file_name in sorted(file_names)
+                               if file_name.lower().endswith(INPUT_SUFFIXES))
+        else:
+            sources.append(path)
+    return sources
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert HTML and plain text privacy policies into policy XML "
+                                                 "and snapshots.")
+    parser.add_argument("paths", nargs="+", help="policy files, or directories to search for them")
+    parser.add_argument("-o", "--output", required=True, help="directory to write policies to")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count(), help="number of processes")
+    parser.add_argument("--date", help="date (YYYY-MM-DD) for policies that do not state one")
+    parser.add_argument("--base-url", help="URL prefix, followed by the policy id, for policies without a URL")
+    parser.add_argument("--force", action="store_true", help="convert files even if their outputs are current")
+    parser.add_argument("--report", help="write a JSON report of every file to this path")
+    args = parser.parse_args()
+
+    sources = find_sources(args.paths)
+    os.makedirs(args.output, exist_ok=True)
+    started = time.perf_counter()
+    results = []
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max(args.jobs, 1)) as executor:
+        futures = [executor.submit(ingest, source, args.output, args.date, args.base_url, args.force)
+                   for source in sources]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            progress = f"[{len(results)}/{len(sources)}]"
+            if result["status"] == "failed":
+                print(f"{progress} FAILED {result['source']}: {result['error']}", file=sys.stderr)
+            elif result["status"] == "skipped":
+                print(f"{progress} skipped {result['source']} (up to date)")
+            else:
+                print(f"{progress} ok {result['source']} -> {result['xml']} ({result['sections']} sections)")
+
+    failed = [result for result in results if result["status"] == "failed"]
+    elapsed = time.perf_counter() - started
+    print(f"{len(results) - len(failed)} of {len(results)} policies ingested in {elapsed:.1f}s, {len(failed)} failed.")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({"seconds": round(elapsed, 3), "results": sorted(results, key=lambda r: r["source"])},
+                      file, indent=2)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+# Batch migration of stored consent records to the current policy versions.
+#
+# Consent is migrated lazily as each user's attributes are read by the
+# skill, but users who do not come back keep records for old policy
+# versions (or the legacy "acceptedSections" list) indefinitely.  This tool
+# walks the persistent attributes that S3Adapter stores in the persistence
+# bucket, one object per user keyed by user id, and brings every consent
+# record up to date with consent_state.migrate_attributes: acceptance of
+# unchanged sections is carried forward and changed or new sections are
+# marked for review.
+#
+# Users are migrated in parallel across a thread pool.  Each object is
+# written back only if it changed, and only if the skill has not saved it
+# since it was read (the write is conditional on its ETag); an object that
+# changed meanwhile is read and migrated again.
+#
+# ## Example Usage:
+#
+# Report what would change, without writing anything
+# > python migrate_consent.py --bucket my-skill-bucket --dry-run
+#
+# Migrate every user with 32 threads, with policies found in the skill's
+# lambda directory or under Media/policies/ in the bucket
+# > python migrate_consent.py --bucket my-skill-bucket -j 32 --report report.json
+
+import argparse
+import collections
+import concurrent.futures
+import json
+import os
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+LAMBDA_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "lambda")
+sys.path.append(LAMBDA_DIRECTORY)
+
+from consent_state import migrate_attributes
+from policy_registry import PolicyRegistry, LocalPolicySource, S3PolicySource
+
+# Amazon user ids, which S3Adapter uses as the keys of persistent attributes.
+USER_KEY_PREFIX = "amzn1.ask.account."
+CONFLICT_CODES = ("PreconditionFailed", "ConditionalRequestConflict", "412", "409")
+WRITE_ATTEMPTS = 5
+
+
+class PolicyCache:
+    """Load each policy once for the whole migration, from threads."""
+
+    def __init__(self, registry):
+        """Construct a cache of the policies in the given registry."""
+        self.__registry = registry
+        self.__policies = {}
+        self.__lock = threading.Lock()
+
+    def get(self, policy_id):
+        """Return the policy with the given id, or None if there is none."""
+        with self.__lock:
+            if policy_id not in self.__policies:
+                try:
+                    self.__policies[policy_id] = self.__registry.get(policy_id)
+                except KeyError:
+                    self.__policies[policy_id] = None
+            return self.__policies[policy_id]
+
+
+def migrate_user(attributes, policies, default_policy_id):
+    """Migrate every consent record in one user's attributes in place and
+       return the ids of the policies whose records changed, and of those
+       that could not be found."""
+    # The legacy list belongs to the default policy, and saving any record
+    # drops it, so the default policy goes first.
+    policy_ids = list(attributes.get("consent", {}))
+    if "acceptedSections" in attributes:
+        policy_ids = [default_policy_id] + [policy_id for policy_id in policy_ids if policy_id != default_policy_id]
+
+    changed = []
+    missing = []
+    for policy_id in policy_ids:
+        policy = policies.get(policy_id)
+        if policy is None:
+            missing.append(policy_id)
+        elif migrate_attributes(attributes, policy_id, policy):
+            changed.append(policy_id)
+    return changed, missing
+
+
+def migrate_object(client, bucket, key, policies, default_policy_id, dry_run=False):
+    """Migrate the attributes stored under the given key and return a result
+       dictionary for the report."""
+    result = {"key": key}
+    for _ in range(WRITE_ATTEMPTS):
+        try:
+            response = client.get_object(Bucket=bucket, Key=key)
+            attributes = json.loads(response["Body"].read())
+        except (ValueError, ClientError) as e:
+            result.update(status="failed", error=str(e))
+            return result
+
+        changed, missing = migrate_user(attributes, policies, default_policy_id)
+        result.update(changed=changed, missing=missing)
+        if not changed:
+            result["status"] = "unchanged"
+            return result
+        if dry_run:
+            result["status"] = "migrated"
+            return result
+
+        try:
+            client.put_object(Bucket=bucket, Key=key, Body=json.dumps(attributes), IfMatch=response["ETag"])
+            result["status"] = "migrated"
+            return result
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in CONFLICT_CODES:
+                result.update(status="failed", error=str(e))
+                return result
+            # Saved by the skill since it was read; migrate the new version.
+
+    result.update(status="failed", error=f"Changed by another writer {WRITE_ATTEMPTS} times")
+    return result
+
+
+def list_keys(client, bucket, prefix):
+    """Yield the keys of every object in the bucket with the given prefix."""
+    options = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        page = client.list_objects_v2(**options)
+        for item in page.get("Contents", []):
+            yield item["Key"]
+        if not page.get("IsTruncated"):
+            return
+        options["ContinuationToken"] = page["NextContinuationToken"]
+
+
+def migrate_bucket(client, bucket, policies, default_policy_id, prefix=USER_KEY_PREFIX, jobs=8, dry_run=False,
+                   progress=None):
+    """Migrate every user's attributes in the bucket and return the list of
+       result dictionaries.  progress, if given, is called with each result
+       as it is made."""
+    results = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        futures = [executor.submit(migrate_object, client, bucket, key, policies, default_policy_id, dry_run)
+                   for key in list_keys(client, bucket, prefix)]
+        for future in concurrent.futures.as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if progress is not None:
+                progress(result)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate stored consent records to the current policy versions.")
+    parser.add_argument("--bucket", default=os.environ.get("S3_PERSISTENCE_BUCKET"),
+                        help="persistence bucket (default: $S3_PERSISTENCE_BUCKET)")
+    parser.add_argument("--prefix", default=USER_KEY_PREFIX, help="key prefix of the users' attributes")
+    parser.add_argument("--policy-id", default=os.environ.get("POLICY_ID", "policy"),
+                        help="id of the default policy, which legacy records belong to")
+    parser.add_argument("--policies", default=LAMBDA_DIRECTORY,
+                        help="directory of bundled policies, searched before the bucket")
+    parser.add_argument("-j", "--jobs", type=int, default=8, help="number of threads")
+    parser.add_argument("--dry-run", action="store_true", help="report what would change without writing")
+    parser.add_argument("--report", help="write a JSON report of every user to this path")
+    args = parser.parse_args()
+
+    if not args.bucket:
+        parser.error("--bucket is required when S3_PERSISTENCE_BUCKET is not set")
+
+    import boto3
+    client = boto3.client("s3", region_name=os.environ.get("S3_PERSISTENCE_REGION"))
+    registry = PolicyRegistry([LocalPolicySource(args.policies), S3PolicySource(args.bucket, client=client)],
+                              max_policies=1024, revalidate_after=float("inf"))
+    policies = PolicyCache(registry)
+
+    started = time.perf_counter()
+    counts = collections.Counter()
+
+    def progress(result):
+        counts[result["status"]] += 1
+        if result["status"] == "failed":
+            print(f"FAILED {result['key']}: {result['error']}", file=sys.stderr)
+        elif result.get("missing"):
+            print(f"{result['key']}: no policy {', '.join(result['missing'])}", file=sys.stderr)
+        done = sum(counts.values())
+        if done % 1000 == 0:
+            print(f"[{done}] {dict(counts)}")
+
+    results = migrate_bucket(client, args.bucket, policies, args.policy_id, args.prefix, args.jobs, args.dry_run,
+                             progress)
+    elapsed = time.perf_counter() - started
+    action = "would be migrated" if args.dry_run else "migrated"
+    print(f"{counts['migrated']} of {len(results)} users {action} in {elapsed:.1f}s, "
+          f"{counts['unchanged']} unchanged, {counts['failed']} failed.")
+
+    if args.report:
+        with open(args.report, "w") as file:
+            json.dump({"seconds": round(elapsed, 3), "dry_run": args.dry_run,
+                       "results": sorted(results, key=lambda result: result["key"])}, file, indent=2)
+
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
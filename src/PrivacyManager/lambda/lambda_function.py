@@ -2,31 +2,47 @@
 # Privacy Manager skill to allow users to delegate access to specific recordings and files to other users
 
 import logging
-import ask_sdk_core.utils as ask_utils
 import os
 
+# Imported first so that, with STARTUP_PROFILE set, every import below is
+# timed (see the startup module).
+import startup
+import ask_sdk_core.utils as ask_utils
+import metrics
+
 from ask_sdk_core.skill_builder import CustomSkillBuilder
 from ask_sdk_core.dispatch_components import AbstractRequestHandler
 from ask_sdk_core.dispatch_components import AbstractExceptionHandler
+from ask_sdk_core.dispatch_components import AbstractRequestInterceptor, AbstractResponseInterceptor
 from ask_sdk_core.handler_input import HandlerInput
 
 from ask_sdk_model import Response
 
-from ask_sdk_model.interfaces.audioplayer import AudioItem, Stream, PlayDirective, PlayBehavior
-
-from ask_sdk_s3.adapter import S3Adapter
+from intent_router import IntentRouter
 
 from utils import read_file, does_user_exist, does_file_exists, create_new_user, sign_in, sign_out, \
                   is_logged_in, get_current_user, make_request, add_recording, list_requests, \
                   create_presigned_url, accept_request, deny_request, list_access_from, list_all_access, \
-                  revoke_access, list_file_names, list_preferences
+                  revoke_access, list_file_names, list_preferences, get_s3_client, begin_work, flush_work, \
+                  ConcurrentChangeError
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
-s3_adapter = S3Adapter(bucket_name=os.environ["S3_PERSISTENCE_BUCKET"])
+
+def create_s3_adapter():
+    """Return the S3 persistence adapter, sharing the S3 client of the utils
+       module.  Importing ask_sdk_s3 (and with it boto3) and creating the
+       client are the costliest parts of a cold start, so they wait for the
+       first request that reads or writes persistent attributes."""
+    from ask_sdk_s3.adapter import S3Adapter
+    return S3Adapter(bucket_name=os.environ["S3_PERSISTENCE_BUCKET"], s3_client=get_s3_client())
+
+s3_adapter = metrics.MetricsPersistenceAdapter(startup.LazyPersistenceAdapter("S3 adapter", create_s3_adapter))
 
 class LaunchRequestHandler(AbstractRequestHandler):
     """Handler for Skill Launch."""
+    request_types = ("LaunchRequest",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
 
@@ -50,6 +66,8 @@ class LaunchRequestHandler(AbstractRequestHandler):
 
 class LoginIntentHandler(AbstractRequestHandler):
     """Handler for user login function."""
+    intents = ("Login",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("Login")(handler_input)
         
@@ -71,6 +89,8 @@ class LoginIntentHandler(AbstractRequestHandler):
 
 class LogoutIntentHandler(AbstractRequestHandler):
     """Handler for user logout function."""
+    intents = ("Logout",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("Logout")(handler_input)
         
@@ -90,6 +110,8 @@ class LogoutIntentHandler(AbstractRequestHandler):
 
 class CreateNewUserIntentHandler(AbstractRequestHandler):
     """Handler for new user creation dialog."""
+    intents = ("CreateNewUser",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("CreateNewUser")(handler_input)
     
@@ -112,6 +134,8 @@ class CreateNewUserIntentHandler(AbstractRequestHandler):
 
 class MakeRequestIntentHandler(AbstractRequestHandler):
     """Handler for requesting access from another user."""
+    intents = ("MakeRequest",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("MakeRequest")(handler_input)
     
@@ -145,6 +169,8 @@ class MakeRequestIntentHandler(AbstractRequestHandler):
 
 class AcceptRequestIntentHandler(AbstractRequestHandler):
     """Handler for accepting an access request from another user."""
+    intents = ("AcceptRequest",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("AcceptRequest")(handler_input)
     
@@ -187,6 +213,8 @@ class AcceptRequestIntentHandler(AbstractRequestHandler):
     
 class DenyRequestIntentHandler(AbstractRequestHandler):
     """Handler for denying an access request from another user."""
+    intents = ("DenyRequest",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("DenyRequest")(handler_input)
 
@@ -217,6 +245,8 @@ class DenyRequestIntentHandler(AbstractRequestHandler):
     
 class HasAccessIntentHandler(AbstractRequestHandler):
     """Handler for determining whether or not the user has access to another user's data."""
+    intents = ("HasAccess",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("HasAccess")(handler_input)
     
@@ -256,6 +286,8 @@ class HasAccessIntentHandler(AbstractRequestHandler):
 
 class AllAccessIntentHandler(AbstractRequestHandler):
     """Handler for determining all data from other users that the current user has access to."""
+    intents = ("AllAccess",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("AllAccess")(handler_input)
     
@@ -264,7 +296,7 @@ class AllAccessIntentHandler(AbstractRequestHandler):
             speak_output = "Sorry, but you need to be logged in to check for access from another user. "
         else:
             requester = get_current_user(handler_input)
-            response = list_all_access(requester)
+            response, truncated = list_all_access(requester)
             speech_lines = []
             for requestee in response.keys():
                 for access_tuple in response[requestee]:
@@ -277,8 +309,13 @@ class AllAccessIntentHandler(AbstractRequestHandler):
             
             if len(speech_lines) > 0:
                 speak_output = " ".join(speech_lines)
+            elif truncated:
+                speak_output = "I couldn't find anyone who has given you access to their recordings yet."
             else:
                 speak_output = "It seems like no one has given you access to their recordings yet."
+            
+            if truncated:
+                speak_output = speak_output + " I ran out of time before checking everyone, so please ask me again for the full list."
         
         speak_output = speak_output + " What would you like to do?"
         
@@ -291,6 +328,8 @@ class AllAccessIntentHandler(AbstractRequestHandler):
 
 class ListPreferencesIntentHandler(AbstractRequestHandler):
     """Handler for listing out all current privacy preferences in the user's account."""
+    intents = ("ListPreferences",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("ListPreferences")(handler_input)
     
@@ -316,6 +355,8 @@ class ListPreferencesIntentHandler(AbstractRequestHandler):
 
 class RevokeAccessIntentHandler(AbstractRequestHandler):
     """Handler for revoking another user's access to the current user's data."""
+    intents = ("RevokeAccess",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("RevokeAccess")(handler_input)
     
@@ -359,6 +400,8 @@ class RevokeAccessIntentHandler(AbstractRequestHandler):
 
 class ListCurrentRequestsIntentHandler(AbstractRequestHandler):
     """Handler for listing all pending requests to the current user."""
+    intents = ("ListRequests",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("ListRequests")(handler_input)
     
@@ -385,6 +428,8 @@ class ListCurrentRequestsIntentHandler(AbstractRequestHandler):
 
 class ListFilesIntentHandler(AbstractRequestHandler):
     """Handler for listing the filenames of all recordings currently in the user's directory."""
+    intents = ("ListFiles",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("ListFiles")(handler_input)
     
@@ -413,6 +458,8 @@ class ListFilesIntentHandler(AbstractRequestHandler):
 
 class AddRecordingIntentHandler(AbstractRequestHandler):
     """Handler for moving recordings from a sample folder into a user folder. Mostly for testing, demonstration purposes."""
+    intents = ("AddRecording",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("AddRecording")(handler_input)
     
@@ -438,14 +485,19 @@ class AddRecordingIntentHandler(AbstractRequestHandler):
 class PlayRecordingIntentHandler(AbstractRequestHandler):
     """Handler for audio playback of files within the user folder.
     IMPORTANT NOTE: audio playback not supported in the SDK, only on a real device."""
+    intents = ("PlayRecording",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("PlayRecording")(handler_input)
     
     def handle(self, handler_input):
+        # Only this handler needs the audio player models.
+        from ask_sdk_model.interfaces.audioplayer import AudioItem, Stream, PlayDirective, PlayBehavior
+
         current_user = get_current_user(handler_input)
         file_name = handler_input.request_envelope.request.intent.slots['file_name'].value
         recording_key = f"Media/users/{current_user}/recordings/{file_name}.m4a"
-        if does_file_exists(file_name, f"Media/users/{current_user}/recordings/"):
+        if does_file_exists(f"{file_name}.m4a", f"Media/users/{current_user}/recordings/"):
             recording_url = create_presigned_url(recording_key)
             handler_input.response_builder.add_directive(
                 PlayDirective(play_behavior=PlayBehavior.REPLACE_ALL,
@@ -458,6 +510,8 @@ class PlayRecordingIntentHandler(AbstractRequestHandler):
 
 # Just for testing purposes
 class ReadFileIntentHandler(AbstractRequestHandler):
+    intents = ("ReadFile",)
+
     def can_handle(self, handler_input):
         return ask_utils.is_intent_name("ReadFile")(handler_input)
         
@@ -473,6 +527,8 @@ class ReadFileIntentHandler(AbstractRequestHandler):
     
 class HelloWorldIntentHandler(AbstractRequestHandler):
     """Handler for Hello World Intent."""
+    intents = ("HelloWorldIntent",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return ask_utils.is_intent_name("HelloWorldIntent")(handler_input)
@@ -490,6 +546,8 @@ class HelloWorldIntentHandler(AbstractRequestHandler):
 
 class HelpIntentHandler(AbstractRequestHandler):
     """Handler for Help Intent."""
+    intents = ("AMAZON.HelpIntent",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return ask_utils.is_intent_name("AMAZON.HelpIntent")(handler_input)
@@ -508,6 +566,8 @@ class HelpIntentHandler(AbstractRequestHandler):
 
 class CancelOrStopIntentHandler(AbstractRequestHandler):
     """Single handler for Cancel and Stop Intent."""
+    intents = ("AMAZON.CancelIntent", "AMAZON.StopIntent")
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return (ask_utils.is_intent_name("AMAZON.CancelIntent")(handler_input) or
@@ -525,6 +585,8 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
 
 class FallbackIntentHandler(AbstractRequestHandler):
     """Single handler for Fallback Intent."""
+    intents = ("AMAZON.FallbackIntent",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return ask_utils.is_intent_name("AMAZON.FallbackIntent")(handler_input)
@@ -539,6 +601,8 @@ class FallbackIntentHandler(AbstractRequestHandler):
 
 class SessionEndedRequestHandler(AbstractRequestHandler):
     """Handler for Session End."""
+    request_types = ("SessionEndedRequest",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return ask_utils.is_request_type("SessionEndedRequest")(handler_input)
@@ -557,6 +621,8 @@ class IntentReflectorHandler(AbstractRequestHandler):
     for your intents by defining them above, then also adding them to the request
     handler chain below.
     """
+    request_types = ("IntentRequest",)
+
     def can_handle(self, handler_input):
         # type: (HandlerInput) -> bool
         return ask_utils.is_request_type("IntentRequest")(handler_input)
@@ -573,6 +639,29 @@ class IntentReflectorHandler(AbstractRequestHandler):
         )
 
 
+class ConcurrentChangeExceptionHandler(AbstractExceptionHandler):
+    """Handler for changes that could not be saved because someone else changed the same
+    records during the turn in a way that made the turn's response wrong, such as accepting the
+    request it accepted. The change was not saved, so the user is asked to try again.
+    """
+    def can_handle(self, handler_input, exception):
+        # type: (HandlerInput, Exception) -> bool
+        return isinstance(exception, ConcurrentChangeError)
+
+    def handle(self, handler_input, exception):
+        # type: (HandlerInput, Exception) -> Response
+        logger.warning(exception)
+
+        speak_output = "Sorry, someone else changed those permissions at the same time, so I didn't save that. Please try again."
+
+        return (
+            handler_input.response_builder
+                .speak(speak_output)
+                .ask(speak_output)
+                .response
+        )
+
+
 class CatchAllExceptionHandler(AbstractExceptionHandler):
     """Generic error handling to capture any syntax or routing errors. If you receive an error
     stating the request handler chain is not found, you have not implemented a handler for
@@ -595,35 +684,64 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
                 .response
         )
 
+class UnitOfWorkRequestInterceptor(AbstractRequestInterceptor):
+    """Shares the documents read during each turn between the helpers that need them."""
+    def process(self, handler_input):
+        begin_work()
+
+
+class UnitOfWorkResponseInterceptor(AbstractResponseInterceptor):
+    """Writes the documents changed during each turn, once each. If someone else changed them
+    since the turn read them, the turn's changes are applied again to their versions. If that
+    would change the turn's response, or the write fails, an exception handler responds instead
+    of the response built from the turn's copies; turns whose handler fails write nothing.
+    """
+    def process(self, handler_input, response):
+        flush_work()
+
 # The SkillBuilder object acts as the entry point for the skill, routing all request and response
 # payloads to the handlers above. Make sure any new handlers or interceptors you've
 # defined are included below. The order matters - they're processed top to bottom.
 
 sb = CustomSkillBuilder(persistence_adapter=s3_adapter)
-
-sb.add_request_handler(LaunchRequestHandler())
-sb.add_request_handler(HelloWorldIntentHandler())
-sb.add_request_handler(CreateNewUserIntentHandler())
-sb.add_request_handler(LoginIntentHandler())
-sb.add_request_handler(LogoutIntentHandler())
-sb.add_request_handler(MakeRequestIntentHandler())
-sb.add_request_handler(AcceptRequestIntentHandler())
-sb.add_request_handler(DenyRequestIntentHandler())
-sb.add_request_handler(HasAccessIntentHandler())
-sb.add_request_handler(AllAccessIntentHandler())
-sb.add_request_handler(RevokeAccessIntentHandler())
-sb.add_request_handler(AddRecordingIntentHandler())
-sb.add_request_handler(ListFilesIntentHandler())
-sb.add_request_handler(ListCurrentRequestsIntentHandler())
-sb.add_request_handler(ListPreferencesIntentHandler())
-sb.add_request_handler(PlayRecordingIntentHandler())
-sb.add_request_handler(ReadFileIntentHandler())
-sb.add_request_handler(HelpIntentHandler())
-sb.add_request_handler(CancelOrStopIntentHandler())
-sb.add_request_handler(FallbackIntentHandler())
-sb.add_request_handler(SessionEndedRequestHandler())
-sb.add_request_handler(IntentReflectorHandler()) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
-
-sb.add_exception_handler(CatchAllExceptionHandler())
-
-lambda_handler = sb.lambda_handler()
\ No newline at end of file
+# Request handlers are registered with the router, which only asks the
+# handlers whose intents or request_types match each request (see the
+# intent_router module).
+router = IntentRouter()
+
+router.add_request_handler(LaunchRequestHandler())
+router.add_request_handler(HelloWorldIntentHandler())
+router.add_request_handler(CreateNewUserIntentHandler())
+router.add_request_handler(LoginIntentHandler())
+router.add_request_handler(LogoutIntentHandler())
+router.add_request_handler(MakeRequestIntentHandler())
+router.add_request_handler(AcceptRequestIntentHandler())
+router.add_request_handler(DenyRequestIntentHandler())
+router.add_request_handler(HasAccessIntentHandler())
+router.add_request_handler(AllAccessIntentHandler())
+router.add_request_handler(RevokeAccessIntentHandler())
+router.add_request_handler(AddRecordingIntentHandler())
+router.add_request_handler(ListFilesIntentHandler())
+router.add_request_handler(ListCurrentRequestsIntentHandler())
+router.add_request_handler(ListPreferencesIntentHandler())
+router.add_request_handler(PlayRecordingIntentHandler())
+router.add_request_handler(ReadFileIntentHandler())
+router.add_request_handler(HelpIntentHandler())
+router.add_request_handler(CancelOrStopIntentHandler())
+router.add_request_handler(FallbackIntentHandler())
+router.add_request_handler(SessionEndedRequestHandler())
+router.add_request_handler(IntentReflectorHandler()) # make sure IntentReflectorHandler is last so it doesn't override your custom intent handlers
+
+sb.add_exception_handler(metrics.MetricsExceptionHandler(ConcurrentChangeExceptionHandler()))
+sb.add_exception_handler(metrics.MetricsExceptionHandler(CatchAllExceptionHandler()))
+
+# Log the time, storage calls and speech length of every turn (see the
+# metrics module).
+sb.add_global_request_interceptor(metrics.MetricsRequestInterceptor())
+sb.add_global_request_interceptor(UnitOfWorkRequestInterceptor())
+sb.add_global_response_interceptor(UnitOfWorkResponseInterceptor())
+sb.add_global_response_interceptor(metrics.MetricsResponseInterceptor())
+router.add_timing_hook(metrics.record_handler)
+
+lambda_handler = router.lambda_handler(sb)
+startup.finish()
\ No newline at end of file
@@ -1,8 +1,111 @@
+import collections
+import concurrent.futures
+import contextvars
+import copy
 import logging
 import os
-import boto3
 import json
-from botocore.exceptions import ClientError
+import random
+import time
+
+import metrics
+import startup
+
+# boto3 and botocore are loaded by the first call that uses them rather than
+# at import, keeping them off the cold start of requests that never touch S3.
+boto3 = startup.lazy_import("boto3")
+botocore_exceptions = startup.lazy_import("botocore.exceptions")
+
+# Connection pool size and timeouts (in seconds) of the shared S3 client.
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get("S3_MAX_POOL_CONNECTIONS", 10))
+S3_CONNECT_TIMEOUT = float(os.environ.get("S3_CONNECT_TIMEOUT", 2))
+S3_READ_TIMEOUT = float(os.environ.get("S3_READ_TIMEOUT", 5))
+
+def create_s3_client(**config_options):
+    """ Create an S3 client with a connection pool sized for the skill and
+    TCP keep-alive, so connections survive between invocations
+
+    :param config_options: extra botocore Config options
+    :return: boto3 S3 client
+    """
+    config = boto3.session.Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, connect_timeout=S3_CONNECT_TIMEOUT,
+                                  read_timeout=S3_READ_TIMEOUT, tcp_keepalive=True, **config_options)
+    return boto3.client('s3', region_name=os.environ.get('S3_PERSISTENCE_REGION'), config=config)
+
+# One S3 client per container, created on first use and shared by every
+# call (boto3 clients are thread safe).  Creating a client resolves the
+# endpoint and credentials and starts a new connection pool, which took tens
+# of milliseconds per call when each function created its own.  Presigned
+# URLs need SigV4 and path-style addressing, so they get a client of their
+# own.
+shared_s3_client = startup.Lazy("S3 client", create_s3_client)
+shared_presign_client = startup.Lazy("S3 presign client", lambda: create_s3_client(
+    signature_version='s3v4', s3={'addressing_style': 'path'}))
+injected_clients = None
+
+def get_s3_client():
+    """ Return the shared S3 client
+
+    :return: boto3 S3 client
+    """
+    if injected_clients is not None:
+        return injected_clients[0]
+    return shared_s3_client.get()
+
+def get_presign_client():
+    """ Return the shared S3 client used to create presigned URLs
+
+    :return: boto3 S3 client
+    """
+    if injected_clients is not None:
+        return injected_clients[1]
+    return shared_presign_client.get()
+
+def set_s3_client(client, presign=None):
+    """ Replace the shared S3 clients, e.g. with a stub in tests
+
+    :param client: S3 client to use for every call, or None to go back to the shared clients
+    :param presign: S3 client to use for presigned URLs, client by default
+    """
+    global injected_clients
+    injected_clients = (client, presign or client) if client is not None else None
+
+# Reads that fan out across users run on a pool as wide as the S3 client's
+# connection pool, and stop waiting TURN_DEADLINE_SECONDS after the turn
+# started, leaving time to respond before Alexa gives up on the skill.
+FAN_OUT_WORKERS = int(os.environ.get("FAN_OUT_WORKERS", S3_MAX_POOL_CONNECTIONS))
+TURN_DEADLINE_SECONDS = float(os.environ.get("TURN_DEADLINE_SECONDS", 6))
+fan_out_pool = startup.Lazy("fan-out pool", lambda: concurrent.futures.ThreadPoolExecutor(
+    max_workers=FAN_OUT_WORKERS, thread_name_prefix="fan-out"))
+
+def fan_out(function, items, deadline_seconds=None):
+    """ Call a function on each item concurrently, on a bounded thread pool,
+    until every call is done or the turn's deadline passes. Calls run in the
+    context of the turn, so their storage calls count towards its metrics
+
+    :param function: function of one item, such as a storage read
+    :param items: hashable items, such as user names
+    :param deadline_seconds: seconds after the start of the turn (or of this call, outside a turn) to stop waiting, TURN_DEADLINE_SECONDS by default
+    :return: Results by item as a dictionary, and whether calls were left unfinished as a boolean
+    """
+    turn = metrics.current_turn.get()
+    started = turn.started if turn is not None else time.perf_counter()
+    deadline = started + (TURN_DEADLINE_SECONDS if deadline_seconds is None else deadline_seconds)
+    
+    pool = fan_out_pool.get()
+    futures = {pool.submit(contextvars.copy_context().run, function, item): item for item in items}
+    results = {}
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=max(deadline - time.perf_counter(), 0)):
+            results[futures[future]] = future.result()
+    except concurrent.futures.TimeoutError:
+        return results, True
+    finally:
+        # Calls that have not started are dropped; running ones finish unseen
+        for future in futures:
+            future.cancel()
+    
+    return results, False
 
 def create_presigned_url(object_name):
     """Generate a presigned URL to share an S3 object with a capped expiration of 60 seconds
@@ -10,16 +113,14 @@ def create_presigned_url(object_name):
     :param object_name: string
     :return: Presigned URL as string. If error, returns None.
     """
-    s3_client = boto3.client('s3',
-                             region_name=os.environ.get('S3_PERSISTENCE_REGION'),
-                             config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
+    s3_client = get_presign_client()
     try:
         bucket_name = os.environ.get('S3_PERSISTENCE_BUCKET')
         response = s3_client.generate_presigned_url('get_object',
                                                     Params={'Bucket': bucket_name,
                                                             'Key': object_name},
                                                     ExpiresIn=60*1)
-    except ClientError as e:
+    except botocore_exceptions.ClientError as e:
         logging.error(e)
         return None
 
@@ -27,6 +128,7 @@ def create_presigned_url(object_name):
     return response
 
 
+@metrics.storage_operation("GetObject", lambda args, result: (metrics.payload_size(result), 0))
 def read_file(file_name):
     """ Read the contents of a file stored in s3 
     
@@ -34,25 +136,41 @@ def read_file(file_name):
     :return: Contents of the file as a string
     """
     try:
-        client = boto3.client('s3')
+        client = get_s3_client()
         bucket_name = os.environ.get("S3_PERSISTENCE_BUCKET")
         file = client.get_object(Bucket=bucket_name, Key=file_name)
         return file["Body"].read().decode("utf-8")
         
-    except ClientError as e:
+    except botocore_exceptions.ClientError as e:
         logging.error(e)
         return None
     
+@metrics.storage_operation("PutObject", lambda args, result: (0, metrics.payload_size(args[1])))
 def write_file(file_name, content):
     try:
-        client = boto3.client('s3')
+        client = get_s3_client()
         bucket_name = os.environ.get("S3_PERSISTENCE_BUCKET")
         return client.put_object(Bucket=bucket_name, Key=file_name, Body=content)
         
-    except ClientError as e:
+    except botocore_exceptions.ClientError as e:
         logging.error(e)
         return None
 
+@metrics.storage_operation("HeadObject")
+def does_object_exist(key):
+    """ Determine if an object exists in S3, without reading it
+
+    :param key: string
+    :return: If the object was found as a boolean
+    """
+    try:
+        get_s3_client().head_object(Bucket=os.environ.get("S3_PERSISTENCE_BUCKET"), Key=key)
+        return True
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return False
+        raise
+
 def get_keys_from_objects(response_contents):
     """ Convert a list of s3 objects into a list of file names
     
@@ -62,36 +180,124 @@ def get_keys_from_objects(response_contents):
     for i in response_contents:
         yield i['Key']
 
+def list_pages(path, delimiter=None, start_after=None, page_size=None):
+    """ Generate the pages of a listing of the objects under a path in s3.
+        Each page is requested only when the previous one has been used, so
+        callers that stop early do not pay for the rest of the listing
+
+    :param path: key prefix to list, as a string
+    :param delimiter: string, such as "/" to list only one level of folders
+    :param start_after: key to start the listing after, as a string
+    :param page_size: maximum number of keys per page, up to 1000
+    :return: list_objects_v2 responses
+    """
+    client = get_s3_client()
+    request = {"Bucket": os.environ.get("S3_PERSISTENCE_BUCKET"), "Prefix": path}
+    if delimiter:
+        request["Delimiter"] = delimiter
+    if start_after:
+        request["StartAfter"] = start_after
+    if page_size:
+        request["MaxKeys"] = page_size
+    
+    while True:
+        with metrics.storage_call("ListObjectsV2"):
+            response = client.list_objects_v2(**request)
+        yield response
+        if not response.get('IsTruncated'):
+            return
+        request["ContinuationToken"] = response['NextContinuationToken']
+
+def list_objects(path, delimiter=None, start_after=None, page_size=None):
+    """ Generate the metadata of the objects under a path in s3, following
+        the listing across pages as needed
+
+    :param path: key prefix to list, as a string
+    :param delimiter: string, such as "/" to leave out objects in sub-folders
+    :param start_after: key to start the listing after, as a string
+    :param page_size: maximum number of keys per page, up to 1000
+    :return: s3 object metadata (Key, Size, ETag, LastModified) as dictionaries
+    """
+    for page in list_pages(path, delimiter, start_after, page_size):
+        # Empty listings have no Contents
+        yield from page.get('Contents', [])
+
+def list_folders(path, start_after=None):
+    """ Generate the sub-folders directly under a path in s3, without listing
+        the objects inside them
+
+    :param path: key prefix ending in "/", as a string
+    :param start_after: key to start the listing after, as a string
+    :return: sub-folder prefixes, ending in "/", as strings
+    """
+    for page in list_pages(path, delimiter="/", start_after=start_after):
+        for prefix in page.get('CommonPrefixes', []):
+            yield prefix['Prefix']
+
 def list_folder_contents(path):
+    """ List the keys of all objects under a path in s3
+
+    :param path: key prefix to list, as a string
+    :return: Keys as a list of strings, or None if s3 could not be listed
+    """
     try:
-        client = boto3.client('s3')
-        bucket_name = os.environ.get("S3_PERSISTENCE_BUCKET")
-        response = client.list_objects_v2(Bucket=bucket_name, Prefix=path)
-        return list(get_keys_from_objects(response['Contents']))
+        return list(get_keys_from_objects(list_objects(path)))
     
-    except ClientError as e:
+    except botocore_exceptions.ClientError as e:
         logging.error(e)
         return None
 
 def list_file_names(path):
+    """ List the names, without extensions, of the files directly in a folder
+        in s3, leaving out the folder's own marker object
+
+    :param path: folder key ending in "/", as a string
+    :return: File names as a list of strings
+    """
     file_list = []
-    recordings = list_folder_contents(path)[1:]
-    if len(recordings) > 0:
-        for file in recordings:
-            file_name = file.split('/')[-1]
-            file_name = file_name[:file_name.index('.')]
-            file_list.append(file_name)
-        return file_list
+    for key in get_keys_from_objects(list_objects(path, delimiter="/")):
+        file_name = key[len(path):]
+        if file_name:
+            file_list.append(file_name.split('.')[0])
     
-    return False
+    return file_list
 
 def does_file_exists(file_name, path):
-    folder_contents = list_folder_contents(path)
-    for i in folder_contents:
-        if file_name in i:
-            return True
-    
-    return False
+    """ Determine if a file with exactly the given name is in a folder in s3
+
+    :param file_name: file name with its extension, as a string
+    :param path: folder key ending in "/", as a string
+    :return: If the file was found as a boolean
+    """
+    return does_object_exist(path + file_name)
+
+# Whether users exist is cached per container.  Users are never deleted, so
+# users found are remembered for longer than users not found, who may be
+# created by another container at any time.
+USER_CACHE_SECONDS = float(os.environ.get("USER_CACHE_SECONDS", 300))
+USER_NEGATIVE_CACHE_SECONDS = float(os.environ.get("USER_NEGATIVE_CACHE_SECONDS", 10))
+USER_CACHE_SIZE = 1024
+user_cache = collections.OrderedDict() # user name -> (exists, monotonic time the entry expires)
+
+def get_user_key(user_name):
+    """ Return the key of a user's privacy preferences, which every user has
+
+    :param user_name: string
+    :return: S3 key as a string
+    """
+    return "Media/users/" + user_name + "/privacy_preferences.json"
+
+def cache_user(user_name, exists):
+    """ Remember whether a user exists
+
+    :param user_name: string
+    :param exists: boolean
+    """
+    ttl = USER_CACHE_SECONDS if exists else USER_NEGATIVE_CACHE_SECONDS
+    user_cache[user_name] = (exists, time.monotonic() + ttl)
+    user_cache.move_to_end(user_name)
+    while len(user_cache) > USER_CACHE_SIZE:
+        user_cache.popitem(last=False)
 
 def does_user_exist(user_name):
     """ Determine if a given username already exists in the user directory in S3
@@ -99,13 +305,31 @@ def does_user_exist(user_name):
     :param user_name: string
     :return: If the user was found as a boolean
     """
-    if user_name:
-        user_list = list_folder_contents("Media/users/")
-        for i in user_list:
-            if user_name in i:
-                return True
+    if not user_name:
+        return False
+    
+    cached = user_cache.get(user_name)
+    if cached is not None and cached[1] > time.monotonic():
+        return cached[0]
+    
+    # A user whose preferences this turn has already read needs no HEAD
+    work = current_work.get()
+    if work is not None and get_user_key(user_name) in work["documents"]:
+        return work["documents"][get_user_key(user_name)][0] is not None
     
-    return False
+    # A single HEAD of the user's own key, rather than listing every user's
+    # files and matching names by substring.
+    exists = does_object_exist(get_user_key(user_name))
+    cache_user(user_name, exists)
+    return exists
+
+def list_users():
+    """ Generate the names of all users, from the user folders in s3
+
+    :return: User names as strings
+    """
+    for prefix in list_folders("Media/users/"):
+        yield prefix[len("Media/users/"):-1]
 
 def create_new_user(user_name):
     """ Generate a new user in the S3 bucket
@@ -121,9 +345,12 @@ def create_new_user(user_name):
         "preferences": {}
     }
     '''
-    privacy_preferences_key = "Media/users/" + user_name + "/privacy_preferences.json"
+    privacy_preferences_key = get_user_key(user_name)
     recordings_key = "Media/users/" + user_name + "/recordings/"
-    write_file(privacy_preferences_key, file_body)
+    if write_file(privacy_preferences_key, file_body) is not None:
+        cache_user(user_name, True)
+    create_json_if_missing(get_grants_key(user_name), {"grants": {}})
+    forget_json(privacy_preferences_key)
     return write_file(recordings_key, "")
 
 def sign_in(handler_input, user_name):
@@ -139,108 +366,450 @@ def is_logged_in(handler_input):
 def get_current_user(handler_input):
     return handler_input.attributes_manager.persistent_attributes['current_user']
 
+# Documents that several turns can change at once, such as a user's privacy
+# preferences (changed by the user and by everyone making requests of them),
+# are updated optimistically: read with their ETag, changed, and written only
+# if the ETag still matches.  A write that lost the race is retried from a
+# fresh read after a randomized, growing delay.
+MUTATE_ATTEMPTS = int(os.environ.get("MUTATE_ATTEMPTS", 8))
+MUTATE_BACKOFF_SECONDS = float(os.environ.get("MUTATE_BACKOFF_SECONDS", 0.05))
+MUTATE_MAX_BACKOFF_SECONDS = float(os.environ.get("MUTATE_MAX_BACKOFF_SECONDS", 1))
+CONFLICT_CODES = ('PreconditionFailed', 'ConditionalRequestConflict', '412', '409')
+
+class ConcurrentChangeError(Exception):
+    """ Raised when a document could not be changed because other writers kept
+    changing it first
+    """
+
+def read_json(key):
+    """ Read a JSON document and its ETag from s3
+
+    :param key: string
+    :return: The document, and its ETag as a string, or (None, None) if there is no such object
+    """
+    try:
+        with metrics.storage_call("GetObject") as call:
+            response = get_s3_client().get_object(Bucket=os.environ.get("S3_PERSISTENCE_BUCKET"), Key=key)
+            body = response["Body"].read()
+            call.bytes_read = len(body)
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None, None
+        raise
+    
+    return json.loads(body.decode("utf-8")), response["ETag"]
+
+def write_json_if_unchanged(key, document, etag):
+    """ Write a JSON document to s3, if the stored object still has the ETag
+    it was read with
+
+    :param key: string
+    :param document: JSON-serializable document
+    :param etag: ETag the object was read with, as a string
+    :return: If the document was written as a boolean, False if another write came first
+    """
+    body = json.dumps(document)
+    try:
+        with metrics.storage_call("PutObject") as call:
+            call.bytes_written = metrics.payload_size(body)
+            get_s3_client().put_object(Bucket=os.environ.get("S3_PERSISTENCE_BUCKET"), Key=key, Body=body, IfMatch=etag)
+        return True
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in CONFLICT_CODES:
+            return False
+        raise
+
+def create_json_if_missing(key, document):
+    """ Write a JSON document to s3, unless an object with its key exists
+
+    :param key: string
+    :param document: JSON-serializable document
+    :return: If the document was written as a boolean
+    """
+    body = json.dumps(document)
+    try:
+        with metrics.storage_call("PutObject") as call:
+            call.bytes_written = metrics.payload_size(body)
+            get_s3_client().put_object(Bucket=os.environ.get("S3_PERSISTENCE_BUCKET"), Key=key, Body=body, IfNoneMatch="*")
+        return True
+    except botocore_exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in CONFLICT_CODES:
+            return False
+        raise
+    finally:
+        # Either way, a copy read earlier in the turn is out of date
+        forget_json(key)
+
+# During a turn, the JSON documents it reads are shared by every helper it
+# calls, and its changes are written once, when the turn ends.  The request
+# and response interceptors in lambda_function begin and flush this unit of
+# work; outside a turn, documents are read and written directly.
+current_work = contextvars.ContextVar("current_work", default=None)
+
+def begin_work():
+    """ Start sharing the documents read and changed during the current turn,
+    dropping anything left by an earlier turn that failed
+    """
+    current_work.set({"documents": {}, "changes": {}, "derived": set()})
+
+def load_json(key):
+    """ Read a JSON document, or the copy already read during this turn. The
+    copy is shared, so callers must not change it except through mutate_json
+
+    :param key: string
+    :return: The document, or None if there is no such object
+    """
+    work = current_work.get()
+    if work is None:
+        return read_json(key)[0]
+    
+    if key not in work["documents"]:
+        document, etag = read_json(key)
+        # The version as read is kept, for the changes to be applied to on flush
+        work["documents"][key] = (document, etag, json.dumps(document))
+    return work["documents"][key][0]
+
+def forget_json(key):
+    """ Drop a document from this turn's shared copies, after writing it
+    directly
+
+    :param key: string
+    """
+    work = current_work.get()
+    if work is not None:
+        work["documents"].pop(key, None)
+
+def replay_changes(key, changes, document, check_results):
+    """ Apply the changes a turn made to a document to another version of it
+
+    :param key: string
+    :param changes: (fn, result) tuples, in the order the turn made them
+    :param document: the version of the document to change in place
+    :param check_results: whether each fn must return what it returned during the turn
+    :raises ConcurrentChangeError: if a fn's result differs from the turn's
+    """
+    for fn, result in changes:
+        if fn(document) != result and check_results:
+            raise ConcurrentChangeError(f"{key} was changed by another writer in a way that changes the turn's response")
+
+def flush_work():
+    """ Write the documents changed during the turn, once each, and end the
+    unit of work. Each document's changes are applied again to the version
+    the turn read and written if it is still current. Otherwise they are
+    applied to a fresh copy, retrying as mutate_json does. The turn only
+    fails if a change to a document that is not derived then returns
+    something other than what its response was based on; documents are
+    written in the order first changed, so nothing derived from a failed
+    change is written
+
+    :raises ConcurrentChangeError: if another writer's change contradicts the turn's response
+    """
+    work = current_work.get()
+    current_work.set(None)
+    if work is None:
+        return
+    
+    for key, changes in work["changes"].items():
+        document, etag, original = work["documents"][key]
+        document = json.loads(original)
+        replay_changes(key, changes, document, False)
+        if document is not None and write_json_if_unchanged(key, document, etag):
+            continue
+        # Changed since the turn read it, or, if missing then, maybe created
+        check_results = key not in work["derived"]
+        mutate_json(key, lambda fresh: replay_changes(key, changes, fresh, check_results))
+
+def mutate_json(key, fn, derived=False):
+    """ Change a JSON document in s3 with fn, without losing changes made by
+    concurrent writers. fn(document) changes the document in place and
+    returns a result; it may be called again on a fresh copy if another
+    write comes first, so it must not have other side effects. Documents
+    fn leaves unchanged are not written. During a turn, fn changes the
+    turn's copy and the write waits for flush_work
+
+    :param key: string
+    :param fn: function of the document, which is None if there is no such object
+    :param derived: whether the document only derives from others, such as a grant index, so that what fn returns for a newer version does not matter once the turn has responded
+    :return: What fn returned for the version of the document that was stored, or for the turn's copy
+    :raises ConcurrentChangeError: if other writers kept changing the document
+    """
+    work = current_work.get()
+    if work is not None:
+        document = load_json(key)
+        original = json.dumps(document)
+        result = fn(document)
+        if document is None or json.dumps(document) != original:
+            # The result is kept as it was, for flush_work to check fn still returns it
+            work["changes"].setdefault(key, []).append((fn, copy.deepcopy(result)))
+            if derived:
+                work["derived"].add(key)
+        return result
+    
+    for attempt in range(MUTATE_ATTEMPTS):
+        document, etag = read_json(key)
+        original = json.dumps(document)
+        result = fn(document)
+        if document is None or json.dumps(document) == original:
+            return result
+        if write_json_if_unchanged(key, document, etag):
+            return result
+        
+        # Full jitter, so writers that collided do not collide again
+        time.sleep(random.uniform(0, min(MUTATE_MAX_BACKOFF_SECONDS, MUTATE_BACKOFF_SECONDS * 2 ** attempt)))
+    
+    raise ConcurrentChangeError(f"{key} kept changing over {MUTATE_ATTEMPTS} attempts")
+
+def mutate(user_name, fn):
+    """ Change a user's privacy preferences with fn, retrying on concurrent
+    changes (see mutate_json)
+
+    :param user_name: string
+    :param fn: function changing the preferences dictionary in place and returning a result
+    :return: What fn returned for the version of the preferences that was stored
+    """
+    return mutate_json(get_user_key(user_name), fn)
+
 def make_request(requester, requestee, request_type, reason):
     
-    privacy_key = "Media/users/" + requestee + "/privacy_preferences.json"
-    privacy_object = json.loads(read_file(privacy_key))
-    request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
-    if request_object is None:
-        request_object = {
+    def add_request(privacy_object):
+        request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
+        if request_object is not None:
+            return False
+        
+        privacy_object['pending_requests'].append({
             "requester": requester,
             "request_type": request_type,
             "reason": reason
-        }
-        privacy_object['pending_requests'].append(request_object)
-        return write_file(privacy_key, json.dumps(privacy_object))
-    else:
-        return False
+        })
+        return True
+    
+    return mutate(requestee, add_request)
 
 def deny_request(requestee, requester):
-    privacy_key = "Media/users/" + requestee + "/privacy_preferences.json"
-    privacy_object = json.loads(read_file(privacy_key))
-    request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
-    if request_object is not None:
+    
+    def deny(privacy_object):
+        request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
+        if request_object is None:
+            return False
+        
         privacy_object["denied_requests"].append(request_object)
         privacy_object["pending_requests"].remove(request_object)
-        return write_file(privacy_key, json.dumps(privacy_object))
-    else:
-        return False
+        return True
+    
+    return mutate(requestee, deny)
 
 def accept_request(requestee, requester, file_name=None):
+    granted = {} # what the requestee grants the requester, as of the latest version accepted in
     
-    privacy_key = "Media/users/" + requestee + "/privacy_preferences.json"
-    privacy_object = json.loads(read_file(privacy_key))
-    request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
-    if request_object is not None:
+    def accept(privacy_object):
+        request_object = next(filter(lambda request: request["requester"] == requester, privacy_object["pending_requests"]), None)
+        if request_object is None:
+            return False
+        
         privacy_object["pending_requests"].remove(request_object)
         if file_name is None:
             # check if user has already accepted a request for all files before
-            if not hasattr(privacy_object["preferences"], "all_files"):
+            if "all_files" not in privacy_object["preferences"]:
                 privacy_object["preferences"]["all_files"] = []
             
             privacy_object["preferences"]["all_files"].append(request_object)
         else:
-            if not hasattr(privacy_object["preferences"], file_name):
+            if file_name not in privacy_object["preferences"]:
                 privacy_object["preferences"][file_name] = []
             
             privacy_object["preferences"][file_name].append(request_object)
         
-        write_file(privacy_key, json.dumps(privacy_object))
+        granted.clear()
+        granted.update(grants_from(requester, privacy_object))
         return request_object
-    else:
-        return False
+    
+    request_object = mutate(requestee, accept)
+    if request_object:
+        update_grant_index(requester, requestee, granted)
+    return request_object
 
 def revoke_access(requestee, requester, request_type=None, reason=None):
-    privacy_key = "Media/users/" + requestee + "/privacy_preferences.json"
-    privacy_object = json.loads(read_file(privacy_key))
-    accesses_revoked = []
-    for file in privacy_object["preferences"].keys():
-        for access_object in privacy_object["preferences"][file]:
-            validator = True
-            if access_object["requester"] == requester:
-                if request_type != None and access_object["request_type"] != request_type:
-                    validator = False
-                if reason != None and access_object["reason"] != reason:
-                    validator = False
-            else:
-                validator = False
-            
-            if validator == True:
-                privacy_object["preferences"][file].remove(access_object)
-                privacy_object["denied_requests"].append(access_object)
-                accesses_revoked.append(access_object)
+    granted = {} # what the requestee grants the requester, as of the latest version revoked from
+    
+    def matches(access_object):
+        return (access_object["requester"] == requester
+                and (request_type is None or access_object["request_type"] == request_type)
+                and (reason is None or access_object["reason"] == reason))
+    
+    def revoke(privacy_object):
+        accesses_revoked = []
+        for file, access_objects in privacy_object["preferences"].items():
+            revoked = [ao for ao in access_objects if matches(ao)]
+            if revoked:
+                access_objects[:] = [ao for ao in access_objects if not matches(ao)]
+                privacy_object["denied_requests"].extend(revoked)
+                accesses_revoked.extend(revoked)
+        
+        granted.clear()
+        granted.update(grants_from(requester, privacy_object))
+        return accesses_revoked
     
-    write_file(privacy_key, json.dumps(privacy_object))
+    accesses_revoked = mutate(requestee, revoke)
+    if accesses_revoked:
+        update_grant_index(requester, requestee, granted)
     return accesses_revoked
 
 def list_access_from(requester, requestee):
-    privacy_key = "Media/users/" + requestee + "/privacy_preferences.json"
-    privacy_preferences = json.loads(read_file(privacy_key))["preferences"]
+    privacy_preferences = load_json(get_user_key(requestee))["preferences"]
     access_objects = [] # list of tuples like: (file_name, access_objects)
     for f in privacy_preferences.keys():
         access_objects.append(( f, list(filter(lambda ao: ao["requester"] == requester, privacy_preferences[f])) ))
     
     return access_objects
 
+# Each requester has a grant index, Media/grants/{requester}.json, of the
+# access other users have given them:
+#   {"grants": {requestee: {file: [access objects]}}}
+# It is derived from the users' privacy preferences, which remain the source
+# of truth, so list_all_access reads one small object instead of every user's
+# preferences.  Entries are rewritten from a requestee's preferences whenever
+# accept_request or revoke_access changes them; deny_request only changes
+# pending requests, never grants.
+#
+# A missing index is rebuilt from every user's preferences.  The rebuild
+# first creates the index marked "building", so grants changed while it
+# reads the preferences are applied to the index and listed in "updated".
+# It then fills in only the users no update has touched, and marks the index
+# complete.  A building index counts as missing, so a rebuild left unfinished
+# is finished by the next one.
+
+def get_grants_key(requester):
+    """ Return the key of a requester's grant index
+
+    :param requester: string
+    :return: S3 key as a string
+    """
+    return "Media/grants/" + requester + ".json"
+
+def grants_from(requester, privacy_object):
+    """ Collect the access a user's privacy preferences give a requester
+
+    :param requester: string
+    :param privacy_object: the user's privacy preferences as a dictionary
+    :return: Access objects by file name, for files with any, as a dictionary
+    """
+    grants = {}
+    for f, access_objects in privacy_object["preferences"].items():
+        granted = [ao for ao in access_objects if ao["requester"] == requester]
+        if granted:
+            grants[f] = granted
+    
+    return grants
+
+def read_grant_index(requester):
+    """ Read a requester's grant index from s3
+
+    :param requester: string
+    :return: Grants by requestee as a dictionary, or None if there is no complete index
+    """
+    index = load_json(get_grants_key(requester))
+    if index is None or index.get("building"):
+        return None
+    return index["grants"]
+
+def update_grant_index(requester, requestee, granted):
+    """ Rewrite a requester's grant index entry for a requestee, from what
+        the requestee's updated privacy preferences grant. A missing index is
+        left to be rebuilt by list_all_access
+
+    :param requester: string
+    :param requestee: string
+    :param granted: access objects by file name, as returned by grants_from.
+        It is read when the index is changed, so it may still be updated by
+        a replayed change of the preferences, which are written first
+    """
+    def update(index):
+        if index is None:
+            return
+        if granted:
+            index["grants"][requestee] = dict(granted)
+        else:
+            index["grants"].pop(requestee, None)
+        if index.get("building") and requestee not in index["updated"]:
+            index["updated"].append(requestee)
+    
+    mutate_json(get_grants_key(requester), update, derived=True)
+
+def rebuild_grant_index(requester):
+    """ Rebuild a requester's grant index by reading other users' privacy
+        preferences, concurrently. Users are read until the turn's deadline,
+        and the grants read are saved, so a rebuild cut short is resumed by
+        the next one, from the users it has not read yet. The index is
+        completed by the rebuild that reads the last of them
+
+    :param requester: string
+    :return: Grants by requestee as a dictionary, and whether users were left unread as a boolean
+    """
+    grants_key = get_grants_key(requester)
+    create_json_if_missing(grants_key, {"grants": {}, "building": True, "updated": []})
+    index = load_json(grants_key)
+    if index is not None and not index.get("building"):
+        # Completed by another rebuild meanwhile
+        return dict(index["grants"]), False
+    
+    # Users read by an earlier rebuild, or changed since the rebuild began, are already up to date
+    done = set(index["updated"]) if index is not None else set()
+    users = [user for user in list_users() if user != requester and user not in done]
+    preferences, truncated = fan_out(lambda user: load_json(get_user_key(user)), users)
+    grants = {}
+    for user, privacy_object in preferences.items():
+        if privacy_object is None:
+            # A user folder without privacy preferences grants nothing
+            continue
+        granted = grants_from(requester, privacy_object)
+        if granted:
+            grants[user] = granted
+    
+    def merge(index):
+        if index is None:
+            return dict(grants)
+        if index.get("building"):
+            updated = set(index["updated"])
+            for user in preferences:
+                if user in updated:
+                    continue
+                if user in grants:
+                    index["grants"][user] = grants[user]
+                else:
+                    index["grants"].pop(user, None)
+                if truncated:
+                    index["updated"].append(user)
+            if not truncated:
+                del index["building"], index["updated"]
+        return dict(index["grants"])
+    
+    return mutate_json(grants_key, merge, derived=True), truncated
+
 def list_all_access(requester):
-    access_dictionary = {}
-    paths_to_check = list(filter(lambda path: requester not in path and "privacy_preferences.json" in path, list_folder_contents("Media/users/")))
-    users_to_check = [privacy_key.replace("Media/users/", "").replace("/privacy_preferences.json", "") for privacy_key in paths_to_check]
-    for user in users_to_check:
-        access_dictionary[user] = list_access_from(requester, user)
+    """ List the access every other user has given a requester
+
+    :param requester: string
+    :return: Lists of (file name, access objects) tuples by user as a dictionary, and whether users were left unchecked as a boolean
+    """
+    truncated = False
+    grants = read_grant_index(requester)
+    if grants is None:
+        grants, truncated = rebuild_grant_index(requester)
+    
+    access_dictionary = {} # user -> list of tuples like: (file_name, access_objects)
+    for user in sorted(grants):
+        access_dictionary[user] = list(grants[user].items())
     
-    return access_dictionary
+    return access_dictionary, truncated
 
 def list_requests(user_name):
-    requests_key = "Media/users/" + user_name + "/privacy_preferences.json"
-    requests = json.loads(read_file(requests_key))['pending_requests']
+    requests = load_json(get_user_key(user_name))['pending_requests']
 
     return [ f"{x['requester']} has a {x['reason']} project and has asked for \
                 permission to {x['request_type']} using your recordings. " for x in requests]
 
 def list_preferences(user):
-    privacy_key = "Media/users/" + user + "/privacy_preferences.json"
-    preferences = json.loads(read_file(privacy_key))["preferences"]
+    preferences = load_json(get_user_key(user))["preferences"]
     permissions_list = []
     for f in preferences.keys():
         for access in preferences[f]:
@@ -266,13 +835,15 @@ def add_recording(user_name, file_name):
             idx = file_name.index('.')
             file_name = file_name[:idx] + "_1" + file_name[idx:]
             
-        client = boto3.client('s3')
+        client = get_s3_client()
         bucket_name = os.environ.get("S3_PERSISTENCE_BUCKET")
-        recording = client.get_object(Bucket=bucket_name, Key=file_key)
+        with metrics.storage_call("GetObject") as call:
+            recording = client.get_object(Bucket=bucket_name, Key=file_key)['Body'].read()
+            call.bytes_read = len(recording)
         
-        return write_file(recordings_key + file_name, recording['Body'].read())
+        return write_file(recordings_key + file_name, recording)
 
-    except ClientError as e:
+    except botocore_exceptions.ClientError as e:
         logging.error(e)
         return False
 
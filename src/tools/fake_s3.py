@@ -0,0 +1,230 @@
+# Filesystem-backed stand-in for the boto3 S3 client.
+#
+# Both skills keep everything in S3: the persistence adapter stores each
+# user's attributes there, and the Privacy Manager keeps its users, requests
+# and recordings there.  FakeS3Client implements the S3 client operations
+# the skills use on top of a local directory, so the skills can be run
+# in-process without network access, and counts every call so the number of
+# S3 round trips per request can be measured.  An optional delay per call
+# stands in for network latency.
+#
+# Each object is stored as one file named after its quoted key, in a
+# directory per bucket.  ETags are MD5 digests of the contents, as with
+# single-part uploads to S3, and conditional requests (IfMatch and
+# IfNoneMatch) behave as S3's do.
+#
+# ## Example Usage:
+#
+# > client = FakeS3Client("/tmp/s3")
+# > client.put_object(Bucket="bucket", Key="Media/test.txt", Body="hello")
+# > client.get_object(Bucket="bucket", Key="Media/test.txt")["Body"].read()
+#
+# Make every boto3.client("s3") return the fake
+# > install(client)
+
+import collections
+import hashlib
+import io
+import os
+import threading
+import time
+import urllib.parse
+
+from botocore.exceptions import ClientError
+
+
+def client_error(code, status, operation, message=None):
+    """Return a ClientError like the one botocore raises for the given error
+       code and HTTP status."""
+    return ClientError({"Error": {"Code": code, "Message": message or code},
+                        "ResponseMetadata": {"HTTPStatusCode": status}}, operation)
+
+
+class FakeS3Client:
+    """Implement the S3 client operations used by the skills on a local
+       directory."""
+
+    def __init__(self, root, latency=0.0):
+        """Construct a client storing buckets under the given directory,
+           sleeping latency seconds in every call."""
+        self.__root = root
+        self.__latency = latency
+        self.__lock = threading.Lock()
+        self.__local = threading.local()
+        self.calls = collections.Counter()
+
+    @property
+    def thread_calls(self):
+        """Return the calls made by the current thread, by operation."""
+        if not hasattr(self.__local, "calls"):
+            self.__local.calls = collections.Counter()
+        return self.__local.calls
+
+    def __path(self, bucket, key=None):
+        """Return the path of a bucket's directory, or of one of its
+           objects."""
+        directory = os.path.join(self.__root, bucket)
+        if key is None:
+            return directory
+        return os.path.join(directory, urllib.parse.quote(key, safe=""))
+
+    def __call(self, operation):
+        """Count a call of the given operation and wait for its latency."""
+        with self.__lock:
+            self.calls[operation] += 1
+        self.thread_calls[operation] += 1
+        if self.__latency:
+            time.sleep(self.__latency)
+
+    def __read(self, bucket, key, operation):
+        """Return the contents of an object.  Raises ClientError if there is
+           no such object."""
+        try:
+            with open(self.__path(bucket, key), "rb") as file:
+                return file.read()
+        except FileNotFoundError:
+            if operation == "HeadObject":
+                raise client_error("404", 404, operation, "Not Found")
+            raise client_error("NoSuchKey", 404, operation, "The specified key does not exist.")
+
+    @staticmethod
+    def __etag(data):
+        """Return the ETag of an object with the given contents."""
+        return '"' + hashlib.md5(data).hexdigest() + '"'
+
+    @staticmethod
+    def __check_conditions(etag, operation, if_match=None, if_none_match=None):
+        """Raise ClientError if a conditional request's conditions fail."""
+        if if_match is not None and if_match != etag:
+            raise client_error("PreconditionFailed", 412, operation, "At least one of the pre-conditions you specified did not hold")
+        if if_none_match is not None and (if_none_match == "*" or if_none_match == etag):
+            if operation == "PutObject":
+                raise client_error("PreconditionFailed", 412, operation, "At least one of the pre-conditions you specified did not hold")
+            raise client_error("304", 304, operation, "Not Modified")
+
+    def get_object(self, Bucket, Key, IfMatch=None, IfNoneMatch=None, **kwargs):
+        """Return an object's contents and metadata."""
+        self.__call("GetObject")
+        data = self.__read(Bucket, Key, "GetObject")
+        etag = self.__etag(data)
+        self.__check_conditions(etag, "GetObject", IfMatch, IfNoneMatch)
+        return {"Body": io.BytesIO(data), "ETag": etag, "ContentLength": len(data)}
+
+    def head_object(self, Bucket, Key, IfMatch=None, IfNoneMatch=None, **kwargs):
+        """Return an object's metadata."""
+        self.__call("HeadObject")
+        data = self.__read(Bucket, Key, "HeadObject")
+        etag = self.__etag(data)
+        self.__check_conditions(etag, "HeadObject", IfMatch, IfNoneMatch)
+        return {"ETag": etag, "ContentLength": len(data)}
+
+    def put_object(self, Bucket, Key, Body=b"", IfMatch=None, IfNoneMatch=None, **kwargs):
+        """Store an object."""
+        self.__call("PutObject")
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        elif hasattr(Body, "read"):
+            Body = Body.read()
+
+        path = self.__path(Bucket, Key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self.__lock:
+            if IfMatch is not None or IfNoneMatch is not None:
+                try:
+                    with open(path, "rb") as file:
+                        etag = self.__etag(file.read())
+                except FileNotFoundError:
+                    if IfMatch is not None:
+                        raise client_error("NoSuchKey", 404, "PutObject", "The specified key does not exist.")
+                    etag = None
+                if etag is not None:
+                    self.__check_conditions(etag, "PutObject", IfMatch, IfNoneMatch)
+
+            temp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(temp_path, "wb") as file:
+                file.write(Body)
+            os.replace(temp_path, path)
+        return {"ETag": self.__etag(Body)}
+
+    def delete_object(self, Bucket, Key, **kwargs):
+        """Delete an object, if it exists."""
+        self.__call("DeleteObject")
+        try:
+            os.remove(self.__path(Bucket, Key))
+        except FileNotFoundError:
+            pass
+        return {}
+
+    def list_objects_v2(self, Bucket, Prefix="", Delimiter=None, StartAfter=None, ContinuationToken=None,
+                        MaxKeys=1000, **kwargs):
+        """Return one page of the keys in a bucket, in the same form as S3."""
+        self.__call("ListObjectsV2")
+        try:
+            names = os.listdir(self.__path(Bucket))
+        except FileNotFoundError:
+            names = []
+        keys = sorted(urllib.parse.unquote(name) for name in names if not name.endswith(".tmp"))
+
+        after = ContinuationToken or StartAfter
+        contents = []
+        prefixes = []
+        truncated = False
+        last = None
+        for key in keys:
+            if not key.startswith(Prefix) or (after is not None and key <= after):
+                continue
+            if Delimiter:
+                index = key.find(Delimiter, len(Prefix))
+                if index >= 0:
+                    common_prefix = key[:index + len(Delimiter)]
+                    if not prefixes or prefixes[-1] != common_prefix:
+                        if len(contents) + len(prefixes) >= MaxKeys:
+                            truncated = True
+                            break
+                        prefixes.append(common_prefix)
+                        # Continuing after the prefix skips every key in it.
+                        last = common_prefix + "\U0010ffff"
+                    continue
+            if len(contents) + len(prefixes) >= MaxKeys:
+                truncated = True
+                break
+            data = self.__read(Bucket, key, "ListObjectsV2")
+            contents.append({"Key": key, "Size": len(data), "ETag": self.__etag(data)})
+            last = key
+
+        response = {"KeyCount": len(contents) + len(prefixes), "IsTruncated": truncated, "Prefix": Prefix,
+                    "MaxKeys": MaxKeys}
+        # S3 leaves Contents and CommonPrefixes out of the response when they
+        # would be empty.
+        if contents:
+            response["Contents"] = contents
+        if prefixes:
+            response["CommonPrefixes"] = [{"Prefix": prefix} for prefix in prefixes]
+        if truncated:
+            response["NextContinuationToken"] = last
+        return response
+
+    def generate_presigned_url(self, ClientMethod, Params=None, ExpiresIn=3600, **kwargs):
+        """Return a file URL for the object named in Params."""
+        self.__call("GeneratePresignedUrl")
+        return "file://" + urllib.parse.quote(self.__path(Params["Bucket"], Params["Key"]))
+
+
+def install(client):
+    """Make boto3.client("s3") return the given client, and return a
+       function that undoes this."""
+    import boto3
+
+    original_client = boto3.client
+
+    def fake_client(service_name, *args, **kwargs):
+        if service_name == "s3":
+            return client
+        return original_client(service_name, *args, **kwargs)
+
+    boto3.client = fake_client
+
+    def uninstall():
+        boto3.client = original_client
+
+    return uninstall
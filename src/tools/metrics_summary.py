@@ -0,0 +1,115 @@
+# Summarize the per-turn metrics logged by both skills.
+#
+# Reads log files (CloudWatch exports, or the log written by
+# replay_harness.py --log) and picks out the JSON lines logged by each
+# skill's metrics module, wherever they appear in a line.  Turns are grouped
+# by intent (or by handler), and the groups are listed by the total time
+# spent in them, so the hottest paths come first.
+#
+# ## Example Usage:
+#
+# > python replay_harness.py PrivacyManager --users 20 --log turns.log
+# > python metrics_summary.py turns.log
+#
+# Group by handler and write the summary as JSON
+# > python metrics_summary.py turns.log --by handler -o summary.json
+#
+# > aws logs tail /aws/lambda/PrivacyManager --since 1h | python metrics_summary.py -
+
+import argparse
+import collections
+import json
+import sys
+
+MARKER = '{"metric": "turn"'
+
+
+def read_turns(files):
+    """Yield the turn metrics dictionaries found in the given open files."""
+    for file in files:
+        for line in file:
+            start = line.find(MARKER)
+            if start < 0:
+                continue
+            try:
+                yield json.loads(line[start:])
+            except ValueError:
+                continue
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(turns, by="intent"):
+    """Return a summary dictionary for each group of turns, hottest first."""
+    groups = collections.defaultdict(list)
+    for turn in turns:
+        groups[turn.get(by) or turn.get("request_type") or "unknown"].append(turn)
+
+    summaries = []
+    for name, group in groups.items():
+        count = len(group)
+        wall = sorted(turn["wall_ms"] for turn in group)
+        total_wall = sum(wall)
+        total_storage = sum(turn["storage_ms"] for turn in group)
+        s3_calls = collections.Counter()
+        for turn in group:
+            s3_calls.update(turn["s3_calls"])
+        summaries.append({
+            "name": name,
+            "turns": count,
+            "errors": sum(1 for turn in group if turn.get("error")),
+            "total_ms": total_wall,
+            "wall_p50_ms": percentile(wall, 0.50),
+            "wall_p95_ms": percentile(wall, 0.95),
+            "handler_mean_ms": sum(turn["handler_ms"] for turn in group) / count,
+            "storage_mean_ms": total_storage / count,
+            "storage_share": total_storage / total_wall if total_wall else 0,
+            "s3_calls_per_turn": sum(s3_calls.values()) / count,
+            "s3_calls": {operation: calls / count for operation, calls in sorted(s3_calls.items())},
+            "bytes_read_per_turn": sum(turn["bytes_read"] for turn in group) / count,
+            "bytes_written_per_turn": sum(turn["bytes_written"] for turn in group) / count,
+            "speech_chars_mean": sum(turn["speech_chars"] for turn in group) / count,
+            "speech_chars_max": max(turn["speech_chars"] for turn in group),
+        })
+    summaries.sort(key=lambda summary: summary["total_ms"], reverse=True)
+    return summaries
+
+
+def print_summary(summaries):
+    """Print the summaries as a table."""
+    print(f"{'name':<28}{'turns':>7}{'errors':>7}{'total ms':>10}{'p50 ms':>9}{'p95 ms':>9}{'storage':>9}"
+          f"{'S3/turn':>9}{'read B':>9}{'write B':>9}{'speech':>8}")
+    for summary in summaries:
+        print(f"{summary['name']:<28}{summary['turns']:>7}{summary['errors']:>7}{summary['total_ms']:>10.1f}"
+              f"{summary['wall_p50_ms']:>9.2f}{summary['wall_p95_ms']:>9.2f}{summary['storage_share']:>9.0%}"
+              f"{summary['s3_calls_per_turn']:>9.2f}{summary['bytes_read_per_turn']:>9.0f}"
+              f"{summary['bytes_written_per_turn']:>9.0f}{summary['speech_chars_mean']:>8.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize the turn metrics logged by the skills.")
+    parser.add_argument("logs", nargs="+", help="log files to read, or - for standard input")
+    parser.add_argument("--by", choices=("intent", "handler"), default="intent", help="how to group turns")
+    parser.add_argument("-o", "--output", help="write the summary as JSON to this path")
+    args = parser.parse_args()
+
+    files = [sys.stdin if path == "-" else open(path) for path in args.logs]
+    try:
+        summaries = summarize(read_turns(files), args.by)
+    finally:
+        for file in files:
+            if file is not sys.stdin:
+                file.close()
+
+    print_summary(summaries)
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(summaries, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# Cold start profiler for both skills.
+#
+# Imports a skill's lambda_function in a fresh Python process with the
+# STARTUP_PROFILE environment variable set (see each skill's startup
+# module), then creates everything it deferred, and reports the time taken
+# by each import and initializer.  Each run uses a new process, as a cold
+# start does; times are the median over --repeat runs.
+#
+# Nothing is sent to AWS: the deferred S3 clients are created but never
+# used.
+#
+# ## Example Usage:
+#
+# > python profile_startup.py PolicyBrowser
+#
+# Compare with creating everything at import time, as EAGER_INIT does
+# > python profile_startup.py PrivacyManager --eager --repeat 10
+#
+# Store the results, failing if the import time grew by more than 20%
+# compared with an earlier run
+# > python profile_startup.py PolicyBrowser -o startup.json
+# > python profile_startup.py PolicyBrowser --baseline startup.json
+
+import argparse
+import collections
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+SKILLS = ("PolicyBrowser", "PrivacyManager")
+
+
+def child(skill):
+    """Import the named skill, create everything it deferred, and print the
+       startup timings as JSON.  Runs in the profiled process."""
+    sys.path.insert(0, os.path.abspath(os.path.join(SOURCE_DIRECTORY, skill, "lambda")))
+    started = time.perf_counter()
+    import lambda_function
+    import_ms = (time.perf_counter() - started) * 1e3
+
+    started = time.perf_counter()
+    lambda_function.startup.warm()
+    deferred_ms = (time.perf_counter() - started) * 1e3
+    print(json.dumps({"import_ms": import_ms, "deferred_ms": deferred_ms, "timings": lambda_function.startup.timings}))
+
+
+def profile_once(skill, eager):
+    """Return the startup timings of the named skill from a new process."""
+    environment = dict(os.environ, STARTUP_PROFILE="1", S3_PERSISTENCE_BUCKET="profile-startup")
+    environment.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    environment.pop("EAGER_INIT", None)
+    if eager:
+        environment["EAGER_INIT"] = "1"
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", skill], env=environment,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, check=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def summarize(runs):
+    """Return the median of each timing over several runs."""
+    items = collections.defaultdict(list)
+    for run in runs:
+        for timing in run["timings"]:
+            items[(timing["phase"], timing["kind"], timing["name"])].append(timing["ms"])
+    return {
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "deferred_ms": statistics.median(run["deferred_ms"] for run in runs),
+        "timings": sorted(({"phase": phase, "kind": kind, "name": name, "ms": statistics.median(times)}
+                           for (phase, kind, name), times in items.items()),
+                          key=lambda timing: timing["ms"], reverse=True),
+    }
+
+
+def print_report(skill, report):
+    """Print a report as a table."""
+    print(f"{skill}: {report['import_ms']:.1f}ms to import lambda_function, "
+          f"{report['deferred_ms']:.1f}ms more for what it deferred")
+    print(f"{'ms':>9}  {'phase':<9}{'kind':<12}name")
+    for timing in report["timings"]:
+        print(f"{timing['ms']:>9.1f}  {timing['phase']:<9}{timing['kind']:<12}{timing['name']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Profile the cold start of a skill's lambda_function.")
+    parser.add_argument("skill", choices=SKILLS, help="skill to profile")
+    parser.add_argument("--repeat", type=int, default=5, help="runs, of which the median is kept")
+    parser.add_argument("--eager", action="store_true", help="create everything at import time (EAGER_INIT)")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("-o", "--output", help="write the report as JSON to this path")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio to the baseline above which the import time counts as a regression")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.skill)
+        return
+
+    report = summarize([profile_once(args.skill, args.eager) for _ in range(max(args.repeat, 1))])
+    report["skill"] = args.skill
+    report["eager"] = args.eager
+    print_report(args.skill, report)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        ratio = report["import_ms"] / baseline["import_ms"]
+        print(f"Import time {baseline['import_ms']:.1f}ms -> {report['import_ms']:.1f}ms ({ratio:.2f}x)")
+        if ratio > args.threshold:
+            print("REGRESSION")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
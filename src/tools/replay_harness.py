@@ -0,0 +1,403 @@
+# Request replay harness and load generator for both skills.
+#
+# Drives a skill's lambda_handler in-process with Alexa request envelopes,
+# either generated from a scripted conversation run by many simulated users
+# at once, or replayed from a file of recorded envelopes.  S3 is replaced by
+# a FakeS3Client on a local directory (see fake_s3), so no network access or
+# AWS credentials are needed, and every S3 call is counted.
+#
+# The report gives the throughput, the p50/p95/p99 latency of each intent
+# and the S3 calls made per turn.  Results can be written as JSON and
+# compared against a stored baseline, to catch latency regressions before
+# a deploy.
+#
+# ## Example Usage:
+#
+# Run the built-in Policy Browser conversation for 50 users, 4 times each
+# > python replay_harness.py PolicyBrowser --users 50 --iterations 4
+#
+# Run the Privacy Manager conversation with 20ms of simulated S3 latency,
+# storing the results as a baseline
+# > python replay_harness.py PrivacyManager --users 20 --s3-latency-ms 20 -o baseline.json
+#
+# Keep the skill's log, to summarize its turn metrics with metrics_summary.py
+# > python replay_harness.py PrivacyManager --users 20 --log turns.log
+#
+# Replay recorded request envelopes (one JSON envelope per line), failing
+# if any intent's p95 latency grew by more than 20%
+# > python replay_harness.py PolicyBrowser --replay requests.jsonl --baseline baseline.json
+#
+# ## Scenario Files:
+#
+# --scenario takes a JSON list of turns, each giving a request type and
+# optionally an intent and its slots.  "{user}", "{other}" and "{next}" in
+# slot values are replaced by the simulated user's name and the names of
+# the users before and after it.
+#
+# > [{"type": "LaunchRequest"},
+# >  {"type": "IntentRequest", "intent": "Login", "slots": {"user_name": "{user}"}}]
+
+import argparse
+import collections
+import concurrent.futures
+import datetime
+import importlib
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+from fake_s3 import FakeS3Client, install
+
+SOURCE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+SKILLS = ("PolicyBrowser", "PrivacyManager")
+DEFAULT_BUCKET = "replay-harness"
+
+# Speech of CatchAllExceptionHandler, which both skills use.
+ERROR_SPEECH = "had trouble doing what you asked"
+
+SCENARIOS = {
+    "PolicyBrowser": [
+        {"type": "LaunchRequest"},
+        {"type": "IntentRequest", "intent": "TableOfContents"},
+        {"type": "IntentRequest", "intent": "StartFromBeginning"},
+        {"type": "IntentRequest", "intent": "Continue"},
+        {"type": "IntentRequest", "intent": "RepeatWhileReading", "slots": {"repeatThis": None}},
+        {"type": "IntentRequest", "intent": "StartFromSection", "slots": {"num": "5"}},
+        {"type": "IntentRequest", "intent": "ReadAbout", "slots": {"topic": "cookies"}},
+        {"type": "IntentRequest", "intent": "GoToSection", "slots": {"sectionName": "security"}},
+        {"type": "IntentRequest", "intent": "readAccepted"},
+        {"type": "IntentRequest", "intent": "ListOptions"},
+        {"type": "IntentRequest", "intent": "AcceptPolicy",
+         "slots": {"userAcceptence": "accept", "acceptNum": "2", "acceptWhat": None}},
+        {"type": "IntentRequest", "intent": "ChoosePolicy", "slots": {"policyName": "sample company"}},
+        {"type": "IntentRequest", "intent": "TableOfContents"},
+        {"type": "SessionEndedRequest"},
+    ],
+    "PrivacyManager": [
+        {"type": "LaunchRequest"},
+        {"type": "IntentRequest", "intent": "CreateNewUser", "slots": {"user_name": "{user}"}},
+        {"type": "IntentRequest", "intent": "Login", "slots": {"user_name": "{user}"}},
+        {"type": "IntentRequest", "intent": "AddRecording", "slots": {"file_name": "sample"}},
+        {"type": "IntentRequest", "intent": "ListFiles"},
+        {"type": "IntentRequest", "intent": "MakeRequest",
+         "slots": {"user_name": "{other}", "request_type": "train", "reason": "research"}},
+        {"type": "IntentRequest", "intent": "ListRequests"},
+        {"type": "IntentRequest", "intent": "AcceptRequest", "slots": {"user_name": "{next}", "file_name": "all files"}},
+        {"type": "IntentRequest", "intent": "ListPreferences"},
+        {"type": "IntentRequest", "intent": "HasAccess", "slots": {"user_name": "{other}"}},
+        {"type": "IntentRequest", "intent": "AllAccess"},
+        {"type": "IntentRequest", "intent": "RevokeAccess",
+         "slots": {"user_name": "{next}", "request_type": None, "reason": None}},
+        {"type": "IntentRequest", "intent": "DenyRequest", "slots": {"user_name": "{next}"}},
+        {"type": "IntentRequest", "intent": "Logout"},
+        {"type": "SessionEndedRequest"},
+    ],
+}
+
+# Objects the scenarios expect to find in the bucket, including the folder
+# markers the S3 console creates.  The Policy Browser bucket holds a copy of
+# the bundled policy, for the scenario to choose.
+with open(os.path.join(SOURCE_DIRECTORY, "PolicyBrowser", "lambda", "policy.xml"), "rb") as policy_file:
+    SAMPLE_POLICY = policy_file.read()
+
+FIXTURES = {
+    "PolicyBrowser": {
+        "Media/policies/sample-company.xml": SAMPLE_POLICY,
+    },
+    "PrivacyManager": {
+        "Media/users/": b"",
+        "Media/sample_recordings/": b"",
+        "Media/sample_recordings/sample.m4a": b"\x00" * 1024,
+        "Media/test.txt": b"This is a test file.",
+    },
+}
+
+
+def load_skill(skill, bucket=DEFAULT_BUCKET):
+    """Import the lambda_function module of the named skill and return it.
+       Modules of a previously loaded skill are unloaded first, since both
+       skills have modules with the same names."""
+    os.environ["S3_PERSISTENCE_BUCKET"] = bucket
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+
+    lambda_directory = os.path.abspath(os.path.join(SOURCE_DIRECTORY, skill, "lambda"))
+    source_directory = os.path.abspath(SOURCE_DIRECTORY)
+    for name, module in list(sys.modules.items()):
+        module_file = getattr(module, "__file__", None) or ""
+        if os.path.abspath(module_file).startswith(source_directory) and "lambda" in module_file.split(os.sep):
+            del sys.modules[name]
+
+    for directory in [path for path in sys.path if os.path.abspath(path).startswith(source_directory)
+                      and os.path.basename(os.path.abspath(path)) == "lambda"]:
+        sys.path.remove(directory)
+    sys.path.insert(0, lambda_directory)
+    return importlib.import_module("lambda_function")
+
+
+def make_envelope(request_type, intent=None, slots=None, user_id="user", session_id=None,
+                  session_attributes=None, new_session=False):
+    """Return an Alexa request envelope dictionary."""
+    request = {
+        "type": request_type,
+        "requestId": "amzn1.echo-api.request." + str(uuid.uuid4()),
+        "timestamp": datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "locale": "en-US",
+    }
+    if intent is not None:
+        request["intent"] = {
+            "name": intent,
+            "confirmationStatus": "NONE",
+            "slots": {name: dict({"name": name, "confirmationStatus": "NONE"},
+                                 **({"value": value} if value is not None else {}))
+                      for name, value in (slots or {}).items()},
+        }
+    if request_type == "SessionEndedRequest":
+        request["reason"] = "USER_INITIATED"
+
+    application = {"applicationId": "amzn1.ask.skill.replay-harness"}
+    user = {"userId": user_id}
+    return {
+        "version": "1.0",
+        "session": {"new": new_session, "sessionId": session_id or "amzn1.echo-api.session." + str(uuid.uuid4()),
+                    "application": application, "attributes": session_attributes or {}, "user": user},
+        "context": {"System": {"application": application, "user": user, "apiEndpoint": "https://api.amazonalexa.com"}},
+        "request": request,
+    }
+
+
+def turn_name(envelope):
+    """Return the intent name of a request envelope, or its request type if
+       it is not an intent request."""
+    request = envelope["request"]
+    return request.get("intent", {}).get("name") or request["type"]
+
+
+class ReplayStats:
+    """Collect the latency and S3 calls of every turn."""
+
+    def __init__(self):
+        """Construct empty statistics."""
+        self.latencies = collections.defaultdict(list)
+        self.s3_calls = collections.defaultdict(collections.Counter)
+        self.errors = collections.Counter()
+        self.turns = 0
+
+    def record(self, name, seconds, s3_calls, error):
+        """Record one turn of the named intent."""
+        self.latencies[name].append(seconds)
+        self.s3_calls[name].update(s3_calls)
+        if error:
+            self.errors[name] += 1
+        self.turns += 1
+
+
+class Harness:
+    """Run request envelopes against a skill with S3 replaced by a local
+       fake."""
+
+    def __init__(self, skill, directory, s3_latency=0.0, bucket=DEFAULT_BUCKET):
+        """Load the named skill with a fake S3 client storing its buckets
+           under the given directory."""
+        self.s3_client = FakeS3Client(directory, s3_latency)
+        self.bucket = bucket
+        self.uninstall = install(self.s3_client)
+        for key, body in FIXTURES.get(skill, {}).items():
+            self.s3_client.put_object(Bucket=bucket, Key=key, Body=body)
+        self.s3_client.calls.clear()
+        self.skill = load_skill(skill, bucket)
+        self.stats = ReplayStats()
+
+    def run_turn(self, envelope):
+        """Run one request envelope and return the response envelope."""
+        calls_before = self.s3_client.thread_calls.copy()
+        started = time.perf_counter()
+        response = self.skill.lambda_handler(envelope, None)
+        elapsed = time.perf_counter() - started
+        calls = self.s3_client.thread_calls - calls_before
+
+        speech = response.get("response", {}).get("outputSpeech") or {}
+        error = ERROR_SPEECH in (speech.get("ssml") or speech.get("text") or "")
+        self.stats.record(turn_name(envelope), elapsed, calls, error)
+        return response
+
+
+class SimulatedUser:
+    """Represent one user talking to the skill, keeping their session."""
+
+    def __init__(self, harness, number, user_count):
+        """Construct the user with the given number out of user_count."""
+        self.__harness = harness
+        self.__names = {"user": f"user{number}", "other": f"user{(number - 1) % user_count}",
+                        "next": f"user{(number + 1) % user_count}"}
+        self.__user_id = f"amzn1.ask.account.replay-harness-{number}"
+        self.__session_id = None
+        self.__session_attributes = {}
+
+    def say(self, turn):
+        """Send the given scenario turn to the skill."""
+        slots = {name: value.format(**self.__names) if isinstance(value, str) else value
+                 for name, value in (turn.get("slots") or {}).items()}
+        new_session = self.__session_id is None
+        if new_session:
+            self.__session_id = "amzn1.echo-api.session." + str(uuid.uuid4())
+
+        envelope = make_envelope(turn["type"], turn.get("intent"), slots, self.__user_id, self.__session_id,
+                                 self.__session_attributes, new_session)
+        response = self.__harness.run_turn(envelope)
+
+        # A response that does not keep the session open ends it, as does a
+        # SessionEndedRequest.
+        ended = response.get("response", {}).get("shouldEndSession", True) is not False
+        if ended or turn["type"] == "SessionEndedRequest":
+            self.__session_id = None
+            self.__session_attributes = {}
+        else:
+            self.__session_attributes = response.get("sessionAttributes") or {}
+
+
+def run_scenario(harness, scenario, users, iterations, threads=1):
+    """Run the scenario for the given number of simulated users.  Users take
+       their turns in rounds, so every user has finished one turn before any
+       user takes the next."""
+    simulated_users = [SimulatedUser(harness, number, users) for number in range(users)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(threads, 1)) as executor:
+        for _ in range(iterations):
+            for turn in scenario:
+                list(executor.map(lambda user: user.say(turn), simulated_users))
+
+
+def run_replay(harness, replay_file):
+    """Replay the request envelopes in the given JSON Lines file, in order,
+       carrying each session's attributes into its next request."""
+    session_attributes = {}
+    with open(replay_file) as file:
+        for line in file:
+            if not line.strip():
+                continue
+            envelope = json.loads(line)
+            session = envelope.get("session")
+            if session is not None and session.get("sessionId") in session_attributes:
+                session["attributes"] = session_attributes[session["sessionId"]]
+            response = harness.run_turn(envelope)
+            if session is not None:
+                session_attributes[session.get("sessionId")] = response.get("sessionAttributes") or {}
+
+
+def percentile(sorted_values, fraction):
+    """Return the nearest-rank percentile of a sorted list."""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+
+def summarize(stats, elapsed):
+    """Return a report dictionary of the collected statistics."""
+    intents = {}
+    total_s3_calls = collections.Counter()
+    for name, latencies in sorted(stats.latencies.items()):
+        latencies = sorted(latencies)
+        calls = stats.s3_calls[name]
+        total_s3_calls.update(calls)
+        intents[name] = {
+            "turns": len(latencies),
+            "errors": stats.errors[name],
+            "p50_ms": percentile(latencies, 0.50) * 1e3,
+            "p95_ms": percentile(latencies, 0.95) * 1e3,
+            "p99_ms": percentile(latencies, 0.99) * 1e3,
+            "max_ms": latencies[-1] * 1e3,
+            "s3_calls_per_turn": sum(calls.values()) / len(latencies),
+            "s3_calls": {operation: count / len(latencies) for operation, count in sorted(calls.items())},
+        }
+
+    return {
+        "turns": stats.turns,
+        "seconds": elapsed,
+        "turns_per_second": stats.turns / elapsed if elapsed else 0,
+        "s3_calls_per_turn": sum(total_s3_calls.values()) / stats.turns if stats.turns else 0,
+        "intents": intents,
+    }
+
+
+def print_report(report):
+    """Print a report as a table."""
+    print(f"{report['turns']} turns in {report['seconds']:.2f}s ({report['turns_per_second']:.1f} turns/s), "
+          f"{report['s3_calls_per_turn']:.2f} S3 calls per turn")
+    print(f"{'intent':<24}{'turns':>7}{'errors':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'S3/turn':>9}  S3 calls")
+    for name, intent in report["intents"].items():
+        calls = ", ".join(f"{operation} {count:.2f}" for operation, count in intent["s3_calls"].items())
+        print(f"{name:<24}{intent['turns']:>7}{intent['errors']:>8}{intent['p50_ms']:>9.2f}{intent['p95_ms']:>9.2f}"
+              f"{intent['p99_ms']:>9.2f}{intent['s3_calls_per_turn']:>9.2f}  {calls}")
+
+
+def compare(report, baseline, threshold):
+    """Print the intents whose p95 latency or S3 calls per turn are worse
+       than threshold times the baseline's, and return how many there are."""
+    regressions = 0
+    for name, intent in report["intents"].items():
+        old_intent = baseline.get("intents", {}).get(name)
+        if old_intent is None:
+            continue
+        for metric in ("p95_ms", "s3_calls_per_turn"):
+            old_value = old_intent[metric]
+            if intent[metric] > old_value * threshold and intent[metric] - old_value > 1e-9:
+                print(f"REGRESSION {name} {metric}: {old_value:.2f} -> {intent[metric]:.2f}")
+                regressions += 1
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay or generate requests against a skill's lambda_handler.")
+    parser.add_argument("skill", choices=SKILLS, help="skill to run")
+    parser.add_argument("--users", type=int, default=10, help="simulated users")
+    parser.add_argument("--iterations", type=int, default=1, help="times each user runs the scenario")
+    parser.add_argument("--threads", type=int, default=1, help="users whose turns run at the same time")
+    parser.add_argument("--scenario", help="JSON file of the turns each user takes")
+    parser.add_argument("--replay", help="JSON Lines file of request envelopes to replay instead")
+    parser.add_argument("--s3-latency-ms", type=float, default=0, help="simulated latency of each S3 call")
+    parser.add_argument("--data", help="directory for the fake S3 buckets (a temporary directory by default)")
+    parser.add_argument("--log", help="write the skill's log, including its turn metrics, to this path")
+    parser.add_argument("-o", "--output", help="write the report as JSON to this path")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=1.2,
+                        help="ratio to the baseline above which a metric counts as a regression")
+    args = parser.parse_args()
+
+    if args.log:
+        logging.basicConfig(filename=args.log, filemode="w", level=logging.INFO,
+                            format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    with tempfile.TemporaryDirectory() as temporary_directory:
+        harness = Harness(args.skill, args.data or temporary_directory, args.s3_latency_ms / 1e3)
+        started = time.perf_counter()
+        try:
+            if args.replay:
+                run_replay(harness, args.replay)
+            else:
+                scenario = SCENARIOS[args.skill]
+                if args.scenario:
+                    with open(args.scenario) as file:
+                        scenario = json.load(file)
+                run_scenario(harness, scenario, args.users, args.iterations, args.threads)
+        finally:
+            harness.uninstall()
+        report = summarize(harness.stats, time.perf_counter() - started)
+
+    report["skill"] = args.skill
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare(report, json.load(file), args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()